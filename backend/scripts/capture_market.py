@@ -0,0 +1,57 @@
+import argparse
+import logging
+import sys
+import os
+# Add the parent directory to sys.path to allow imports from src
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.ocr.capture import BatchUploader, FrameDiff, MarketCapture
+from src.ocr.ocr import REGION_MERCADILLO
+
+def parse_region(value: str):
+    parts = [int(part) for part in value.split(",")]
+    if len(parts) != 4:
+        raise argparse.ArgumentTypeError("Formato: x,y,w,h")
+    return tuple(parts)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Captura continua del mercadillo: envía al backend solo los paneles que cambian")
+    parser.add_argument("--api-url", default="http://localhost:8000/api")
+    parser.add_argument("--server", default="Dakal")
+    parser.add_argument("--region", default=REGION_MERCADILLO, type=parse_region, help="x,y,w,h")
+    parser.add_argument("--fps", default=2.0, type=float)
+    parser.add_argument("--settle-frames", default=1, type=int, help="Capturas sin cambios antes de enviar un panel")
+    parser.add_argument("--pixel-delta", default=24, type=int, help="Diferencia de gris que cuenta como píxel cambiado")
+    parser.add_argument("--min-changed-pixels", default=4, type=int)
+    parser.add_argument("--batch-size", default=10, type=int)
+    parser.add_argument("--flush-seconds", default=5.0, type=float)
+    parser.add_argument("--seconds", default=None, type=float, help="Duración; sin esto, hasta Ctrl+C")
+    return parser.parse_args()
+
+def print_result(result: dict):
+    name = result.get("nombre_objeto", "?")
+    if "error" in result:
+        print(f"❌ {result.get('filename')}: {result['error']}")
+    elif result.get("db_updated"):
+        print(f"✅ {name}: {result.get('precio_promedio')} kamas/u")
+    else:
+        print(f"⚠️ {name}: sin guardar ({result.get('error_search', 'sin precios')})")
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    uploader = BatchUploader(args.api_url, args.server, batch_size=args.batch_size,
+                             flush_seconds=args.flush_seconds, on_result=print_result)
+    capture = MarketCapture(
+        uploader, region=args.region, fps=args.fps, settle_frames=args.settle_frames,
+        diff=FrameDiff(pixel_delta=args.pixel_delta, min_changed_pixels=args.min_changed_pixels)
+    )
+    print(f"🎥 Capturando {args.region} a {args.fps} fps (Ctrl+C para terminar)...")
+    try:
+        capture.run(max_seconds=args.seconds)
+    except KeyboardInterrupt:
+        pass
+    print(f"📊 {capture.snapshot()}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+import argparse
+import asyncio
+import sys
+import os
+from datetime import datetime
+# Add the parent directory to sys.path to allow imports from src
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.services.dataset_export import (
+    ARROW_FORMATS, DATASETS, FORMATS, ExportQuery, arrow_available, export_filename, export_stream
+)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Exporta prediction_dataset o item_coefficient_history por streaming")
+    parser.add_argument("dataset", choices=sorted(DATASETS))
+    parser.add_argument("--format", default="csv.gz", choices=sorted(FORMATS))
+    parser.add_argument("--server", default=None)
+    parser.add_argument("--saved", default=None, choices=["true", "false"], help="Solo predictions")
+    parser.add_argument("--start", default=None, type=datetime.fromisoformat, help="ISO, inclusivo")
+    parser.add_argument("--end", default=None, type=datetime.fromisoformat, help="ISO, exclusivo")
+    parser.add_argument("--batch-rows", default=None, type=int)
+    parser.add_argument("-o", "--output", default=None, help="Archivo de salida (por defecto, nombre con fecha)")
+    return parser.parse_args()
+
+async def main():
+    args = parse_args()
+    if args.format in ARROW_FORMATS and not arrow_available():
+        print(f"❌ El formato '{args.format}' necesita el paquete 'pyarrow' (poetry install --extras export)")
+        sys.exit(1)
+
+    saved = None if args.saved is None else args.saved == "true"
+    export = ExportQuery(args.dataset, server=args.server, saved=saved, start=args.start, end=args.end)
+
+    output = args.output or export_filename(args.dataset, args.format)
+    print(f"📤 Exportando '{args.dataset}' a {output}...")
+    written = 0
+    with open(output, "wb") as f:
+        async for chunk in export_stream(export, args.format, batch_rows=args.batch_rows):
+            f.write(chunk)
+            written += len(chunk)
+    print(f"✅ {written / 1024:.1f} KiB escritos en {output}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,23 @@
+import asyncio
+import sys
+import os
+# Add the parent directory to sys.path to allow imports from src
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.services.catalog import catalog
+from src.services.upstream import upstream
+
+async def main():
+    print(f"📦 Sincronizando catálogo en '{catalog.directory}' ({', '.join(catalog.langs)})...")
+    try:
+        result = await catalog.sync()
+    finally:
+        await upstream.close()
+
+    print(f"✅ Snapshots: {result['snapshots']} en {result['duration_s']}s")
+    if result["failed"]:
+        print(f"⚠️ Fallaron: {', '.join(result['failed'])}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,76 @@
+import argparse
+import asyncio
+import csv
+import gzip
+import sys
+import os
+# Add the parent directory to sys.path to allow imports from src
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from src.services.coefficient_model import CoefficientModel, training_columns
+from src.services.dataset_export import ExportQuery, stream_batches
+from src.settings.config import env_settings
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Entrena el modelo de coeficientes sobre prediction_dataset")
+    parser.add_argument("--input", default=None,
+                        help="Export de scripts/export_dataset.py (.csv.gz o .parquet); sin esto se lee la BD")
+    parser.add_argument("--server", default=None)
+    parser.add_argument("--alpha", default=1.0, type=float, help="Regularización ridge")
+    parser.add_argument("--holdout", default=0.2, type=float, help="Fracción más reciente usada para validar")
+    parser.add_argument("-o", "--output", default=env_settings.coefficient_model_file)
+    return parser.parse_args()
+
+def read_export(path: str):
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        return pq.read_table(path).to_pylist()
+    with gzip.open(path, "rt", encoding="utf-8", newline="") as f:
+        return list(csv.DictReader(f))
+
+async def read_database(server):
+    export = ExportQuery("predictions", server=server)
+    rows = []
+    async for batch in stream_batches(export, env_settings.export_batch_rows):
+        rows.extend(dict(zip(export.names, row)) for row in batch)
+    return rows
+
+def mean_absolute_error(model: CoefficientModel, rows) -> float:
+    columns = training_columns(rows)
+    predicted = model.predict(columns["craft_cost"], columns["value_at_100"], columns["item_level"],
+                              columns["recipe_size"], columns["high_value"], columns["item_type"], columns["server"])
+    return float(np.mean(np.abs(predicted - columns["target"]))) if len(predicted) else float("nan")
+
+async def main():
+    args = parse_args()
+    rows = read_export(args.input) if args.input else await read_database(args.server)
+    if args.input and args.server:
+        rows = [row for row in rows if row.get("server") == args.server]
+    # Validación temporal: se entrena con lo viejo y se mide con lo más nuevo
+    rows.sort(key=lambda row: str(row.get("created_at") or ""))
+    print(f"📊 {len(rows)} filas")
+
+    split = int(len(rows) * (1 - args.holdout))
+    train, test = rows[:split], rows[split:]
+    target = training_columns(test)["target"]
+    if len(target):
+        try:
+            model = CoefficientModel.fit(train, alpha=args.alpha)
+        except ValueError as e:
+            # Pocas filas viejas: se omite la validación y se entrena igual con todo
+            print(f"⚠️ Sin validación: {e}")
+        else:
+            print(f"   MAE modelo: {mean_absolute_error(model, test):.2f}")
+            print(f"   MAE con 100 fijo: {float(np.mean(np.abs(target - 100))):.2f}")
+
+    try:
+        model = CoefficientModel.fit(rows, alpha=args.alpha)
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    model.save(args.output)
+    print(f"✅ Modelo guardado en {args.output} ({model.info['rows']} filas usadas)")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,6 +1,11 @@
+import logging
 from fastapi import APIRouter, HTTPException
-from src.models.schemas import CalculateRequest, CalculateResponse
+from src.models.schemas import CalculateRequest, CalculateResponse, BatchCalculateRequest, BatchCalculateResponse
 from src.services.calculator import calculate_profit
+from src.services.batch_calculator import calculate_profit_batch
+from src.settings.config import env_settings
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(tags=['runes'])
 
@@ -16,5 +21,24 @@ async def calculate_endpoint(request: CalculateRequest):
         return response
     except Exception as e:
         # Manejo básico de errores para no tumbar el servidor
-        print(f"Error en calculo: {e}")
+        logger.exception("calculate_error error=%s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/calculate/batch", response_model=BatchCalculateResponse)
+async def calculate_batch_endpoint(request: BatchCalculateRequest):
+    """
+    Calcula el rompimiento de muchos objetos en una sola llamada.
+    Devuelve un resultado por ítem, en el mismo orden del request.
+    """
+    if len(request.items) > env_settings.batch_calculate_max_items:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Too many items ({len(request.items)}), max is {env_settings.batch_calculate_max_items}"
+        )
+
+    try:
+        results = await calculate_profit_batch(request.items)
+        return BatchCalculateResponse(results=results)
+    except Exception as e:
+        logger.exception("calculate_batch_error items=%d error=%s", len(request.items), e)
         raise HTTPException(status_code=500, detail=str(e))
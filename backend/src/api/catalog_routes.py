@@ -0,0 +1,21 @@
+from fastapi import APIRouter, BackgroundTasks
+from src.services.catalog import catalog
+
+router = APIRouter(tags=['catalog'])
+
+@router.get("/catalog/status")
+def catalog_status():
+    """
+    Snapshot counts per (category, lang) and the time of the last full sync.
+    """
+    return catalog.status()
+
+@router.post("/catalog/sync")
+async def sync_catalog(background_tasks: BackgroundTasks):
+    """
+    Re-downloads every /all listing in the background.
+    """
+    if catalog.status()["syncing"]:
+        return {"status": "already_running"}
+    background_tasks.add_task(catalog.sync)
+    return {"status": "started"}
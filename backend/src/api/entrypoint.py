@@ -1,21 +1,79 @@
-from fastapi import FastAPI
+import asyncio
+import logging
+import time
+import uuid
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from src.api.calculate_routes import router as calculate_routes
 from src.api.items_routes import router as items_routes
 from src.api.prices_routes import router as prices_routes
 from src.api.ocr_routes import router as ocr_routes
 from src.api.status_routes import router as status_routes
+from src.api.catalog_routes import router as catalog_routes
+from src.api.export_routes import router as export_routes
+from src.services.catalog import catalog
+from src.services.scan_executor import scan_executor
+from src.services.ocr_pool import ocr_pool
+from src.services.image_store import rune_image_store
+from src.services.rune_prices import rune_price_snapshots
+from src.services.image_sync import rune_image_sync
+from src.services.price_history import price_history
+from src.services.price_snapshot import price_snapshots
+from src.services.prediction_ingest import prediction_ingest, prediction_debouncer
+from src.services.upstream import upstream
 from src.settings.config import env_settings
+from src.settings.logging_config import (
+    configure_logging, is_debug_trace_requested, request_id_var, request_debug_var, DEBUG_TRACE_HEADER
+)
 import uvicorn
 
+configure_logging(env_settings.log_level)
+logger = logging.getLogger(__name__)
+
 app = FastAPI()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await upstream.start()
+    try:
+        await rune_image_store.warm_from_db()
+    except Exception as e:
+        # Sin BD el caché arranca vacío y se llena en segundo plano
+        logger.warning("image_store_warm_failed error=%s", e)
+    try:
+        await rune_price_snapshots.seed_known_servers()
+    except Exception as e:
+        # Los servidores se siembran igual en su primera lectura
+        logger.warning("rune_rows_seed_failed error=%s", e)
+
+    # Catálogo local: se carga del disco y se refresca en segundo plano
+    await asyncio.to_thread(catalog.load)
+    catalog_task = asyncio.create_task(catalog.refresh_loop()) if env_settings.catalog_sync_on_startup else None
+    compaction_task = asyncio.create_task(price_history.compaction_loop())
+    # Snapshots de precios coherentes entre workers (LISTEN price_changes)
+    price_listener_task = asyncio.create_task(price_snapshots.listen())
+    prediction_ingest.start()
+    yield
+    prediction_debouncer.flush()
+    await prediction_ingest.close()
+    price_listener_task.cancel()
+    compaction_task.cancel()
+    if catalog_task is not None:
+        catalog_task.cancel()
+    await rune_image_sync.close()
+    await rune_image_store.close()
+    scan_executor.close()
+    ocr_pool.close()
+    await upstream.close()
+
 def create_app() -> FastAPI:
     app = FastAPI(
         title="BioBot API",
         description="API para Biobit",
         version="1.0.0",
-        debug=env_settings.debug
+        debug=env_settings.debug,
+        lifespan=lifespan
     )
 
     app.add_middleware(
@@ -26,11 +84,27 @@ def create_app() -> FastAPI:
         allow_headers=["*"],
     )
 
+    @app.middleware("http")
+    async def request_context(request: Request, call_next):
+        # Contexto por petición: id para correlacionar logs y switch de trazas
+        request_id_var.set(request.headers.get("X-Request-ID") or uuid.uuid4().hex[:12])
+        request_debug_var.set(is_debug_trace_requested(request.headers.get(DEBUG_TRACE_HEADER)))
+
+        started = time.perf_counter()
+        response = await call_next(request)
+        logger.info(
+            "request method=%s path=%s status=%s duration_ms=%.1f",
+            request.method, request.url.path, response.status_code, (time.perf_counter() - started) * 1000
+        )
+        return response
+
     app.include_router(calculate_routes, prefix="/api")
     app.include_router(items_routes, prefix="/api")
     app.include_router(prices_routes, prefix="/api")
     app.include_router(ocr_routes, prefix="/api")
     app.include_router(status_routes, prefix="/api")
+    app.include_router(catalog_routes, prefix="/api")
+    app.include_router(export_routes, prefix="/api")
     
     @app.get("/")
     def health_check():
@@ -44,12 +118,11 @@ def create_app() -> FastAPI:
 
 app = create_app()
 
-# Print routes for debugging
 for route in app.routes:
     if hasattr(route, "path"):
-        print(f"Route: {route.path}")
+        logger.debug("route path=%s", route.path)
 
-print(f"CORS Origins configured: {env_settings.cors_origins_list}")
+logger.info("cors_origins origins=%s", env_settings.cors_origins_list)
 
 def main():
     if env_settings.environment == "development":
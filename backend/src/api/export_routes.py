@@ -0,0 +1,60 @@
+from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, Header, HTTPException
+from fastapi.responses import StreamingResponse
+from src.services.dataset_export import (
+    ARROW_FORMATS, DATASETS, FORMATS, ExportQuery, arrow_available, available_formats, export_filename,
+    export_stream, media_type
+)
+from src.settings.config import env_settings, Environment
+
+router = APIRouter(tags=['export'])
+
+EXPORT_TOKEN_HEADER = "X-Export-Token"
+
+def _check_token(token: Optional[str]):
+    if env_settings.export_token:
+        if token != env_settings.export_token:
+            raise HTTPException(status_code=403, detail="Invalid export token")
+    # Sin token configurado, la exportación solo está abierta fuera de producción
+    elif env_settings.environment == Environment.PRODUCTION:
+        raise HTTPException(status_code=403, detail="Export is disabled")
+
+@router.get("/export/formats")
+def export_formats():
+    """Datasets and formats; Parquet and Arrow need pyarrow installed."""
+    return {"datasets": sorted(DATASETS), "formats": available_formats()}
+
+@router.get("/export/{dataset}")
+async def export_dataset(
+    dataset: str,
+    format: str = "csv.gz",
+    server: Optional[str] = None,
+    saved: Optional[bool] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    x_export_token: Optional[str] = Header(None, alias=EXPORT_TOKEN_HEADER),
+):
+    """
+    Streams prediction_dataset ("predictions") or item_coefficient_history
+    ("coefficients") as compressed CSV, Parquet or Arrow IPC, read through
+    a server-side cursor. Filters: server, saved (predictions only) and
+    created_at in [start, end).
+    """
+    _check_token(x_export_token)
+    if dataset not in DATASETS:
+        raise HTTPException(status_code=404, detail=f"Unknown dataset, expected one of {sorted(DATASETS)}")
+    if format not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown format, expected one of {sorted(FORMATS)}")
+    # Falla aquí (400) y no a mitad del stream si falta pyarrow
+    if format in ARROW_FORMATS and not arrow_available():
+        raise HTTPException(status_code=400, detail=f"Format '{format}' requires the 'pyarrow' package")
+
+    export = ExportQuery(dataset, server=server, saved=saved, start=start, end=end)
+
+    filename = export_filename(dataset, format)
+    return StreamingResponse(
+        export_stream(export, format),
+        media_type=media_type(format),
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
@@ -1,20 +1,29 @@
-from typing import List
-from fastapi import APIRouter, HTTPException, Query, Depends
+import logging
+from typing import List, Optional
+from fastapi import APIRouter, HTTPException, Query, Depends, Request, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, desc
 from src.db.database import get_db
 from src.models.schemas import ItemDetailsResponse, ItemSearchResponse, ItemCoefficientRequest
-from src.models.sql_models import ItemCoefficientHistoryModel, PredictionDataset, IngredientPriceModel, RunePriceModel
+from src.models.sql_models import ItemCoefficientHistoryModel
 from src.services.equipment import get_item_details, search_equipment, get_ingredients_by_filter
-from src.services.profit import calculate_profitability
-from src.services.calculator import calculate_profit, get_canonical_stat_name, get_canonical_item_type
-from src.models.schemas import Ingredient, PaginatedProfitResponse, CalculateRequest
+from src.services.profit import calculate_profitability, decode_cursor
+from src.services.opportunities import opportunity_table
+from src.services.price_snapshot import price_snapshots, notify_coefficient_change
+from src.services.prediction_ingest import (
+    prediction_ingest, prediction_debouncer, Submission, QueueFull, previous_from_history
+)
+from src.services.scan_executor import ScanBusy, ScanCancelled
+from src.models.schemas import Ingredient, PaginatedProfitResponse
 from datetime import datetime, timedelta
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(tags=['items'])
 
 @router.get("/items/profit/best", response_model=PaginatedProfitResponse)
 async def get_best_profit_items(
+    request: Request,
     types: str = Query(..., description="Comma separated types"),
     min_level: int = 1,
     max_level: int = 200,
@@ -26,10 +35,31 @@ async def get_best_profit_items(
     sort_order: str = "desc",
     lang: str = "es",
     server: str = "Dakal",
+    cursor: Optional[str] = Query(None, description="next_cursor de la respuesta anterior (ignora page)"),
     db: AsyncSession = Depends(get_db)
 ):
     type_list = types.split(",")
-    return await calculate_profitability(type_list, min_level, max_level, min_profit, min_craft_cost, page, limit, sort_by, sort_order, db, lang, server)
+    if cursor:
+        try:
+            decode_cursor(cursor, sort_by, sort_order)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        if opportunity_table.available:
+            return await opportunity_table.query(
+                server, db, type_list, min_level, max_level, min_profit, min_craft_cost, page, limit, sort_by, sort_order, cursor
+            )
+        # Sin catálogo local: escaneo completo contra dofusdu.de
+        return await calculate_profitability(
+            type_list, min_level, max_level, min_profit, min_craft_cost, page, limit, sort_by, sort_order, db, lang, server, cursor,
+            is_cancelled=request.is_disconnected
+        )
+    except ScanBusy:
+        raise HTTPException(status_code=503, detail="Too many profitability scans running, retry shortly")
+    except ScanCancelled:
+        logger.info("profit_scan_cancelled server=%s reason=client_disconnected", server)
+        return Response(status_code=499)
 
 @router.get("/items/search", response_model=List[ItemSearchResponse])
 async def search_items_endpoint(query: str = Query(..., min_length=2), lang: str = "es"):
@@ -91,14 +121,38 @@ async def get_item_coefficient_history(
         for entry in history
     ]
 
+CLIENT_ID_HEADER = "X-Client-ID"
+
+def _client_key(http_request: Request) -> str:
+    # Sin header propio del frontend, la IP separa a los usuarios (detrás de nginx, la de X-Forwarded-For)
+    client_id = http_request.headers.get(CLIENT_ID_HEADER)
+    if client_id:
+        return client_id
+    forwarded = http_request.headers.get("X-Forwarded-For")
+    if forwarded:
+        return forwarded.split(",")[0].strip()
+    return http_request.client.host if http_request.client else "unknown"
+
+def _submission(ankama_id: int, request: ItemCoefficientRequest, lang: str, server: str, saved: bool,
+                previous=None) -> Submission:
+    return Submission(
+        item_id=ankama_id, server=server, lang=lang, coefficient=request.coefficient, craft_cost=request.craft_cost,
+        rune_value=request.rune_value, profit=request.profit, saved=saved, previous=previous
+    )
+
 @router.post("/items/{ankama_id}/coefficient")
 async def save_item_coefficient(
     ankama_id: int, 
     request: ItemCoefficientRequest, 
+    http_request: Request,
     lang: str = "es",
     server: str = "Dakal",
     db: AsyncSession = Depends(get_db)
 ):
+    """
+    Manual save: writes item_coefficient_history now and queues the
+    PredictionDataset row (saved=True) for the batch consumer.
+    """
     # 0. Get Previous Coefficient (Trend) - BEFORE adding new entry
     # Buscamos el último coeficiente registrado para este ítem y servidor
     prev_entry_query = select(ItemCoefficientHistoryModel).where(
@@ -108,230 +162,49 @@ async def save_item_coefficient(
     
     prev_entry_res = await db.execute(prev_entry_query)
     prev_entry = prev_entry_res.scalar_one_or_none()
-    
-    previous_coefficient_24h = prev_entry.coefficient if prev_entry else None
-    
-    days_since = 0.0
-    if prev_entry:
-        last_time = prev_entry.created_at
-        if last_time.tzinfo:
-            now = datetime.now(last_time.tzinfo)
-        else:
-            now = datetime.now()
-        diff = now - last_time
-        days_since = diff.total_seconds() / 86400.0
-    else:
-        days_since = -1
+
+    submission = _submission(ankama_id, request, lang, server, saved=True)
+    submission.previous = previous_from_history(
+        prev_entry.coefficient if prev_entry else None, prev_entry.created_at if prev_entry else None,
+        submission.received_at
+    )
 
     # 1. Save History
-    new_entry = ItemCoefficientHistoryModel(
+    db.add(ItemCoefficientHistoryModel(
         item_id=ankama_id,
         coefficient=request.coefficient,
         server=server
-    )
-    db.add(new_entry)
-    
-    # 2. Gather Data for PredictionDataset
-    try:
-        # B. Get Item Details
-        item = await get_item_details(ankama_id, lang)
-        if not item:
-            await db.commit()
-            return {"status": "success", "warning": "Item details not found for prediction"}
-
-        # C. Calculate Craft Cost & Profit from request
-        craft_cost = request.craft_cost
-        rune_value_real = request.rune_value
-        profit_amount = request.profit
-        
-        # D. Determine high value runes and dominant rune type
-        has_high_value_rune = False
-        dominant_rune_type = "Generic" # Default value
-        
-        if item.stats:
-            # 1. Detect High Value Runes (Flag only)
-            for stat in item.stats:
-                canonical = get_canonical_stat_name(stat.name, lang)
-                if stat.value > 0 and canonical in {"PA", "PM", "Alcance", "Crítico"}:
-                    has_high_value_rune = True
-
-            # 2. To determine dominant_rune_type, we need to call calculate_profit
-            # This is a bit redundant but necessary if we want to keep this feature
-            # We can optimize later by sending it from the frontend if needed.
-            rune_prices_res = await db.execute(select(RunePriceModel).where(RunePriceModel.server == server))
-            rune_prices = {r.rune_name: r.price for r in rune_prices_res.scalars()}
-
-            calc_req = CalculateRequest(
-                item_level=item.level,
-                stats=item.stats,
-                coefficient=request.coefficient, 
-                item_cost=craft_cost,
-                rune_prices=rune_prices,
-                lang=lang,
-                server=server
-            )
-            
-            calc_res = await calculate_profit(calc_req)
-            
-            if calc_res.net_profit == calc_res.max_focus_profit and calc_res.best_focus_stat:
-                dominant_rune_type = get_canonical_stat_name(calc_res.best_focus_stat, lang)
-            else:
-                dominant_rune_type = "Mixed"
-
-
-        # E. Calculate Features
-        ratio_profit = (rune_value_real / craft_cost) if craft_cost > 0 else 0
-        
-        # G. Create Prediction Entry
-        now_dt = datetime.now()
-        
-        normalized_item_type = get_canonical_item_type(item.type or "Unknown", lang)
-        
-        pred_entry = PredictionDataset(
-            item_id=ankama_id,
-            server=server, # CRÍTICO: Contexto macroeconómico
-            real_coefficient=request.coefficient,
-            craft_cost=craft_cost,
-            rune_value_real=rune_value_real, # NOTE: Storing value at REAL coefficient here
-            ratio_profit=ratio_profit,
-            profit_amount=profit_amount,    # Nuevo: Profit plano
-            item_level=item.level,
-            item_type=normalized_item_type,
-            recipe_difficulty=len(item.recipe) if item.recipe else 0,
-            
-            # Nuevos Features
-            has_high_value_rune=has_high_value_rune,
-            dominant_rune_type=dominant_rune_type,
-            previous_coefficient_24h=previous_coefficient_24h,
-            
-            day_of_week=now_dt.weekday(),
-            hour_of_day=now_dt.hour,
-            days_since_last_update=days_since,
-            saved=True  # Manual save - guardado explícito por el usuario
-        )
-        db.add(pred_entry)
-
-    except Exception as e:
-        print(f"Error creating prediction dataset entry: {e}")
-        pass
-
+    ))
+    # Las tablas de oportunidades de todos los workers toman el coeficiente nuevo
+    await notify_coefficient_change(db, server, ankama_id, request.coefficient)
     await db.commit()
+    price_snapshots.apply_coefficient(server, ankama_id, request.coefficient)
+
+    # 2. PredictionDataset: features y escritura en segundo plano. El guardado
+    # manual reemplaza al valor automático que estuviera esperando
+    prediction_debouncer.discard(_client_key(http_request), ankama_id, server)
+    try:
+        prediction_ingest.submit(submission)
+    except QueueFull:
+        logger.warning("prediction_queue_full item_id=%s server=%s saved=True", ankama_id, server)
+        return {"status": "success", "warning": "Prediction queue full, entry not recorded"}
     return {"status": "success"}
 
 
-@router.post("/items/{ankama_id}/prediction")
+@router.post("/items/{ankama_id}/prediction", status_code=202)
 async def submit_prediction_data(
     ankama_id: int, 
     request: ItemCoefficientRequest, 
+    http_request: Request,
     lang: str = "es",
     server: str = "Dakal",
-    db: AsyncSession = Depends(get_db)
 ):
     """
     Automatic coefficient submission to prediction dataset.
     ONLY adds to PredictionDataset (saved=False), does NOT update item_coefficient_history.
-    Used for aggressive automatic data collection as user types.
+    Used for aggressive automatic data collection as user types: only the
+    last value per (client, item, server) after a quiet window is queued
+    and written (see prediction_debouncer).
     """
-    # 0. Get Previous Coefficient (Trend) - BEFORE adding new entry
-    prev_entry_query = select(ItemCoefficientHistoryModel).where(
-        ItemCoefficientHistoryModel.item_id == ankama_id,
-        ItemCoefficientHistoryModel.server == server
-    ).order_by(desc(ItemCoefficientHistoryModel.created_at)).limit(1)
-    
-    prev_entry_res = await db.execute(prev_entry_query)
-    prev_entry = prev_entry_res.scalar_one_or_none()
-    
-    previous_coefficient_24h = prev_entry.coefficient if prev_entry else None
-    
-    days_since = 0.0
-    if prev_entry:
-        last_time = prev_entry.created_at
-        if last_time.tzinfo:
-            now = datetime.now(last_time.tzinfo)
-        else:
-            now = datetime.now()
-        diff = now - last_time
-        days_since = diff.total_seconds() / 86400.0
-    else:
-        days_since = -1
-
-    # Gather Data for PredictionDataset
-    try:
-        # Get Item Details
-        item = await get_item_details(ankama_id, lang)
-        if not item:
-            await db.commit()
-            return {"status": "success", "warning": "Item details not found for prediction"}
-
-        # Calculate Craft Cost & Profit from request
-        craft_cost = request.craft_cost
-        rune_value_real = request.rune_value
-        profit_amount = request.profit
-        
-        # Determine high value runes and dominant rune type
-        has_high_value_rune = False
-        dominant_rune_type = "Generic"
-        
-        if item.stats:
-            # Detect High Value Runes (Flag only)
-            for stat in item.stats:
-                canonical = get_canonical_stat_name(stat.name, lang)
-                if stat.value > 0 and canonical in {"PA", "PM", "Alcance", "Crítico"}:
-                    has_high_value_rune = True
-
-            # Determine dominant_rune_type
-            rune_prices_res = await db.execute(select(RunePriceModel).where(RunePriceModel.server == server))
-            rune_prices = {r.rune_name: r.price for r in rune_prices_res.scalars()}
-
-            calc_req = CalculateRequest(
-                item_level=item.level,
-                stats=item.stats,
-                coefficient=request.coefficient, 
-                item_cost=craft_cost,
-                rune_prices=rune_prices,
-                lang=lang,
-                server=server
-            )
-            
-            calc_res = await calculate_profit(calc_req)
-            
-            if calc_res.net_profit == calc_res.max_focus_profit and calc_res.best_focus_stat:
-                dominant_rune_type = get_canonical_stat_name(calc_res.best_focus_stat, lang)
-            else:
-                dominant_rune_type = "Mixed"
-
-        # Calculate Features
-        ratio_profit = (rune_value_real / craft_cost) if craft_cost > 0 else 0
-        
-        # Create Prediction Entry (saved=False for automatic submissions)
-        now_dt = datetime.now()
-        
-        normalized_item_type = get_canonical_item_type(item.type or "Unknown", lang)
-        
-        pred_entry = PredictionDataset(
-            item_id=ankama_id,
-            server=server,
-            real_coefficient=request.coefficient,
-            craft_cost=craft_cost,
-            rune_value_real=rune_value_real,
-            ratio_profit=ratio_profit,
-            profit_amount=profit_amount,
-            item_level=item.level,
-            item_type=normalized_item_type,
-            recipe_difficulty=len(item.recipe) if item.recipe else 0,
-            has_high_value_rune=has_high_value_rune,
-            dominant_rune_type=dominant_rune_type,
-            previous_coefficient_24h=previous_coefficient_24h,
-            day_of_week=now_dt.weekday(),
-            hour_of_day=now_dt.hour,
-            days_since_last_update=days_since,
-            saved=False  # Automatic submission - NO manual save
-        )
-        db.add(pred_entry)
-
-    except Exception as e:
-        print(f"Error creating prediction dataset entry: {e}")
-        pass
-
-    await db.commit()
-    return {"status": "success"}
+    prediction_debouncer.submit(_client_key(http_request), _submission(ankama_id, request, lang, server, saved=False))
+    return {"status": "accepted"}
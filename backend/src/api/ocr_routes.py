@@ -1,73 +1,218 @@
+import asyncio
+import io
+import logging
+import os
+import zipfile
+from typing import Dict, List, Optional, Tuple
 from fastapi import APIRouter, HTTPException, UploadFile, File, Depends
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.future import select
-from src.ocr.ocr import get_ocr_data
 from src.services.equipment import search_resource
 from src.db.database import get_db
-from src.models.sql_models import IngredientPriceModel
+from src.services.price_writer import upsert_ingredient_prices
+from src.services.ocr_pool import OcrBusy, OcrTimeout, ocr_pool
+from src.settings.config import env_settings
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(tags=['ocr'])
 
+UNKNOWN_NAME = "Desconocido/No detectado"
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".bmp", ".webp"}
+
+
+def average_unit_price(prices: Dict[str, int]) -> Optional[int]:
+    """Average price per unit over the detected lots ({"x10": 7900, ...})."""
+    unit_prices = []
+    for lot, price in prices.items():
+        try:
+            quantity = int(lot.replace('x', ''))
+            if quantity > 0:
+                unit_prices.append(price / quantity)
+        except ValueError:
+            continue
+    return int(sum(unit_prices) / len(unit_prices)) if unit_prices else None
+
+
+def detected_name(data: dict) -> Optional[str]:
+    item_name = data.get("nombre_objeto")
+    if not item_name or item_name == UNKNOWN_NAME:
+        return None
+    # Clean up name if needed (sometimes OCR leaves trailing chars)
+    return item_name.strip() or None
+
+
 @router.post("/scan")
-async def scan_market(file: UploadFile = File(...), db: AsyncSession = Depends(get_db)):
+async def scan_market(file: UploadFile = File(...), server: str = "Dakal", db: AsyncSession = Depends(get_db)):
     """
     Triggers the OCR process on the uploaded image.
     Returns the detected item name and prices.
     Calculates average unit price and updates the database if item is found.
+
+    OCR runs on the OCR process pool: 429 when its queue is full, 504 when
+    the job takes longer than ocr_timeout_seconds.
     """
+    contents = await file.read()
+    try:
+        data = await ocr_pool.run(contents)
+    except OcrBusy:
+        raise HTTPException(status_code=429, detail="Too many screenshots being processed, retry shortly",
+                            headers={"Retry-After": "2"})
+    except OcrTimeout:
+        logger.warning("ocr_timeout size=%d", len(contents))
+        raise HTTPException(status_code=504, detail="OCR timed out")
+    except Exception as e:
+        logger.exception("ocr_error error=%s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
     try:
-        contents = await file.read()
-        data = get_ocr_data(image_bytes=contents, verbose=False)
         if "error" in data:
             raise HTTPException(status_code=500, detail=data["error"])
-            
+
         # Process prices
         prices = data.get("precios_mercado", {})
         if prices:
-            unit_prices = []
-            for lot, price in prices.items():
-                try:
-                    quantity = int(lot.replace('x', ''))
-                    if quantity > 0:
-                        unit_prices.append(price / quantity)
-                except ValueError:
-                    continue
-            
-            if unit_prices:
-                avg_unit_price = int(sum(unit_prices) / len(unit_prices))
+            avg_unit_price = average_unit_price(prices)
+            if avg_unit_price is not None:
                 data["precio_promedio"] = avg_unit_price
 
                 # Search for item ID and update DB
-                item_name = data.get("nombre_objeto")
-                if item_name and item_name != "Desconocido/No detectado":
-                    # Clean up name if needed (sometimes OCR leaves trailing chars)
-                    clean_name = item_name.strip()
+                clean_name = detected_name(data)
+                if clean_name:
                     item_id = await search_resource(clean_name)
-                    
+
                     if item_id:
                         data["item_id"] = item_id
-                        
+
                         # Update DB
-                        result = await db.execute(select(IngredientPriceModel).where(IngredientPriceModel.item_id == item_id))
-                        ingredient = result.scalar_one_or_none()
-                        
-                        if ingredient:
-                            ingredient.price = avg_unit_price
-                        else:
-                            ingredient = IngredientPriceModel(item_id=item_id, price=avg_unit_price)
-                            db.add(ingredient)
-                        
-                        await db.commit()
+                        await upsert_ingredient_prices(db, server, {item_id: (avg_unit_price, None)})
                         data["db_updated"] = True
-                        print(f"✅ [OCR] Base de datos actualizada: {clean_name} (ID: {item_id}) -> {avg_unit_price} kamas")
+                        logger.info("ocr_price_saved name=%r item_id=%s price=%s", clean_name, item_id, avg_unit_price)
                     else:
                         data["db_updated"] = False
                         data["error_search"] = "Item not found in API"
-                        print(f"❌ [OCR] No se pudo actualizar BD: Item '{clean_name}' no encontrado en API")
+                        logger.warning("ocr_item_not_found name=%r", clean_name)
                 else:
-                     print("❌ [OCR] No se detectó nombre válido para actualizar BD")
-        
+                     logger.warning("ocr_name_not_detected")
+
         return data
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"❌ [OCR] Error interno: {e}")
+        logger.exception("ocr_error error=%s", e)
         raise HTTPException(status_code=500, detail=str(e))
+
+
+def _is_zip(filename: Optional[str], contents: bytes) -> bool:
+    return (filename or "").lower().endswith(".zip") or contents[:4] == b"PK\x03\x04"
+
+
+def _expand_zip(filename: str, contents: bytes, budget: int) -> List[Tuple[str, bytes]]:
+    """Image entries of a zip, in archive order, without extracting more than budget bytes."""
+    images = []
+    with zipfile.ZipFile(io.BytesIO(contents)) as archive:
+        for info in archive.infolist():
+            name = info.filename
+            if info.is_dir() or name.startswith("__MACOSX/") or os.path.splitext(name)[1].lower() not in IMAGE_EXTENSIONS:
+                continue
+            # file_size es lo declarado; se vuelve a comprobar con lo leído
+            if info.file_size > budget:
+                raise ValueError("Batch exceeds ocr_batch_max_bytes")
+            data = archive.read(info)
+            budget -= len(data)
+            if budget < 0:
+                raise ValueError("Batch exceeds ocr_batch_max_bytes")
+            images.append((f"{filename}/{name}", data))
+    return images
+
+
+async def _collect_images(files: List[UploadFile]) -> List[Tuple[str, bytes]]:
+    max_bytes, max_images = env_settings.ocr_batch_max_bytes, env_settings.ocr_batch_max_images
+    images: List[Tuple[str, bytes]] = []
+    total = 0
+    for upload in files:
+        contents = await upload.read()
+        filename = upload.filename or f"image_{len(images)}"
+        if _is_zip(upload.filename, contents):
+            try:
+                expanded = await asyncio.to_thread(_expand_zip, filename, contents, max_bytes - total)
+            except zipfile.BadZipFile:
+                raise HTTPException(status_code=400, detail=f"'{filename}' is not a valid zip archive")
+            except ValueError as e:
+                raise HTTPException(status_code=413, detail=str(e))
+        else:
+            expanded = [(filename, contents)]
+
+        images.extend(expanded)
+        total += sum(len(data) for _, data in expanded)
+        if total > max_bytes:
+            raise HTTPException(status_code=413, detail="Batch exceeds ocr_batch_max_bytes")
+        if len(images) > max_images:
+            raise HTTPException(status_code=413, detail=f"At most {max_images} images per batch")
+    return images
+
+
+@router.post("/scan/batch")
+async def scan_market_batch(files: List[UploadFile] = File(...), server: str = "Dakal",
+                            db: AsyncSession = Depends(get_db)):
+    """
+    OCR of many market screenshots in one request: several image files, zip
+    archives of them, or both. Images are processed in parallel on the OCR
+    pool and every detected name is resolved once. All prices go in a single
+    bulk upsert; when several screenshots show the same item, the last one
+    in upload order wins.
+
+    Returns one result per image (same fields as /scan, plus filename) and
+    the number of prices written.
+    """
+    images = await _collect_images(files)
+    if not images:
+        raise HTTPException(status_code=400, detail="No images in the upload")
+
+    try:
+        outputs = await ocr_pool.run_many([data for _, data in images])
+    except OcrBusy:
+        raise HTTPException(status_code=429, detail="Too many screenshots being processed, retry shortly",
+                            headers={"Retry-After": "2"})
+
+    results = []
+    for (filename, _), output in zip(images, outputs):
+        if isinstance(output, OcrTimeout):
+            result = {"error": "OCR timed out"}
+        elif isinstance(output, Exception):
+            logger.warning("ocr_batch_image_failed filename=%r error=%s", filename, output)
+            result = {"error": str(output) or type(output).__name__}
+        else:
+            result = dict(output)
+            prices = result.get("precios_mercado", {})
+            avg_unit_price = average_unit_price(prices) if prices and "error" not in result else None
+            if avg_unit_price is not None:
+                result["precio_promedio"] = avg_unit_price
+        result["filename"] = filename
+        results.append(result)
+
+    # Un lookup por nombre distinto (el catálogo local responde sin red)
+    name_list = sorted({detected_name(result) for result in results if "precio_promedio" in result} - {None})
+    item_ids = dict(zip(name_list, await asyncio.gather(*(search_resource(name) for name in name_list))))
+
+    to_write: Dict[int, Tuple[int, Optional[str]]] = {}
+    for result in results:
+        if "precio_promedio" not in result:
+            continue
+        name = detected_name(result)
+        item_id = item_ids.get(name) if name else None
+        if item_id:
+            result["item_id"] = item_id
+            to_write[item_id] = (result["precio_promedio"], None)
+        elif name:
+            result["db_updated"] = False
+            result["error_search"] = "Item not found in API"
+
+    written, version = {}, None
+    if to_write:
+        written, version = await upsert_ingredient_prices(db, server, to_write)
+    for result in results:
+        if "item_id" in result:
+            result["db_updated"] = True
+
+    logger.info("ocr_batch images=%d prices=%d changed=%d", len(images), len(to_write), len(written))
+    return {"results": results, "saved": len(to_write), "changed": len(written), "version": version}
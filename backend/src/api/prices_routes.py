@@ -1,19 +1,29 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+import logging
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.future import select
+from sqlalchemy import delete
 from typing import Dict, List, Optional
 from pydantic import BaseModel
 
 from src.db.database import get_db
-from src.models.sql_models import RunePriceModel, IngredientPriceModel
-from src.services.calculator import RUNE_DB, buscar_y_obtener_imagen, get_rune_name_translation, get_canonical_rune_name
+from src.models.sql_models import RunePriceModel
+from src.services.calculator import LOCALIZATION, get_canonical_rune_name, is_real_rune
+from src.services.image_sync import rune_image_sync
+from src.services.price_snapshot import price_snapshots
+from src.services.price_writer import upsert_rune_prices, upsert_ingredient_prices, seed_rune_rows
+from src.services.rune_prices import rune_price_snapshots
+from src.services.price_history import price_history, RUNE, INGREDIENT, RAW, HOUR, DAY
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(tags=['prices'])
 
+HISTORY_RESOLUTIONS = {"auto", RAW, HOUR, DAY}
+
 class RunePriceUpdate(BaseModel):
     prices: Dict[str, int]
 
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 
 class RunePriceResponse(BaseModel):
     price: int
@@ -30,150 +40,108 @@ class IngredientPriceUpdate(BaseModel):
     name: str = None
 
 @router.get("/prices/runes", response_model=Dict[str, RunePriceResponse])
-async def get_rune_prices(lang: str = "es", server: str = "Dakal", db: AsyncSession = Depends(get_db)):
-    # Ensure all valid runes exist for this server, initializing to 0 if not
-    valid_rune_names_es = {
-        data["name"]["es"]
-        for stat_data in RUNE_DB.values()
-        for data in stat_data
-    }
-    
-    added_any = False
-    for rune_name in valid_rune_names_es:
-        result = await db.execute(select(RunePriceModel).where(RunePriceModel.rune_name == rune_name, RunePriceModel.server == server))
-        rune = result.scalar_one_or_none()
-        if not rune:
-            rune = RunePriceModel(rune_name=rune_name, price=0, server=server)
-            db.add(rune)
-            added_any = True
-    
-    if added_any:
-        await db.commit()
-    
-    # Now fetch all runes for this server
-    result = await db.execute(select(RunePriceModel).where(RunePriceModel.server == server))
-    runes = result.scalars().all()
-    
-    # Build image dict from current server
-    image_dict = {rune.rune_name: rune.image_url for rune in runes if rune.image_url}
-    
-    # For runes without images, get images from other servers
-    missing_runes = [rune.rune_name for rune in runes if not rune.image_url]
-    if missing_runes:
-        result_all = await db.execute(
-            select(RunePriceModel).where(
-                RunePriceModel.rune_name.in_(missing_runes),
-                RunePriceModel.image_url.isnot(None)
-            )
-        )
-        all_runes = result_all.scalars().all()
-        for rune in all_runes:
-            if rune.rune_name not in image_dict:
-                image_dict[rune.rune_name] = rune.image_url
-    
-    return {
-        get_rune_name_translation(rune.rune_name, lang): RunePriceResponse(
-            price=rune.price, 
-            image_url=rune.image_url or image_dict.get(rune.rune_name),
-            updated_at=rune.updated_at
-        ) 
-        for rune in runes
-    }
-
-async def fetch_rune_images_task(db: AsyncSession):
-    # This needs a new session if running in background, but for now let's try to use the one provided or create new one
-    # Actually background tasks run after response, so dependency injection might be tricky if session is closed.
-    # Better to just run it in the endpoint for now or use a proper background task setup with session factory.
-    pass
+async def get_rune_prices(request: Request, response: Response, lang: str = "es", server: str = "Dakal", db: AsyncSession = Depends(get_db)):
+    snapshot = await rune_price_snapshots.get(db, server)
+    etag = snapshot.etag_for(lang)
+    # no-cache: el navegador revalida siempre, y un sondeo sin cambios es un 304 sin BD
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
 
+    response.headers.update(headers)
+    return snapshot.payload(lang)
 
 @router.post("/prices/runes/sync-images")
-async def sync_rune_images(background_tasks: BackgroundTasks, server: str = "Dakal", db: AsyncSession = Depends(get_db)):
-    # --- NEW: Get all valid Spanish rune names from RUNE_DB ---
-    valid_rune_names_es = {
-        data["name"]["es"]
-        for stat_data in RUNE_DB.values()
-        for data in stat_data
-    }
-
-    # --- 1. Delete invalid entries from the database ---
-    result = await db.execute(select(RunePriceModel).where(RunePriceModel.server == server))
-    all_runes_in_db = result.scalars().all()
-    deleted_count = 0
-    for rune in all_runes_in_db:
-        if rune.rune_name not in valid_rune_names_es:
-            await db.delete(rune)
-            deleted_count += 1
-            print(f"🗑️ Eliminando entrada inválida: {rune.rune_name}")
-    
-    if deleted_count > 0:
-        await db.commit() # Commit deletions
-
-    # --- 2. Ensure all valid runes exist and sync images ---
-    updated_count = 0
-    for rune_name in valid_rune_names_es:
-        result = await db.execute(select(RunePriceModel).where(RunePriceModel.rune_name == rune_name, RunePriceModel.server == server))
-        rune = result.scalar_one_or_none()
-        
-        if not rune:
-            rune = RunePriceModel(rune_name=rune_name, price=0, server=server)
-            db.add(rune)
-        
-        # We will now always re-fetch the image to ensure it is correct
-        url = await buscar_y_obtener_imagen(rune_name, lang="es") # Search in Spanish for consistency
-        if url and rune.image_url != url:
-            rune.image_url = url
-            updated_count += 1
-                
+async def sync_rune_images(resume: bool = True, server: str = "Dakal", db: AsyncSession = Depends(get_db)):
+    """
+    Removes rows of the server that are not real runes, seeds the missing
+    ones, and starts the image job in the background (one fetch per rune,
+    written to every server). Progress: GET /prices/runes/sync-images/status.
+    """
+    result = await db.execute(
+        delete(RunePriceModel)
+        .where(RunePriceModel.server == server, RunePriceModel.rune_name.notin_(LOCALIZATION.rune_names_es))
+        .returning(RunePriceModel.rune_name)
+    )
+    deleted = result.scalars().all()
     await db.commit()
-        
-    return {"status": "ok", "updated": updated_count, "deleted": deleted_count}
+    for rune_name in deleted:
+        logger.info("rune_price_deleted rune=%r server=%s reason=invalid", rune_name, server)
+
+    await seed_rune_rows(db, server, LOCALIZATION.rune_names_es)
+    rune_price_snapshots.invalidate(server)
+
+    job = await rune_image_sync.start(resume=resume)
+    return {**job, "deleted": len(deleted)}
+
+
+@router.get("/prices/runes/sync-images/status")
+async def sync_rune_images_status():
+    return await rune_image_sync.status()
 
 
 @router.post("/prices/runes")
 async def update_rune_prices(update: RunePriceUpdate, lang: str = "es", server: str = "Dakal", db: AsyncSession = Depends(get_db)):
+    prices = {}
     for name, price in update.prices.items():
         canonical_name = get_canonical_rune_name(name, lang)
-        
-        # --- NEW: Validate that it is a real rune ---
-        is_real_rune = any(
-            data.get("name", {}).get("es") == canonical_name
-            for stat_data in RUNE_DB.values()
-            for data in stat_data
-        )
-        
-        if not is_real_rune:
-            print(f"⚠️ Ignorando '{name}' (canónico: '{canonical_name}') porque no es una runa válida.")
+        if not is_real_rune(canonical_name):
+            logger.warning("rune_price_ignored name=%r canonical=%r reason=not_a_rune", name, canonical_name)
             continue # Skip if it's not a real rune
-
-        result = await db.execute(select(RunePriceModel).where(RunePriceModel.rune_name == canonical_name, RunePriceModel.server == server))
-        rune = result.scalar_one_or_none()
-        if rune:
-            rune.price = price
-        else:
-            rune = RunePriceModel(rune_name=canonical_name, price=price, server=server)
-            db.add(rune)
-            
-    await db.commit()
-    return {"status": "ok"}
+        prices[canonical_name] = price
+
+    changed, version = await upsert_rune_prices(db, server, prices)
+    return {"status": "ok", "changed": len(changed), "version": version}
+
+def _history_range(start: Optional[datetime], end: Optional[datetime], resolution: str):
+    end = end or datetime.now(timezone.utc)
+    start = start or end - timedelta(days=7)
+    # Sin zona horaria se asume UTC
+    if start.tzinfo is None:
+        start = start.replace(tzinfo=timezone.utc)
+    if end.tzinfo is None:
+        end = end.replace(tzinfo=timezone.utc)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    if resolution not in HISTORY_RESOLUTIONS:
+        raise HTTPException(status_code=400, detail=f"resolution must be one of {sorted(HISTORY_RESOLUTIONS)}")
+    return start, end, None if resolution == "auto" else resolution
+
+async def _history_response(db: AsyncSession, kind: str, key: str, server: str, start: Optional[datetime],
+                            end: Optional[datetime], resolution: str):
+    start, end, resolution = _history_range(start, end, resolution)
+    resolution, points = await price_history.query(db, kind, key, server, start, end, resolution)
+    return {"resolution": resolution, "start": start, "end": end, "points": points}
+
+@router.get("/prices/runes/{rune_name}/history")
+async def get_rune_price_history(rune_name: str, lang: str = "es", server: str = "Dakal", start: Optional[datetime] = None,
+                                 end: Optional[datetime] = None, resolution: str = "auto", db: AsyncSession = Depends(get_db)):
+    """
+    Price points (raw) or OHLC buckets (hour/day) of a rune. With
+    resolution=auto the coarsest one that fits the range is used.
+    """
+    canonical_name = get_canonical_rune_name(rune_name, lang)
+    if not is_real_rune(canonical_name):
+        raise HTTPException(status_code=404, detail="Rune not found")
+    return await _history_response(db, RUNE, canonical_name, server, start, end, resolution)
+
+@router.get("/prices/ingredients/{item_id}/history")
+async def get_ingredient_price_history(item_id: int, server: str = "Dakal", start: Optional[datetime] = None,
+                                       end: Optional[datetime] = None, resolution: str = "auto", db: AsyncSession = Depends(get_db)):
+    return await _history_response(db, INGREDIENT, str(item_id), server, start, end, resolution)
 
 @router.get("/prices/ingredients", response_model=Dict[int, IngredientPriceResponse])
 async def get_ingredient_prices(server: str = "Dakal", db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(IngredientPriceModel).where(IngredientPriceModel.server == server))
-    ingredients = result.scalars().all()
-    return {ing.item_id: IngredientPriceResponse(price=ing.price, updated_at=ing.updated_at) for ing in ingredients}
+    # Del snapshot versionado: sin consulta mientras no cambien los precios del servidor
+    snapshot = await price_snapshots.get(db, server)
+    return {
+        item_id: IngredientPriceResponse(price=price, updated_at=snapshot.ing_updated.get(item_id))
+        for item_id, price in snapshot.ing_prices.items()
+    }
 
 @router.post("/prices/ingredients")
 async def update_ingredient_prices(updates: List[IngredientPriceUpdate], server: str = "Dakal", db: AsyncSession = Depends(get_db)):
-    for update in updates:
-        result = await db.execute(select(IngredientPriceModel).where(IngredientPriceModel.item_id == update.item_id, IngredientPriceModel.server == server))
-        ing = result.scalar_one_or_none()
-        if ing:
-            ing.price = update.price
-            if update.name:
-                ing.name = update.name
-        else:
-            ing = IngredientPriceModel(item_id=update.item_id, price=update.price, name=update.name, server=server)
-            db.add(ing)
-    await db.commit()
-    return {"status": "ok"}
+    # Si un item_id viene repetido gana la última fila, como con el bucle anterior
+    prices = {update.item_id: (update.price, update.name or None) for update in updates}
+    changed, version = await upsert_ingredient_prices(db, server, prices)
+    return {"status": "ok", "changed": len(changed), "version": version}
@@ -3,6 +3,13 @@ from fastapi import APIRouter, Response
 import json
 from typing import Dict
 from pydantic import BaseModel
+from src.services.upstream import upstream
+from src.services.scan_executor import scan_executor
+from src.services.price_snapshot import price_snapshots
+from src.services.prediction_ingest import prediction_ingest, prediction_debouncer
+from src.services.coefficient_model import coefficient_predictor
+from src.services.ocr_pool import ocr_pool
+from src.services.ocr_cache import ocr_cache
 
 # Nuevo modelo que soporta múltiples idiomas
 class MaintenanceStatus(BaseModel):
@@ -17,6 +24,53 @@ STATUS_FILE = "/app/config/status.json"
 def health_check():
     return {"status": "ok"}
 
+@router.get("/status/upstream")
+def upstream_status():
+    """
+    Scheduler state (concurrency limit, queues, pause) and latency counters
+    per dofusdu.de endpoint since the process started.
+    """
+    return upstream.snapshot()
+
+@router.get("/status/scans")
+def scans_status():
+    """
+    Profitability scan pool: running scans, rejections and cancellations.
+    """
+    return scan_executor.snapshot()
+
+@router.get("/status/prices")
+def prices_status():
+    """
+    Price snapshot cache: LISTEN connection state, cached version per
+    server, reloads and notifications received.
+    """
+    return price_snapshots.snapshot()
+
+@router.get("/status/predictions")
+def predictions_status():
+    """
+    Prediction ingestion: debouncer (collapsed vs emitted automatic
+    submissions) and queue (backlog, rows written in batches).
+    """
+    return {"debounce": prediction_debouncer.snapshot(), "queue": prediction_ingest.snapshot()}
+
+@router.get("/status/coefficient-model")
+def coefficient_model_status():
+    """
+    Coefficient model used for items with no coefficient history: loaded
+    file, training info and predictions served.
+    """
+    return coefficient_predictor.snapshot()
+
+@router.get("/status/ocr")
+def ocr_status():
+    """
+    OCR process pool (running and queued jobs, rejections (429), timeouts,
+    queue wait / run / total latency) and the screenshot result cache.
+    """
+    return {"pool": ocr_pool.snapshot(), "cache": ocr_cache.snapshot()}
+
 @router.get("/maintenance", response_model=MaintenanceStatus)
 async def get_maintenance_status(response: Response):
     response.headers["Cache-Control"] = "public, max-age=30"
@@ -1,7 +1,7 @@
 import asyncio
 from db.database import engine, Base
 # Import models so they are registered with Base
-from models.sql_models import RunePriceModel, IngredientPriceModel, ItemCoefficientHistoryModel
+from models.sql_models import RunePriceModel, IngredientPriceModel, ItemCoefficientHistoryModel, PriceSetVersionModel, RunePriceHistoryModel, IngredientPriceHistoryModel, PriceRollupModel
 
 async def init_models():
     async with engine.begin() as conn:
@@ -65,6 +65,8 @@ class ProfitItem(BaseModel):
     estimated_rune_value: float
     value_at_100: float
     last_coefficient: Optional[float] = None
+    # True cuando last_coefficient viene del modelo (el ítem no tiene historial)
+    coefficient_predicted: bool = False
 
 class ItemCoefficientRequest(BaseModel):
     coefficient: float
@@ -86,4 +88,11 @@ class PaginatedProfitResponse(BaseModel):
     total: int
     page: int
     size: int
-    total_pages: int
\ No newline at end of file
+    total_pages: int
+    next_cursor: Optional[str] = None  # Keyset: pasar como ?cursor= para la página siguiente
+
+class BatchCalculateRequest(BaseModel):
+    items: List[CalculateRequest]
+
+class BatchCalculateResponse(BaseModel):
+    results: List[CalculateResponse]
@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, Integer, String, Float, DateTime
+from sqlalchemy import Boolean, Column, Integer, String, Float, DateTime, Index
 from sqlalchemy.sql import func
 from src.db.database import Base
 
@@ -20,6 +20,52 @@ class IngredientPriceModel(Base):
     price = Column(Integer, default=0)
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
+class PriceSetVersionModel(Base):
+    __tablename__ = "price_set_versions"
+
+    # Se incrementa en la misma transacción que cualquier cambio de precios del servidor
+    server = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class RunePriceHistoryModel(Base):
+    __tablename__ = "rune_price_history"
+
+    # Solo se agrega: un punto por cada cambio de precio. Lo viejo se compacta en price_rollups
+    id = Column(Integer, primary_key=True)
+    rune_name = Column(String, nullable=False)
+    server = Column(String, nullable=False)
+    price = Column(Integer, nullable=False)
+    recorded_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    __table_args__ = (Index("ix_rune_price_history_series", "server", "rune_name", "recorded_at"),)
+
+class IngredientPriceHistoryModel(Base):
+    __tablename__ = "ingredient_price_history"
+
+    id = Column(Integer, primary_key=True)
+    item_id = Column(Integer, nullable=False)
+    server = Column(String, nullable=False)
+    price = Column(Integer, nullable=False)
+    recorded_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    __table_args__ = (Index("ix_ingredient_price_history_series", "server", "item_id", "recorded_at"),)
+
+class PriceRollupModel(Base):
+    __tablename__ = "price_rollups"
+
+    # OHLC por hora o por día de una serie: kind "rune" (key = nombre) o "ingredient" (key = item_id)
+    kind = Column(String, primary_key=True)
+    key = Column(String, primary_key=True)
+    server = Column(String, primary_key=True)
+    resolution = Column(String, primary_key=True)  # "hour" | "day"
+    bucket_start = Column(DateTime(timezone=True), primary_key=True)
+    open = Column(Integer, nullable=False)
+    high = Column(Integer, nullable=False)
+    low = Column(Integer, nullable=False)
+    close = Column(Integer, nullable=False)
+    count = Column(Integer, nullable=False)
+
 class ItemCoefficientHistoryModel(Base):
     __tablename__ = "item_coefficient_history"
 
@@ -0,0 +1,212 @@
+import logging
+import queue
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+import cv2
+import httpx
+import numpy as np
+from src.ocr.ocr import REGION_MERCADILLO, capturar_region
+
+logger = logging.getLogger(__name__)
+
+
+class FrameDiff:
+    """
+    Cheap change detector: each frame is reduced to a downscaled grayscale
+    thumbnail and compared with the previous one. A frame counts as changed
+    when at least min_changed_pixels thumbnail pixels moved by more than
+    pixel_delta, so a single price digit is enough but capture noise is not.
+    """
+
+    def __init__(self, scale: float = 0.5, pixel_delta: int = 24, min_changed_pixels: int = 4):
+        self.scale = scale
+        self.pixel_delta = pixel_delta
+        self.min_changed_pixels = min_changed_pixels
+
+    def thumbnail(self, img: np.ndarray) -> np.ndarray:
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        return cv2.resize(gray, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+
+    def changed(self, previous: Optional[np.ndarray], current: np.ndarray) -> bool:
+        if previous is None or previous.shape != current.shape:
+            return True
+        return np.count_nonzero(cv2.absdiff(previous, current) > self.pixel_delta) >= self.min_changed_pixels
+
+
+class BatchUploader:
+    """
+    Sends captured panels to POST /api/scan/batch from a background thread,
+    so sampling never waits on the network. A batch leaves when it has
+    batch_size frames or its first frame is flush_seconds old. When the
+    backend falls behind, the oldest waiting frames are dropped.
+    """
+
+    def __init__(self, api_url: str, server: str, batch_size: int = 10, flush_seconds: float = 5.0,
+                 max_pending: int = 100, on_result: Optional[Callable[[dict], None]] = None):
+        self.url = f"{api_url.rstrip('/')}/scan/batch"
+        self.server = server
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.on_result = on_result
+        self._frames: "queue.Queue[Optional[Tuple[str, bytes]]]" = queue.Queue(maxsize=max_pending)
+        self._thread = threading.Thread(target=self._run, name="capture-uploader", daemon=True)
+        self.sent = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def start(self):
+        self._thread.start()
+
+    def put(self, filename: str, png: bytes):
+        self._offer((filename, png))
+
+    def close(self, timeout: float = 30.0):
+        """Sends what is left and stops the thread, waiting at most timeout seconds."""
+        # Sin bloquear aunque la cola esté llena: se descarta lo más viejo
+        self._offer(None)
+        self._thread.join(timeout)
+
+    def _offer(self, item: Optional[Tuple[str, bytes]]):
+        while True:
+            try:
+                self._frames.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    self._frames.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def _run(self):
+        with httpx.Client(timeout=60.0) as client:
+            batch: List[Tuple[str, bytes]] = []
+            deadline = None
+            closing = False
+            while not closing:
+                try:
+                    frame = self._frames.get(timeout=max(deadline - time.monotonic(), 0) if batch else None)
+                    if frame is None:
+                        closing = True
+                    else:
+                        batch.append(frame)
+                        deadline = deadline or time.monotonic() + self.flush_seconds
+                except queue.Empty:
+                    pass
+
+                if batch and (closing or len(batch) >= self.batch_size or time.monotonic() >= deadline):
+                    self._send(client, batch)
+                    batch, deadline = [], None
+
+    def _send(self, client: httpx.Client, batch: List[Tuple[str, bytes]]):
+        files = [("files", (filename, png, "image/png")) for filename, png in batch]
+        try:
+            response = client.post(self.url, params={"server": self.server}, files=files)
+            if response.status_code == 429:
+                # El pool OCR está lleno: se reintenta una vez tras Retry-After
+                time.sleep(_retry_after(response))
+                response = client.post(self.url, params={"server": self.server}, files=files)
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            self.failed += len(batch)
+            logger.warning("capture_upload_failed frames=%d error=%s", len(batch), e)
+            return
+
+        self.sent += len(batch)
+        try:
+            body = response.json()
+        except ValueError as e:
+            logger.warning("capture_upload_bad_response frames=%d error=%s", len(batch), e)
+            return
+        logger.info("capture_uploaded frames=%d saved=%s changed=%s", len(batch), body.get("saved"), body.get("changed"))
+        if self.on_result is not None:
+            for result in body.get("results", []):
+                # Un callback que falla no debe matar el hilo de envío
+                try:
+                    self.on_result(result)
+                except Exception:
+                    logger.exception("capture_on_result_failed filename=%s", result.get("filename"))
+
+
+def _retry_after(response: httpx.Response, default: float = 2.0) -> float:
+    try:
+        return max(float(response.headers.get("Retry-After", default)), 0.0)
+    except ValueError:
+        return default
+
+
+class MarketCapture:
+    """
+    Continuous capture of the market panel (REGION_MERCADILLO by default).
+
+    The region is sampled at `fps`; consecutive frames are compared with
+    FrameDiff and nothing else happens while the panel stays the same.
+    After a change, the frame is sent once the panel has been still for
+    settle_frames samples (so scrolling or hover animations are not sent
+    half-drawn), and only if it differs from the last frame sent. OCR and
+    the price write happen in the backend, in batches (BatchUploader).
+    """
+
+    def __init__(self, uploader: BatchUploader, region=REGION_MERCADILLO, fps: float = 2.0,
+                 diff: Optional[FrameDiff] = None, settle_frames: int = 1,
+                 grab: Callable[..., np.ndarray] = capturar_region):
+        self.uploader = uploader
+        self.region = region
+        self.interval = 1.0 / fps
+        self.diff = diff or FrameDiff()
+        self.settle_frames = settle_frames
+        self.grab = grab
+        self.frames = 0
+        self.changes = 0
+        self.queued = 0
+
+    def run(self, max_seconds: Optional[float] = None):
+        self.uploader.start()
+        previous: Optional[np.ndarray] = None
+        last_sent: Optional[np.ndarray] = None
+        still = 0
+        pending = False
+        started = time.monotonic()
+        next_tick = started
+        try:
+            while max_seconds is None or time.monotonic() - started < max_seconds:
+                img = self.grab(self.region)
+                thumb = self.diff.thumbnail(img)
+                self.frames += 1
+
+                if self.diff.changed(previous, thumb):
+                    self.changes += 1
+                    pending, still = True, 0
+                else:
+                    still += 1
+                previous = thumb
+
+                if pending and still >= self.settle_frames:
+                    pending = False
+                    if self.diff.changed(last_sent, thumb):
+                        self._queue(img)
+                        last_sent = thumb
+
+                # Frecuencia fija: si una captura tardó de más, no se acumulan atrasos
+                next_tick = max(next_tick + self.interval, time.monotonic())
+                time.sleep(max(next_tick - time.monotonic(), 0))
+        finally:
+            self.uploader.close()
+
+    def _queue(self, img: np.ndarray):
+        ok, png = cv2.imencode(".png", img)
+        if not ok:
+            return
+        self.queued += 1
+        self.uploader.put(f"capture_{int(time.time() * 1000)}.png", png.tobytes())
+
+    def snapshot(self) -> dict:
+        return {
+            "frames": self.frames,
+            "changes": self.changes,
+            "queued": self.queued,
+            "sent": self.uploader.sent,
+            "dropped": self.uploader.dropped,
+            "failed": self.uploader.failed,
+        }
@@ -0,0 +1,126 @@
+import importlib.util
+import logging
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, Optional
+import numpy as np
+import pytesseract
+
+logger = logging.getLogger(__name__)
+
+# Qué se lee en cada ROI: modo de segmentación y caracteres permitidos
+NOMBRE = "nombre"
+PRECIOS = "precios"
+
+# --psm 7: una sola línea (letras, espacio, guion y apóstrofe, comunes en Dofus)
+# --psm 6: un bloque de texto (lotes "x10" y precios)
+PROFILES = {
+    NOMBRE: {"psm": 7, "whitelist": "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ '-"},
+    PRECIOS: {"psm": 6, "whitelist": "x0123456789."},
+}
+
+LANG = "eng"
+
+AUTO = "auto"
+
+
+class OcrEngine(ABC):
+    name = "base"
+
+    @abstractmethod
+    def image_to_string(self, image: np.ndarray, profile: str, timeout: float = 0) -> str:
+        """Text of image read with a PROFILES profile; timeout in seconds (0 = none) where the engine supports it."""
+
+
+class PytesseractEngine(OcrEngine):
+    """One tesseract subprocess per call (temp files, language data loaded each time)."""
+
+    name = "pytesseract"
+
+    def __init__(self):
+        self._configs = {
+            profile: f'--psm {options["psm"]} -c tessedit_char_whitelist="{options["whitelist"]}"'
+            for profile, options in PROFILES.items()
+        }
+
+    def image_to_string(self, image: np.ndarray, profile: str, timeout: float = 0) -> str:
+        return pytesseract.image_to_string(image, lang=LANG, config=self._configs[profile], timeout=timeout)
+
+
+class TesserocrEngine(OcrEngine):
+    """
+    In-process Tesseract through tesserocr: one API handle per profile,
+    created once (language data loaded once) and reused for every image.
+    There is no per-call timeout; the OCR pool's job timeout still applies.
+    """
+
+    name = "tesserocr"
+
+    def __init__(self):
+        import tesserocr
+
+        self._apis: Dict[str, "tesserocr.PyTessBaseAPI"] = {}
+        # Las APIs no son thread-safe; en el pool hay un hilo por proceso, pero el script también las usa
+        self._lock = threading.Lock()
+        for profile, options in PROFILES.items():
+            api = tesserocr.PyTessBaseAPI(lang=LANG, psm=options["psm"])
+            api.SetVariable("tessedit_char_whitelist", options["whitelist"])
+            self._apis[profile] = api
+
+    def image_to_string(self, image: np.ndarray, profile: str, timeout: float = 0) -> str:
+        image = np.ascontiguousarray(image)
+        height, width = image.shape[:2]
+        channels = 1 if image.ndim == 2 else image.shape[2]
+        with self._lock:
+            api = self._apis[profile]
+            api.SetImageBytes(image.tobytes(), width, height, channels, width * channels)
+            return api.GetUTF8Text()
+
+    def close(self):
+        for api in self._apis.values():
+            api.End()
+        self._apis.clear()
+
+
+_engine: Optional[OcrEngine] = None
+_engine_lock = threading.Lock()
+
+
+def tesserocr_available() -> bool:
+    return importlib.util.find_spec("tesserocr") is not None
+
+
+def get_engine(preference: Optional[str] = None) -> OcrEngine:
+    """
+    Engine of this process, created on first use. preference (ocr_engine):
+    "tesserocr", "pytesseract" or "auto" (tesserocr when it is installed
+    and starts, pytesseract otherwise).
+    """
+    global _engine
+    if _engine is not None:
+        return _engine
+    with _engine_lock:
+        if _engine is None:
+            if preference is None:
+                from src.settings.config import env_settings
+                preference = env_settings.ocr_engine.value
+            _engine = _create_engine(preference)
+            logger.info("ocr_engine_ready engine=%s", _engine.name)
+    return _engine
+
+
+def _create_engine(preference: str) -> OcrEngine:
+    if preference not in {AUTO, TesserocrEngine.name, PytesseractEngine.name}:
+        raise ValueError(
+            f"Unknown OCR engine {preference!r}: use '{AUTO}', '{TesserocrEngine.name}' or '{PytesseractEngine.name}'"
+        )
+    if preference == PytesseractEngine.name:
+        return PytesseractEngine()
+    if preference == TesserocrEngine.name or tesserocr_available():
+        try:
+            return TesserocrEngine()
+        except Exception as e:
+            if preference == TesserocrEngine.name:
+                raise
+            logger.warning("ocr_engine_fallback engine=pytesseract error=%s", e)
+    return PytesseractEngine()
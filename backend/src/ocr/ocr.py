@@ -1,22 +1,16 @@
 import cv2
-import pytesseract
 import numpy as np
 from PIL import ImageGrab, Image
 import time
 import re
 import os # Importamos os para verificar si existen carpetas
+from src.ocr.engine import NOMBRE, PRECIOS, get_engine
 
 # --- CONFIGURACIÓN ---
 # Tus coordenadas (x, y, w, h)
 REGION_MERCADILLO = (2001, 173, 436, 357)
 
-# [NUEVO] Configuración OCR para NOMBRES (letras y espacios)
-# --psm 7: Trata la imagen como una sola línea de texto.
-# whitelist: Permite letras mayúsculas, minúsculas, espacio, guion y apóstrofe (comunes en Dofus).
-config_tesseract_nombre = r'--psm 7 -c tessedit_char_whitelist="abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ \'-"'
-
-# Configuración OCR para PRECIOS (existente)
-config_tesseract_precios = r'--psm 6 -c tessedit_char_whitelist=x0123456789.'
+# Configuración OCR de NOMBRES y PRECIOS (psm y whitelist): ver PROFILES en src/ocr/engine.py
 
 def preprocesar_hsv(img):
     if img is None or img.size == 0: return None
@@ -48,6 +42,27 @@ def preprocesar_hsv(img):
     
     return mask_inv
 
+def capturar_region(region=REGION_MERCADILLO):
+    """Captura (x, y, w, h) de la pantalla como imagen BGR."""
+    x, y, w, h = region
+    bbox = (x, y, x + w, y + h)
+    screenshot = ImageGrab.grab(bbox=bbox, all_screens=True)
+    img_np = np.array(screenshot)
+    return cv2.cvtColor(img_np, cv2.COLOR_RGB2BGR)
+
+def recortar_nombre(img):
+    # Basado en tus imágenes, el nombre está arriba a la derecha del icono.
+    # y: empieza aprox en el pixel 10 y termina en el 55 (altura de 45px)
+    # x: empieza después del icono (aprox px 85) y va hasta casi el final.
+    return img[40:65, 85:img.shape[1]]
+
+def recortar_precios(img):
+    # Ajuste de recorte de la tabla (tu recorte original estaba bien)
+    # y: desde 180 hasta el final
+    # x: desde 60 (saltar icono lote) hasta ancho-120 (saltar botón comprar)
+    h_img, w_img = img.shape[:2]
+    return img[180:h_img, 60:w_img-120]
+
 def parsear_resultados_precios(texto_raw, verbose=False):
     """Analiza texto con el formato: x1 792"""
     resultados = {}
@@ -75,7 +90,9 @@ def parsear_resultados_precios(texto_raw, verbose=False):
                 continue
     return resultados
 
-def get_ocr_data(image_bytes: bytes = None, verbose: bool = False):
+def get_ocr_data(image_bytes: bytes = None, verbose: bool = False, timeout: float = 0):
+    # timeout: segundos por llamada a Tesseract (0 = sin límite); el motor pytesseract lanza RuntimeError al pasarlo
+    engine = get_engine()
     img = None
     
     if image_bytes:
@@ -90,13 +107,8 @@ def get_ocr_data(image_bytes: bytes = None, verbose: bool = False):
             return {"error": str(e)}
     else:
         if verbose: print(f"📸 Capturando región: {REGION_MERCADILLO}...")
-        x, y, w, h = REGION_MERCADILLO
-        
         try:
-            bbox = (x, y, x + w, y + h)
-            screenshot = ImageGrab.grab(bbox=bbox, all_screens=True)
-            img_np = np.array(screenshot)
-            img = cv2.cvtColor(img_np, cv2.COLOR_RGB2BGR)
+            img = capturar_region()
         except Exception as e:
             if verbose: print(f"❌ Error captura: {e}")
             return {"error": str(e)}
@@ -110,10 +122,7 @@ def get_ocr_data(image_bytes: bytes = None, verbose: bool = False):
     if verbose: print("🔍 Extrayendo nombre del objeto...")
     
     # 1. Definir ROI del Nombre (Region of Interest)
-    # Basado en tus imágenes, el nombre está arriba a la derecha del icono.
-    # y: empieza aprox en el pixel 10 y termina en el 55 (altura de 45px)
-    # x: empieza después del icono (aprox px 85) y va hasta casi el final.
-    roi_nombre = img[40:65, 85:w_img]
+    roi_nombre = recortar_nombre(img)
 
     # 2. Preprocesar (Usamos el mismo filtro HSV, funciona bien para texto blanco)
     img_nombre_proc = preprocesar_hsv(roi_nombre)
@@ -122,7 +131,7 @@ def get_ocr_data(image_bytes: bytes = None, verbose: bool = False):
     # cv2.imwrite("debug_nombre_mask.png", img_nombre_proc)
 
     # 3. OCR con configuración de SÓLO LETRAS
-    nombre_raw = pytesseract.image_to_string(img_nombre_proc, config=config_tesseract_nombre)
+    nombre_raw = engine.image_to_string(img_nombre_proc, NOMBRE, timeout=timeout)
     
     # Limpieza básica: quitar espacios al inicio/final y tomar solo la primera línea si hubiera basura
     nombre_limpio = nombre_raw.strip().split('\n')[0]
@@ -137,17 +146,14 @@ def get_ocr_data(image_bytes: bytes = None, verbose: bool = False):
     # --- EXTRACCIÓN DE PRECIOS (Existente) ---
     # ==========================================
     if verbose: print("💰 Extrayendo precios...")
-    # Ajuste de recorte de la tabla (tu recorte original estaba bien)
-    # y: desde 180 hasta el final
-    # x: desde 60 (saltar icono lote) hasta ancho-120 (saltar botón comprar)
-    roi_precios = img[180:h_img, 60:w_img-120]
+    roi_precios = recortar_precios(img)
 
     # Procesar y guardar debug
     img_precios_proc = preprocesar_hsv(roi_precios)
     # cv2.imwrite("debug_precios_mask.png", img_precios_proc)
     
     # OCR con configuración de SÓLO NÚMEROS y 'x'
-    texto_precios = pytesseract.image_to_string(img_precios_proc, config=config_tesseract_precios)
+    texto_precios = engine.image_to_string(img_precios_proc, PRECIOS, timeout=timeout)
     
     # Parsear
     datos_precios = parsear_resultados_precios(texto_precios, verbose=verbose)
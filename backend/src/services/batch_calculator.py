@@ -0,0 +1,199 @@
+from typing import List, Dict, Optional, Tuple
+import numpy as np
+from src.models.schemas import CalculateRequest, CalculateResponse, RuneBreakdown
+from src.services.calculator import get_rune_info, get_stat_density, get_rune_image
+
+# Stats que el calculador fuerza a 1 cuando vienen entre 0 y 1
+MIN_ONE_STATS = {"PA", "PM", "Alcance", "Invocaciones"}
+
+
+class PackedBatch:
+    """
+    Matrices (n_items x max_stats) con todo lo necesario para el cálculo.
+    Las celdas de relleno tienen valid=False y no aportan a ninguna suma.
+    """
+
+    def __init__(self, n_items: int, n_stats: int):
+        shape = (n_items, n_stats)
+        self.value = np.zeros(shape)          # Valor ajustado (PA/PM a 1, Pods / 2.5)
+        self.density = np.zeros(shape)
+        self.weight = np.ones(shape)          # 1 en celdas sin runa para evitar divisiones por 0
+        self.price = np.zeros(shape)
+        self.valid = np.zeros(shape, dtype=bool)
+        self.has_rune = np.zeros(shape, dtype=bool)
+        self.positive = np.zeros(shape, dtype=bool)  # stat.value > 0 (valor original)
+        self.is_pods = np.zeros(shape, dtype=bool)
+        # Índice de la celda cuyo VR usa cada stat como "VR propio".
+        # calculate_profit guarda los VR en un dict por nombre, así que con
+        # nombres repetidos gana la última aparición.
+        self.owner = np.tile(np.arange(n_stats), (n_items, 1))
+
+        self.level = np.zeros(n_items)
+        self.coef = np.zeros(n_items)
+        self.cost = np.zeros(n_items)
+
+        # Metadatos por celda para reconstruir el desglose
+        self.rune_names: List[List[Optional[str]]] = [[] for _ in range(n_items)]
+
+
+def pack_requests(requests: List[CalculateRequest]) -> PackedBatch:
+    n_stats = max((len(r.stats) for r in requests), default=0)
+    packed = PackedBatch(len(requests), max(n_stats, 1))
+
+    # Muchos ítems comparten stats: resolvemos cada (stat, idioma) una sola vez
+    resolved: Dict[Tuple[str, str], Tuple[float, Optional[dict]]] = {}
+
+    for i, req in enumerate(requests):
+        lang = req.lang
+        packed.level[i] = req.item_level
+        packed.coef[i] = req.coefficient / 100.0
+        packed.cost[i] = req.item_cost
+
+        last_index = {}
+        for j, stat in enumerate(req.stats):
+            key = (stat.name, lang)
+            if key not in resolved:
+                resolved[key] = (get_stat_density(stat.name, lang), get_rune_info(stat.name, lang))
+            density, rune_info = resolved[key]
+
+            value = stat.value
+            if stat.name in MIN_ONE_STATS and 0 <= value <= 1:
+                value = 1
+            if stat.name == "Pods":
+                value = value / 2.5
+
+            packed.value[i, j] = value
+            packed.density[i, j] = density
+            packed.valid[i, j] = True
+            packed.positive[i, j] = stat.value > 0
+            packed.is_pods[i, j] = stat.name == "Pods"
+
+            if rune_info:
+                packed.has_rune[i, j] = True
+                packed.weight[i, j] = rune_info["weight"]
+                packed.price[i, j] = req.rune_prices.get(rune_info["name"], 0)
+                packed.rune_names[i].append(rune_info["name"])
+            else:
+                packed.rune_names[i].append(None)
+
+            last_index[stat.name] = j
+
+        for j, stat in enumerate(req.stats):
+            packed.owner[i, j] = last_index[stat.name]
+
+    return packed
+
+
+def evaluate_packed(packed: PackedBatch) -> Dict[str, np.ndarray]:
+    """
+    Misma fórmula que calculate_profit, pero para todos los ítems a la vez.
+    """
+    level = packed.level[:, None]
+    coef = packed.coef[:, None]
+    cost = packed.cost[:, None]
+
+    # 1. POOL DE ROMPIMIENTO (VR)
+    vr = np.where(packed.value > 0, (packed.value * packed.density * level * 0.0150) + 1, 1.0)
+    vr = np.where(packed.valid, vr, 0.0)
+    total_vr = vr.sum(axis=1, keepdims=True)
+    vr_own = np.take_along_axis(vr, packed.owner, axis=1)
+
+    # 2. MODO NORMAL: cada stat entrega sus propias runas
+    count_normal = np.where(packed.has_rune, (vr_own * coef) / packed.weight, 0.0)
+    value_normal = count_normal * packed.price
+    # Las stats negativas suman al total igual que en calculate_profit (VR = 1)
+    total_rune_value = value_normal.sum(axis=1)
+
+    # 3. MODO FOCUS: propio + 50% del resto, para todas las stats a la vez
+    vr_focus = (vr_own + (0.5 * (total_vr - vr_own))) * coef
+    vr_focus = np.where(packed.is_pods, vr_focus / 2.5, vr_focus)
+    count_focus = np.where(packed.has_rune, vr_focus / packed.weight, 0.0)
+    value_focus = count_focus * packed.price
+
+    # Las stats negativas no generan runas en el desglose
+    eligible = packed.has_rune & packed.positive
+    count_normal = np.where(eligible, count_normal, 0.0)
+    value_normal = np.where(eligible, value_normal, 0.0)
+    count_focus = np.where(eligible, count_focus, 0.0)
+    value_focus = np.where(eligible, value_focus, 0.0)
+
+    focus_profit = np.where(eligible, value_focus - cost, -np.inf)
+    best_focus_idx = focus_profit.argmax(axis=1)  # argmax devuelve el primero en empates
+    max_focus_profit = focus_profit.max(axis=1)
+    has_focus = np.isfinite(max_focus_profit)
+    max_focus_profit = np.where(has_focus, max_focus_profit, -packed.cost)
+
+    # 4. MEJOR ESCENARIO (Normal vs Focus)
+    normal_profit = total_rune_value - packed.cost
+    use_focus = max_focus_profit > normal_profit
+    net_profit = np.where(use_focus, max_focus_profit, normal_profit)
+    total_value = np.where(use_focus, max_focus_profit + packed.cost, total_rune_value)
+
+    return {
+        "count_normal": count_normal,
+        "value_normal": value_normal,
+        "count_focus": count_focus,
+        "value_focus": value_focus,
+        "best_focus_idx": best_focus_idx,
+        "has_focus": has_focus,
+        "max_focus_profit": max_focus_profit,
+        "net_profit": net_profit,
+        "total_value": total_value,
+    }
+
+
+def _rune_images(requests: List[CalculateRequest], packed: PackedBatch) -> Dict[Tuple[str, str], Optional[str]]:
+    # Una sola consulta al caché por (runa, idioma) para todo el lote
+    return {
+        (name, req.lang): get_rune_image(name, req.lang)
+        for req, names in zip(requests, packed.rune_names)
+        for name in names
+        if name
+    }
+
+
+async def calculate_profit_batch(requests: List[CalculateRequest]) -> List[CalculateResponse]:
+    if not requests:
+        return []
+
+    packed = pack_requests(requests)
+    out = evaluate_packed(packed)
+    image_map = _rune_images(requests, packed)
+
+    responses = []
+    for i, req in enumerate(requests):
+        breakdown_list = []
+        for j, stat in enumerate(req.stats):
+            rune_name = packed.rune_names[i][j]
+            if not rune_name:
+                continue
+
+            rune_image = image_map.get((rune_name, req.lang))
+            breakdown_list.append(RuneBreakdown(
+                stat=stat.name,
+                rune_name=rune_name,
+                rune_image=rune_image,
+                weight=float(packed.density[i, j]),
+                count=round(float(out["count_normal"][i, j]), 2),
+                value=float(out["value_normal"][i, j]),
+                focus_rune_name=rune_name,
+                focus_image=rune_image,
+                focus_count=round(float(out["count_focus"][i, j]), 2),
+                focus_value=float(out["value_focus"][i, j])
+            ))
+
+        best_focus_stat = None
+        if out["has_focus"][i]:
+            best_focus_stat = req.stats[int(out["best_focus_idx"][i])].name
+
+        responses.append(CalculateResponse(
+            total_estimated_value=round(float(out["total_value"][i]), 2),
+            net_profit=round(float(out["net_profit"][i]), 2),
+            max_focus_profit=round(float(out["max_focus_profit"][i]), 2),
+            best_focus_stat=best_focus_stat,
+            breakdown=breakdown_list,
+            item_cost=req.item_cost,
+            coefficient=req.coefficient
+        ))
+
+    return responses
@@ -1,8 +1,12 @@
-import httpx
-import asyncio
 from src.models.schemas import CalculateRequest, CalculateResponse, RuneBreakdown
-import re
+import logging
+from typing import Optional
 from services.rune_regex import STAT_MAPS
+from src.services.image_store import rune_image_store
+from src.services.localization import LocalizationIndex
+from src.settings.logging_config import trace_enabled
+
+logger = logging.getLogger(__name__)
 
 # --- NEW: ITEM TYPE REGEX PATTERNS ---
 ITEM_TYPE_REGEX_PATTERNS = {
@@ -104,83 +108,8 @@ ITEM_TYPE_REGEX_PATTERNS = {
     ]
 }
 
-# --- 1. TU FUNCIÓN DE BÚSQUEDA (INTEGRADA) ---
-# Mantenemos tu lógica exacta para obtener la imagen.
-
-DOFUSDUDE_API_BASE_URL = "https://api.dofusdu.de/dofus3/v1"
-IMAGE_CACHE = {}  # Pequeño caché para no saturar la API
-
-async def buscar_y_obtener_imagen(nombre_runa: str, client: httpx.AsyncClient = None, lang: str = "es"):
-    # Revisamos caché primero
-    cache_key = f"{nombre_runa}_{lang}"
-    if cache_key in IMAGE_CACHE:
-        return IMAGE_CACHE[cache_key]
-
-    print(f"🔎 Buscando en API ({lang}): '{nombre_runa}'...")
-
-    url = f"{DOFUSDUDE_API_BASE_URL}/{lang}/items/resources/search"
-    params = {
-        "query": nombre_runa,
-        "filter[min_level]": 1,
-        "filter[max_level]": 200,
-        "limit": 8
-    }
-
-    try:
-        if client:
-            response = await client.get(url, params=params, timeout=10.0)
-        else:
-            async with httpx.AsyncClient() as local_client:
-                response = await local_client.get(url, params=params, timeout=10.0)
-            
-        if response.status_code != 200:
-            print(f"❌ Error API: {response.status_code}")
-            return None
-        
-        resultados = response.json()
-
-        if not resultados:
-            print(f"❌ No se encontró: {nombre_runa}")
-            return None
-
-        # --- MODIFICATION: Filter for actual runes ---
-        # The API search can be fuzzy. We need to ensure we're getting a rune.
-        runa_keyword = "rune" if lang != "es" else "runa"
-        
-        mejor_coincidencia = None
-        
-        # 1. Prioritize exact match (case-insensitive)
-        for item in resultados:
-            if item.get("name", "").lower() == nombre_runa.lower():
-                mejor_coincidencia = item
-                break
-        
-        # 2. If no exact match, find the first result that looks like a rune
-        if not mejor_coincidencia:
-            for item in resultados:
-                if runa_keyword in item.get("name", "").lower():
-                    mejor_coincidencia = item
-                    break # Take the first likely candidate
-        
-        # 3. If no likely candidate was found, we discard the search result
-        #    to avoid showing a wrong item (e.g. a hat instead of a rune).
-        if not mejor_coincidencia:
-            print(f"⚠️ No se encontró una runa para '{nombre_runa}'. El primer resultado fue '{resultados[0].get('name', 'N/A')}'")
-            return None
-
-        imagenes = mejor_coincidencia.get("image_urls", {})
-        url_imagen = imagenes.get("icon") or imagenes.get("sd")
-        
-        if url_imagen:
-            # Guardamos en caché y retornamos solo la URL
-            IMAGE_CACHE[cache_key] = url_imagen
-            return url_imagen
-        
-        return None
-
-    except Exception as e:
-        print(f"🔥 Error conexión: {e}")
-        return None
+# --- 1. IMÁGENES DE RUNAS ---
+# La búsqueda en dofusdu.de vive en image_store; el cálculo solo lee del caché.
 
 # --- 2. BASE DE DATOS Y DENSIDADES ---
 
@@ -282,6 +211,10 @@ RUNE_DB = {
     "Arma de caza": [{"name": {"es": "Runa de caza", "en": "Hunting Rune", "fr": "Rune de chasse"}, "weight": 5.0}],
 }
 
+# --- 3. ÍNDICE DE LOCALIZACIÓN ---
+# Se construye una sola vez al importar; los helpers de abajo solo consultan dicts.
+LOCALIZATION = LocalizationIndex(STAT_MAPS, RUNE_DB, ITEM_TYPE_REGEX_PATTERNS)
+
 # --- 4. HELPERS ---
 
 def get_canonical_stat_name(stat_name: str, lang: str = "es") -> str:
@@ -289,115 +222,40 @@ def get_canonical_stat_name(stat_name: str, lang: str = "es") -> str:
     Busca el nombre canónico de un stat usando diccionarios (HashMaps).
     Prioridad: Match Exacto > Match Limpio (sin números) > Fallback.
     """
-    # DEBUG: Ver qué llega
-    print(f"\n[DEBUG MAP] ------------------------------------------------")
-    print(f"[DEBUG MAP] Raw Input:  '{stat_name}'")
-    
-    if not stat_name:
-        return ""
-
-    # Seleccionar el diccionario del idioma correcto
-    # Si no existe el idioma, usa un diccionario vacío para evitar errores
-    current_map = STAT_MAPS.get(lang, {}) 
-    
-    # -----------------------------------------------------------
-    # INTENTO 1: Búsqueda Exacta (Solo strip básico)
-    # -----------------------------------------------------------
-    # Esto atrapa llaves "sucias" que definimos explícitamente como:
-    # ": + Damage", ": - AP", "AP", etc. si vienen solas.
-    raw_key = stat_name.strip()
-    
-    if raw_key in current_map:
-        canonical = current_map[raw_key]
-        print(f"[DEBUG MAP] ✅ DIRECT MATCH! Key: '{raw_key}'")
-        print(f"[DEBUG MAP] ➡️ Resultado: '{canonical}'")
-        return canonical
-
-    # -----------------------------------------------------------
-    # INTENTO 2: Búsqueda Limpia (Remover números y símbolos iniciales)
-    # -----------------------------------------------------------
-    # Esto transforma "+50 Strength" -> "Strength"
-    # O "15 % Fire Resistance" -> "% Fire Resistance"
-    clean_name = re.sub(r"^[+\-\d\s:]+", "", stat_name).strip()
-    
-    # NOTA: Agregué ':' al regex de limpieza para que ": + Damage" 
-    # se convierta en "Damage" si la búsqueda exacta falló (por ejemplo si dice "1 : + Damage")
-    
-    print(f"[DEBUG MAP] Clean Input: '{clean_name}'")
-
-    if clean_name in current_map:
-        canonical = current_map[clean_name]
-        print(f"[DEBUG MAP] ✅ CLEAN MATCH! Key: '{clean_name}'")
-        print(f"[DEBUG MAP] ➡️ Resultado: '{canonical}'")
-        return canonical
-
-    # -----------------------------------------------------------
-    # FALLBACKS (Si no está en el mapa)
-    # -----------------------------------------------------------
-    if "RUNE_DB" in globals(): 
-        # Intento de matchear contra la base de datos de runas directamente
-        for db_key in RUNE_DB.keys():
-            if db_key.lower() == clean_name.lower():
-                print(f"[DEBUG MAP] ⚠️ Fallback DB Exacto: '{db_key}'")
-                return db_key
-    
-    print(f"[DEBUG MAP] ❌ NO MATCH en Mapas ni DB. Se devuelve: '{clean_name}'")
-    return clean_name
+    return LOCALIZATION.canonical_stat_name(stat_name, lang)
 
 def get_canonical_item_type(item_type: str, lang: str = "es") -> str:
     """
     Converts a localized item type name to the canonical Spanish name.
     """
-    item_type_lower = item_type.lower()
-    
-    if lang in ITEM_TYPE_REGEX_PATTERNS:
-        for pattern, canonical in ITEM_TYPE_REGEX_PATTERNS[lang]:
-            if re.search(pattern, item_type_lower, re.IGNORECASE):
-                return canonical
-    
-    return item_type # Fallback
+    return LOCALIZATION.canonical_item_type(item_type, lang)
 
 def get_rune_info(stat_name: str, lang: str = "es"):
-    canonical_name = get_canonical_stat_name(stat_name, lang)
-    if canonical_name in RUNE_DB:
-        rune_data = RUNE_DB[canonical_name][0]
-        # Return a copy with the translated name
-        return {
-            "name": rune_data["name"].get(lang, rune_data["name"]["es"]),
-            "weight": rune_data["weight"]
-        }
-    return None
+    return LOCALIZATION.rune_info(stat_name, lang)
 
 def get_rune_name_translation(rune_name_es: str, target_lang: str = "es") -> str:
     """
     Translates a rune name from Spanish (DB key) to the target language.
     """
-    if target_lang == "es":
-        return rune_name_es
-        
-    # Search in RUNE_DB
-    for stat, data_list in RUNE_DB.items():
-        for data in data_list:
-            names = data.get("name", {})
-            if names.get("es") == rune_name_es:
-                return names.get(target_lang, rune_name_es)
-                
-    return rune_name_es
+    return LOCALIZATION.rune_name_translation(rune_name_es, target_lang)
 
 def get_canonical_rune_name(rune_name: str, lang: str = "es") -> str:
     """
     Converts a localized rune name (e.g. 'Rune Fo') back to the canonical Spanish name (e.g. 'Runa Fu').
     """
-    if lang == "es":
-        return rune_name
-        
-    for stat, data_list in RUNE_DB.items():
-        for data in data_list:
-            names = data.get("name", {})
-            if names.get(lang) == rune_name:
-                return names.get("es", rune_name)
-                
-    return rune_name
+    return LOCALIZATION.canonical_rune_name(rune_name, lang)
+
+def is_real_rune(rune_name_es: str) -> bool:
+    """
+    True when the canonical (Spanish) name belongs to a rune of RUNE_DB.
+    """
+    return LOCALIZATION.is_rune_name_es(rune_name_es)
+
+def get_rune_image(rune_name: str, lang: str = "es") -> Optional[str]:
+    """
+    Returns the cached image for a localized rune name, or None while it is fetched in the background.
+    """
+    return rune_image_store.get(get_canonical_rune_name(rune_name, lang))
 
 def get_stat_density(stat_name: str, lang: str = "es") -> float:
     canonical_name = get_canonical_stat_name(stat_name, lang)
@@ -418,7 +276,10 @@ async def calculate_profit(request: CalculateRequest) -> CalculateResponse:
     stat_vrs = {}      # Diccionario para guardar el VR de cada stat individual
     total_vr_sum = 0.0 # Suma total de todos los VR del objeto
     
-    print(f"--- DEBUG PESOS (Coeficiente: {server_coef}) ---")
+    # Traza por stat: se decide una vez por cálculo (header de debug o muestreo)
+    trace = trace_enabled()
+    if trace:
+        logger.debug("vr_pool coefficient=%s item_level=%s stats=%d", server_coef, item_lvl, len(request.stats))
     for stat in request.stats:
         density = get_stat_density(stat.name, lang)
         value = stat.value
@@ -437,32 +298,25 @@ async def calculate_profit(request: CalculateRequest) -> CalculateResponse:
         else:
             vr = 1
 
-        print(f"Stat: {stat.name} | Valor: {value} | VR Calculado: {vr}")
+        if trace:
+            logger.debug("stat_vr stat=%r value=%s density=%s vr=%s", stat.name, value, density, vr)
             
         stat_vrs[stat.name] = vr
         total_vr_sum += vr
 
-    print(f"TOTAL VR SUM: {total_vr_sum}")
-    print("------------------------------------------------")
+    if trace:
+        logger.debug("vr_total sum=%s", total_vr_sum)
 
     # 3. FASE 2: CÁLCULO DE RUNAS
     max_focus_profit = -float('inf')
     best_focus_stat = None
 
-    # --- OPTIMIZACIÓN: Pre-cargar imágenes en paralelo ---
-    rune_names_to_fetch = set()
+    # --- Imágenes desde el caché (nunca bloquea en la red) ---
+    image_map = {}
     for stat in request.stats:
         rune_info = get_rune_info(stat.name, lang)
         if rune_info:
-            rune_names_to_fetch.add(rune_info["name"])
-    
-    image_map = {}
-    if rune_names_to_fetch:
-        names_list = list(rune_names_to_fetch)
-        async with httpx.AsyncClient() as client:
-            tasks = [buscar_y_obtener_imagen(name, client, lang) for name in names_list]
-            results = await asyncio.gather(*tasks)
-            image_map = dict(zip(names_list, results))
+            image_map[rune_info["name"]] = get_rune_image(rune_info["name"], lang)
     # -----------------------------------------------------
 
     for stat in request.stats:
@@ -0,0 +1,251 @@
+import asyncio
+import gzip
+import json
+import logging
+import os
+import time
+import unicodedata
+from typing import Dict, List, Optional, Tuple
+from src.services.upstream import upstream, DOFUSDUDE_API_BASE_URL, BULK
+from src.settings.config import env_settings
+
+logger = logging.getLogger(__name__)
+
+CATEGORIES = ("equipment", "resources", "consumables")
+BACKPACK_TYPE_ID = 102
+
+
+def normalize_text(text: str) -> str:
+    """Lower case without accents, for local search."""
+    text = unicodedata.normalize("NFKD", text or "")
+    return "".join(c for c in text if not unicodedata.combining(c)).lower().strip()
+
+
+def _extract_items(data) -> List[dict]:
+    if isinstance(data, list):
+        return data
+    if isinstance(data, dict) and "items" in data:
+        return data["items"]
+    return []
+
+
+class ItemCatalog:
+    """
+    Local mirror of the dofusdu.de /all listings (equipment, resources,
+    consumables) for every configured language.
+
+    Each (category, lang) is stored as a gzipped JSON snapshot in
+    catalog_dir and indexed in memory by ankama_id. Readers fall back to the
+    upstream API when the catalog is not loaded or an item is missing.
+    """
+
+    def __init__(self, directory: str, langs: List[str]):
+        self.directory = directory
+        self.langs = langs
+        self._items: Dict[Tuple[str, str], Dict[int, dict]] = {}
+        self._search_keys: Dict[Tuple[str, str], List[Tuple[str, int]]] = {}
+        self._type_slugs: Dict[int, str] = {}
+        self.synced_at: Optional[float] = None
+        self.version = 0  # Sube con cada índice nuevo, para cachés derivados
+        self._sync_lock = asyncio.Lock()
+
+    # --- Estado ---
+
+    @property
+    def loaded(self) -> bool:
+        return bool(self._items)
+
+    def has(self, category: str, lang: str) -> bool:
+        return (category, lang) in self._items
+
+    def is_stale(self) -> bool:
+        if self.synced_at is None:
+            return True
+        return time.time() - self.synced_at > env_settings.catalog_refresh_hours * 3600
+
+    def status(self) -> dict:
+        return {
+            "loaded": self.loaded,
+            "synced_at": self.synced_at,
+            "syncing": self._sync_lock.locked(),
+            "counts": {f"{category}/{lang}": len(items) for (category, lang), items in sorted(self._items.items())},
+        }
+
+    # --- Lecturas ---
+
+    def get(self, category: str, lang: str, ankama_id: int) -> Optional[dict]:
+        return self._items.get((category, lang), {}).get(ankama_id)
+
+    def find(self, ankama_id: int, lang: str, preferred: str = "resources") -> Optional[dict]:
+        """Looks an item up in every category, starting with the preferred one."""
+        for category in (preferred,) + tuple(c for c in CATEGORIES if c != preferred):
+            item = self.get(category, lang, ankama_id)
+            if item is not None:
+                return item
+        return None
+
+    def search(self, category: str, lang: str, query: str, limit: int = 20) -> List[dict]:
+        """
+        Accent and case insensitive search. Exact names first, then prefixes,
+        then substrings; ties keep the catalog order.
+        """
+        needle = normalize_text(query)
+        if not needle:
+            return []
+
+        items = self._items.get((category, lang), {})
+        exact, prefix, contains = [], [], []
+        for key, ankama_id in self._search_keys.get((category, lang), []):
+            if key == needle:
+                exact.append(ankama_id)
+            elif key.startswith(needle):
+                prefix.append(ankama_id)
+            elif needle in key:
+                contains.append(ankama_id)
+        ids = (exact + prefix + contains)[:limit]
+        return [items[i] for i in ids]
+
+    def can_filter_equipment(self, lang: str) -> bool:
+        # Type slugs come from the English snapshot
+        return self.has("equipment", lang) and self.has("equipment", "en")
+
+    def equipment(self, lang: str = "es") -> List[dict]:
+        """Every equipment item, in catalog order."""
+        return list(self._items.get(("equipment", lang), {}).values())
+
+    def is_backpack(self, item: dict) -> bool:
+        return (item.get("type", {}) or {}).get("id") == BACKPACK_TYPE_ID
+
+    def type_slug(self, item: dict) -> str:
+        item_type = item.get("type", {}) or {}
+        return item_type.get("name_id") or self._type_slugs.get(item.get("ankama_id"), "")
+
+    def filter_equipment(self, types: List[str], min_level: int, max_level: int, lang: str = "es") -> List[dict]:
+        """Same selection as the upstream /equipment/all filters, sorted by level desc."""
+        filter_types = {t.lower() for t in types}
+        has_backpack = "backpack" in filter_types
+
+        selected = []
+        for item in self._items.get(("equipment", lang), {}).values():
+            level = item.get("level", 1)
+            if level < min_level or level > max_level:
+                continue
+            if (has_backpack and self.is_backpack(item)) or self.type_slug(item) in filter_types:
+                selected.append(item)
+
+        selected.sort(key=lambda item: item.get("level", 1), reverse=True)
+        return selected
+
+    # --- Persistencia ---
+
+    def _path(self, category: str, lang: str) -> str:
+        return os.path.join(self.directory, f"{category}_{lang}.json.gz")
+
+    def _index(self, snapshots: Dict[Tuple[str, str], List[dict]]):
+        items = {}
+        search_keys = {}
+        for key, raw_items in snapshots.items():
+            by_id = {item["ankama_id"]: item for item in raw_items if isinstance(item, dict) and item.get("ankama_id")}
+            items[key] = by_id
+            search_keys[key] = [(normalize_text(item.get("name", "")), ankama_id) for ankama_id, item in by_id.items()]
+
+        # Los filtros de tipo usan slugs en inglés ("hat", "ring")
+        type_slugs = {
+            ankama_id: ((item.get("type", {}) or {}).get("name") or "").lower()
+            for ankama_id, item in items.get(("equipment", "en"), {}).items()
+        }
+
+        # Swap all at once so readers never see a half-built index
+        self._items, self._search_keys, self._type_slugs = items, search_keys, type_slugs
+        self.version += 1
+
+    def load(self) -> bool:
+        snapshots = {}
+        oldest = None
+        for lang in self.langs:
+            for category in CATEGORIES:
+                path = self._path(category, lang)
+                if not os.path.exists(path):
+                    continue
+                with gzip.open(path, "rt", encoding="utf-8") as f:
+                    snapshots[(category, lang)] = json.load(f)
+                mtime = os.path.getmtime(path)
+                oldest = mtime if oldest is None else min(oldest, mtime)
+
+        if not snapshots:
+            return False
+        self._index(snapshots)
+        self.synced_at = oldest
+        logger.info("catalog_loaded snapshots=%d", len(snapshots))
+        return True
+
+    def _write(self, category: str, lang: str, items: List[dict]):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(category, lang)
+        tmp_path = f"{path}.tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump(items, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    # --- Sincronización ---
+
+    async def _fetch_all(self, category: str, lang: str) -> Optional[List[dict]]:
+        url = f"{DOFUSDUDE_API_BASE_URL}/{lang}/items/{category}/all"
+        params = {"page[size]": -1, "sort[level]": "desc"}
+        response = await upstream.get(
+            url, endpoint=f"{category}.all", params=params, timeout=env_settings.upstream_bulk_timeout_seconds,
+            priority=BULK
+        )
+        if response.status_code != 200:
+            logger.warning("catalog_fetch_failed category=%s lang=%s status=%s", category, lang, response.status_code)
+            return None
+        data = await asyncio.to_thread(json.loads, response.content)
+        return _extract_items(data)
+
+    async def sync(self) -> dict:
+        """
+        Downloads every (category, lang) listing and swaps the in-memory index.
+        A listing that fails keeps its previous snapshot.
+        """
+        async with self._sync_lock:
+            started = time.perf_counter()
+            snapshots = {key: list(items.values()) for key, items in self._items.items()}
+            failed = []
+
+            for lang in self.langs:
+                for category in CATEGORIES:
+                    try:
+                        items = await self._fetch_all(category, lang)
+                    except Exception as e:
+                        logger.warning("catalog_fetch_error category=%s lang=%s error=%s", category, lang, e)
+                        items = None
+                    if items is None:
+                        failed.append(f"{category}/{lang}")
+                        continue
+                    await asyncio.to_thread(self._write, category, lang, items)
+                    snapshots[(category, lang)] = items
+
+            if snapshots:
+                await asyncio.to_thread(self._index, snapshots)
+            if not failed:
+                self.synced_at = time.time()
+
+            duration = time.perf_counter() - started
+            logger.info("catalog_synced snapshots=%d failed=%s duration_s=%.1f", len(snapshots), failed, duration)
+            return {"snapshots": len(snapshots), "failed": failed, "duration_s": round(duration, 1)}
+
+    async def refresh_loop(self):
+        """Background task: sync now if stale, then every catalog_refresh_hours."""
+        while True:
+            if self.is_stale():
+                try:
+                    await self.sync()
+                except Exception as e:
+                    logger.warning("catalog_sync_error error=%s", e)
+            await asyncio.sleep(max(env_settings.catalog_refresh_hours * 3600 / 4, 60))
+
+
+catalog = ItemCatalog(
+    directory=env_settings.catalog_dir,
+    langs=[lang.strip() for lang in env_settings.catalog_langs.split(",") if lang.strip()],
+)
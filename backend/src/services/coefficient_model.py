@@ -0,0 +1,262 @@
+import json
+import logging
+import math
+import os
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Union
+import numpy as np
+from src.settings.config import env_settings
+
+logger = logging.getLogger(__name__)
+
+# Stats canónicos que marcan has_high_value_rune (igual en el dataset y en el scan)
+HIGH_VALUE_STATS = {"PA", "PM", "Alcance", "Crítico"}
+
+NUMERIC_FEATURES = (
+    "log_craft_cost", "log_value_at_100", "cost_ratio", "item_level", "recipe_size", "has_high_value_rune"
+)
+
+# Un ratio costo / valor por encima de esto ya no cambia nada
+MAX_COST_RATIO = 10.0
+
+
+def numeric_features(craft_cost, value_at_100, level, recipe_size, high_value) -> np.ndarray:
+    craft_cost = np.asarray(craft_cost, dtype=np.float64)
+    value_at_100 = np.asarray(value_at_100, dtype=np.float64)
+    ratio = np.divide(craft_cost, value_at_100, out=np.full_like(craft_cost, MAX_COST_RATIO), where=value_at_100 > 0)
+    return np.column_stack([
+        np.log1p(np.maximum(craft_cost, 0)),
+        np.log1p(np.maximum(value_at_100, 0)),
+        np.clip(ratio, 0, MAX_COST_RATIO),
+        np.asarray(level, dtype=np.float64),
+        np.asarray(recipe_size, dtype=np.float64),
+        np.asarray(high_value, dtype=np.float64),
+    ])
+
+
+def _one_hot(values: Union[str, Sequence[Optional[str]]], vocabulary: List[str], n_rows: int) -> np.ndarray:
+    """Unknown values (not seen in training) get an all-zero row."""
+    out = np.zeros((n_rows, len(vocabulary)))
+    index = {value: i for i, value in enumerate(vocabulary)}
+    if isinstance(values, str) or values is None:
+        column = index.get(values)
+        if column is not None:
+            out[:, column] = 1.0
+        return out
+    columns = np.array([index.get(value, -1) for value in values], dtype=np.int64)
+    rows = np.flatnonzero(columns >= 0)
+    out[rows, columns[rows]] = 1.0
+    return out
+
+
+class CoefficientModel:
+    """
+    Ridge regression of real_coefficient over the features the profit scan
+    already has for every item: craft cost, value at 100%, their ratio,
+    level, recipe size, high value runes, item type and server (one-hot).
+
+    Numeric features are standardized with the training mean and scale;
+    predictions are clipped to the range of coefficients seen in training.
+    """
+
+    def __init__(self, weights: np.ndarray, bias: float, mean: np.ndarray, scale: np.ndarray,
+                 item_types: List[str], servers: List[str], clip: Sequence[float], info: Optional[dict] = None):
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.bias = float(bias)
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.scale = np.asarray(scale, dtype=np.float64)
+        self.item_types = list(item_types)
+        self.servers = list(servers)
+        self.clip = (float(clip[0]), float(clip[1]))
+        self.info = info or {}
+
+    def design(self, craft_cost, value_at_100, level, recipe_size, high_value,
+               item_types: Sequence[Optional[str]], servers: Union[str, Sequence[str]]) -> np.ndarray:
+        numeric = numeric_features(craft_cost, value_at_100, level, recipe_size, high_value)
+        n_rows = len(numeric)
+        return np.hstack([
+            (numeric - self.mean) / self.scale,
+            _one_hot(item_types, self.item_types, n_rows),
+            _one_hot(servers, self.servers, n_rows),
+        ])
+
+    def predict(self, craft_cost, value_at_100, level, recipe_size, high_value,
+                item_types: Sequence[Optional[str]], servers: Union[str, Sequence[str]]) -> np.ndarray:
+        """Vectorized: one matrix product for the whole batch, rounded like stored coefficients."""
+        if not len(craft_cost):
+            return np.empty(0)
+        x = self.design(craft_cost, value_at_100, level, recipe_size, high_value, item_types, servers)
+        return np.round(np.clip(x @ self.weights + self.bias, *self.clip), 2)
+
+    # --- Entrenamiento ---
+
+    @classmethod
+    def fit(cls, rows: Iterable[dict], alpha: float = 1.0) -> "CoefficientModel":
+        """
+        Fits on prediction_dataset rows (dicts with the export columns).
+        Rows without a positive coefficient, cost or rune value are skipped.
+        """
+        columns = training_columns(rows)
+        n_rows = len(columns["target"])
+        if n_rows < 2:
+            raise ValueError(f"Not enough usable rows to fit ({n_rows})")
+
+        numeric = numeric_features(columns["craft_cost"], columns["value_at_100"], columns["item_level"],
+                                   columns["recipe_size"], columns["high_value"])
+        mean = numeric.mean(axis=0)
+        scale = numeric.std(axis=0)
+        scale[scale == 0] = 1.0
+
+        item_types = sorted({t for t in columns["item_type"] if t})
+        servers = sorted({s for s in columns["server"] if s})
+        model = cls(np.zeros(0), 0.0, mean, scale, item_types, servers, (0.0, 0.0))
+        x = model.design(columns["craft_cost"], columns["value_at_100"], columns["item_level"],
+                         columns["recipe_size"], columns["high_value"], columns["item_type"], columns["server"])
+
+        # Ridge en forma cerrada; el bias va aparte y no se penaliza
+        target = columns["target"]
+        x_mean, y_mean = x.mean(axis=0), target.mean()
+        xc = x - x_mean
+        weights = np.linalg.solve(xc.T @ xc + alpha * np.eye(x.shape[1]), xc.T @ (target - y_mean))
+
+        model.weights = weights
+        model.bias = float(y_mean - x_mean @ weights)
+        model.clip = (float(target.min()), float(target.max()))
+        model.info = {"rows": n_rows, "alpha": alpha, "trained_at": time.time()}
+        return model
+
+    # --- Persistencia (npz sin pickle) ---
+
+    def save(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        meta = {"item_types": self.item_types, "servers": self.servers, "clip": self.clip,
+                "features": NUMERIC_FEATURES, "info": self.info}
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, weights=self.weights, bias=np.array([self.bias]), mean=self.mean, scale=self.scale,
+                 meta=np.array(json.dumps(meta, ensure_ascii=False)))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "CoefficientModel":
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data["meta"]))
+            if tuple(meta.get("features", ())) != NUMERIC_FEATURES:
+                raise ValueError("Model was trained with other features")
+            return cls(data["weights"], float(data["bias"][0]), data["mean"], data["scale"],
+                       meta["item_types"], meta["servers"], meta["clip"], meta.get("info"))
+
+
+def _number(value, default: float = math.nan) -> float:
+    if value is None or value == "":
+        return default
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def _flag(value) -> bool:
+    if isinstance(value, str):
+        return value.strip().lower() in {"1", "true", "t", "yes"}
+    return bool(value)
+
+
+def training_columns(rows: Iterable[dict]) -> Dict[str, np.ndarray]:
+    """
+    Export rows -> feature columns. The dataset stores the rune value at the
+    real coefficient; the scan only knows it at 100%, so it is scaled back.
+    """
+    columns: Dict[str, list] = {key: [] for key in (
+        "target", "craft_cost", "value_at_100", "item_level", "recipe_size", "high_value", "item_type", "server"
+    )}
+    for row in rows:
+        coefficient = _number(row.get("real_coefficient"))
+        craft_cost = _number(row.get("craft_cost"))
+        rune_value = _number(row.get("rune_value_real"))
+        if not (coefficient > 0 and craft_cost > 0 and rune_value > 0):
+            continue
+        columns["target"].append(coefficient)
+        columns["craft_cost"].append(craft_cost)
+        columns["value_at_100"].append(rune_value * 100.0 / coefficient)
+        columns["item_level"].append(_number(row.get("item_level"), 1.0))
+        columns["recipe_size"].append(_number(row.get("recipe_difficulty"), 0.0))
+        columns["high_value"].append(_flag(row.get("has_high_value_rune")))
+        columns["item_type"].append(row.get("item_type") or None)
+        columns["server"].append(row.get("server") or None)
+
+    return {
+        key: np.array(values, dtype=object if key in {"item_type", "server"} else np.float64)
+        for key, values in columns.items()
+    }
+
+
+class CoefficientPredictor:
+    """
+    Serves the model in coefficient_model_file in-process. The file is
+    re-checked at most every check_seconds and reloaded when it changes, so
+    a retrain only needs the file replaced. Without a model, items with no
+    coefficient keep the default.
+    """
+
+    def __init__(self, path: str, default: float = 100.0, check_seconds: float = 30.0):
+        self.path = path
+        self.default = default
+        self.check_seconds = check_seconds
+        self._model: Optional[CoefficientModel] = None
+        self._mtime: Optional[float] = None
+        self._checked = -math.inf
+        self.version = 0
+        self.predictions = 0
+
+    def current(self) -> Optional[CoefficientModel]:
+        now = time.monotonic()
+        if now - self._checked >= self.check_seconds:
+            self._checked = now
+            self._reload_if_changed()
+        return self._model
+
+    def _reload_if_changed(self):
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            if self._model is not None:
+                logger.info("coefficient_model_removed path=%s", self.path)
+                self._model, self._mtime = None, None
+                self.version += 1
+            return
+        if mtime == self._mtime:
+            return
+        try:
+            model = CoefficientModel.load(self.path)
+        except Exception as e:
+            # Se mantiene el modelo anterior (o ninguno)
+            logger.warning("coefficient_model_load_failed path=%s error=%s", self.path, e)
+            self._mtime = mtime
+            return
+        self._model, self._mtime = model, mtime
+        self.version += 1
+        logger.info("coefficient_model_loaded path=%s rows=%s", self.path, model.info.get("rows"))
+
+    def predict(self, craft_cost, value_at_100, level, recipe_size, high_value,
+                item_types: Sequence[Optional[str]], server: str) -> np.ndarray:
+        """Predicted coefficients, or the default for all when there is no model."""
+        model = self.current()
+        if model is None:
+            return np.full(len(craft_cost), self.default)
+        self.predictions += len(craft_cost)
+        return model.predict(craft_cost, value_at_100, level, recipe_size, high_value, item_types, server)
+
+    def snapshot(self) -> dict:
+        model = self.current()
+        return {
+            "path": self.path,
+            "loaded": model is not None,
+            "version": self.version,
+            "info": model.info if model is not None else None,
+            "predictions": self.predictions,
+        }
+
+
+coefficient_predictor = CoefficientPredictor(path=env_settings.coefficient_model_file)
@@ -0,0 +1,212 @@
+import asyncio
+import csv
+import importlib.util
+import io
+import logging
+import time
+import zlib
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional
+from sqlalchemy import Boolean, DateTime, Float, Integer, String, select
+from src.db.database import AsyncSessionLocal
+from src.models.sql_models import PredictionDataset, ItemCoefficientHistoryModel
+from src.settings.config import env_settings
+
+logger = logging.getLogger(__name__)
+
+DATASETS = {
+    "predictions": PredictionDataset,
+    "coefficients": ItemCoefficientHistoryModel,
+}
+
+CSV_GZ, PARQUET, ARROW = "csv.gz", "parquet", "arrow"
+FORMATS = {
+    CSV_GZ: ("application/gzip", "csv.gz"),
+    PARQUET: ("application/vnd.apache.parquet", "parquet"),
+    ARROW: ("application/vnd.apache.arrow.stream", "arrows"),
+}
+ARROW_FORMATS = {PARQUET, ARROW}
+
+
+class ExportUnavailable(Exception):
+    """The format needs a package that is not installed (pyarrow)."""
+
+
+def arrow_available() -> bool:
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+class ExportQuery:
+    """A dataset with the export filters applied, ordered by id."""
+
+    def __init__(self, dataset: str, server: Optional[str] = None, saved: Optional[bool] = None,
+                 start: Optional[datetime] = None, end: Optional[datetime] = None):
+        self.model = DATASETS[dataset]
+        self.dataset = dataset
+        self.columns = list(self.model.__table__.columns)
+        query = select(*self.columns)
+        if server is not None:
+            query = query.where(self.model.server == server)
+        if saved is not None and hasattr(self.model, "saved"):
+            query = query.where(self.model.saved == saved)
+        if start is not None:
+            query = query.where(self.model.created_at >= start)
+        if end is not None:
+            query = query.where(self.model.created_at < end)
+        self.query = query.order_by(self.model.id)
+
+    @property
+    def names(self) -> List[str]:
+        return [column.name for column in self.columns]
+
+
+async def stream_batches(export: ExportQuery, batch_rows: int) -> AsyncIterator[List[tuple]]:
+    """
+    Rows in batches of batch_rows through a server-side cursor: memory stays
+    bounded by one batch whatever the size of the table.
+    """
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(export.query.execution_options(yield_per=batch_rows))
+        async for partition in result.partitions(batch_rows):
+            yield [tuple(row) for row in partition]
+
+
+# --- Codificadores: cada uno recibe lotes de filas y devuelve bytes listos para enviar ---
+
+class _CsvGzEncoder:
+    def __init__(self, export: ExportQuery):
+        self.names = export.names
+        # wbits=31: formato gzip, un solo miembro para todo el archivo
+        self._compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        self._header_written = False
+
+    def encode(self, rows: List[tuple]) -> bytes:
+        text = io.StringIO()
+        writer = csv.writer(text)
+        if not self._header_written:
+            writer.writerow(self.names)
+            self._header_written = True
+        for row in rows:
+            writer.writerow(["" if value is None else value.isoformat() if isinstance(value, datetime) else value
+                             for value in row])
+        return self._compressor.compress(text.getvalue().encode("utf-8"))
+
+    def finish(self) -> bytes:
+        head = self.encode([]) if not self._header_written else b""
+        return head + self._compressor.flush()
+
+
+class _Drain(io.RawIOBase):
+    """Write-only sink that hands out what pyarrow wrote since the last take()."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        chunk = bytes(data)
+        self._chunks.append(chunk)
+        self._position += len(chunk)
+        return len(chunk)
+
+    def tell(self) -> int:
+        return self._position
+
+    def take(self) -> bytes:
+        data, self._chunks = b"".join(self._chunks), []
+        return data
+
+
+class _ArrowEncoder:
+    def __init__(self, export: ExportQuery, file_format: str):
+        import pyarrow as pa
+
+        self._pa = pa
+        self.names = export.names
+        self.schema = pa.schema([pa.field(column.name, self._arrow_type(column.type)) for column in export.columns])
+        self._sink = _Drain()
+        if file_format == PARQUET:
+            import pyarrow.parquet as pq
+            self._writer = pq.ParquetWriter(self._sink, self.schema, compression="zstd")
+            self._write = self._writer.write_table
+            self._wrap = lambda batch: pa.Table.from_batches([batch])
+        else:
+            self._writer = pa.ipc.new_stream(self._sink, self.schema)
+            self._write = self._writer.write_batch
+            self._wrap = lambda batch: batch
+
+    def _arrow_type(self, column_type):
+        pa = self._pa
+        if isinstance(column_type, Boolean):
+            return pa.bool_()
+        if isinstance(column_type, Integer):
+            return pa.int64()
+        if isinstance(column_type, Float):
+            return pa.float64()
+        if isinstance(column_type, DateTime):
+            return pa.timestamp("us", tz="UTC" if column_type.timezone else None)
+        if isinstance(column_type, String):
+            return pa.string()
+        return pa.string()
+
+    def encode(self, rows: List[tuple]) -> bytes:
+        if not rows:
+            return b""
+        # Filas -> columnas; cada lote es un row group (Parquet) o un record batch (IPC)
+        columns = list(zip(*rows))
+        arrays = [self._pa.array(values, type=field.type) for values, field in zip(columns, self.schema)]
+        self._write(self._wrap(self._pa.RecordBatch.from_arrays(arrays, schema=self.schema)))
+        return self._sink.take()
+
+    def finish(self) -> bytes:
+        self._writer.close()
+        return self._sink.take()
+
+
+def make_encoder(export: ExportQuery, file_format: str):
+    if file_format == CSV_GZ:
+        return _CsvGzEncoder(export)
+    if not arrow_available():
+        raise ExportUnavailable(f"Format '{file_format}' requires the 'pyarrow' package")
+    return _ArrowEncoder(export, file_format)
+
+
+async def export_stream(export: ExportQuery, file_format: str, batch_rows: Optional[int] = None) -> AsyncIterator[bytes]:
+    """
+    Encoded bytes of the whole export. Encoding runs in a thread so large
+    batches do not stall the event loop.
+    """
+    batch_rows = batch_rows or env_settings.export_batch_rows
+    encoder = make_encoder(export, file_format)
+    started = time.perf_counter()
+    total = 0
+
+    async for rows in stream_batches(export, batch_rows):
+        total += len(rows)
+        chunk = await asyncio.to_thread(encoder.encode, rows)
+        if chunk:
+            yield chunk
+
+    tail = await asyncio.to_thread(encoder.finish)
+    if tail:
+        yield tail
+
+    logger.info("dataset_exported dataset=%s format=%s rows=%d duration_ms=%.1f",
+                export.dataset, file_format, total, (time.perf_counter() - started) * 1000)
+
+
+def export_filename(dataset: str, file_format: str, when: Optional[datetime] = None) -> str:
+    when = when or datetime.now()
+    return f"{dataset}_{when.strftime('%Y%m%d_%H%M%S')}.{FORMATS[file_format][1]}"
+
+
+def media_type(file_format: str) -> str:
+    return FORMATS[file_format][0]
+
+
+def available_formats() -> Dict[str, bool]:
+    arrow = arrow_available()
+    return {file_format: file_format not in ARROW_FORMATS or arrow for file_format in FORMATS}
@@ -0,0 +1,203 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+from sqlalchemy import select, update
+from src.db.database import AsyncSessionLocal
+from src.models.sql_models import RunePriceModel
+from src.services.price_snapshot import price_snapshots, notify_image_change
+from src.services.upstream import upstream, DOFUSDUDE_API_BASE_URL, BULK
+from src.settings.config import env_settings
+
+logger = logging.getLogger(__name__)
+
+class ImageSearchError(Exception):
+    """dofusdu.de could not be asked (network error or non-200 status)."""
+
+
+async def buscar_y_obtener_imagen(nombre_runa: str, lang: str = "es"):
+    try:
+        return await search_rune_image(nombre_runa, lang)
+    except ImageSearchError as e:
+        logger.warning("image_search_error rune=%r error=%s", nombre_runa, e)
+        return None
+
+
+async def search_rune_image(nombre_runa: str, lang: str = "es") -> Optional[str]:
+    """
+    Like buscar_y_obtener_imagen, but upstream failures raise
+    ImageSearchError instead of looking like "no image found".
+    """
+    logger.debug("image_search lang=%s rune=%r", lang, nombre_runa)
+
+    url = f"{DOFUSDUDE_API_BASE_URL}/{lang}/items/resources/search"
+    params = {
+        "query": nombre_runa,
+        "filter[min_level]": 1,
+        "filter[max_level]": 200,
+        "limit": 8
+    }
+
+    try:
+        response = await upstream.get(url, endpoint="image.search", params=params, timeout=10.0, priority=BULK)
+    except Exception as e:
+        raise ImageSearchError(str(e) or type(e).__name__) from e
+
+    if response.status_code != 200:
+        raise ImageSearchError(f"status {response.status_code}")
+
+    try:
+        resultados = response.json()
+
+        if not resultados:
+            logger.info("image_search_empty rune=%r", nombre_runa)
+            return None
+
+        # --- MODIFICATION: Filter for actual runes ---
+        # The API search can be fuzzy. We need to ensure we're getting a rune.
+        runa_keyword = "rune" if lang != "es" else "runa"
+        
+        mejor_coincidencia = None
+        
+        # 1. Prioritize exact match (case-insensitive)
+        for item in resultados:
+            if item.get("name", "").lower() == nombre_runa.lower():
+                mejor_coincidencia = item
+                break
+        
+        # 2. If no exact match, find the first result that looks like a rune
+        if not mejor_coincidencia:
+            for item in resultados:
+                if runa_keyword in item.get("name", "").lower():
+                    mejor_coincidencia = item
+                    break # Take the first likely candidate
+        
+        # 3. If no likely candidate was found, we discard the search result
+        #    to avoid showing a wrong item (e.g. a hat instead of a rune).
+        if not mejor_coincidencia:
+            logger.info("image_search_no_rune rune=%r first_result=%r", nombre_runa, resultados[0].get('name', 'N/A'))
+            return None
+
+        imagenes = mejor_coincidencia.get("image_urls", {})
+        return imagenes.get("icon") or imagenes.get("sd")
+
+    except Exception as e:
+        raise ImageSearchError(str(e) or type(e).__name__) from e
+
+
+class RuneImageStore:
+    """
+    Bounded LRU of rune image URLs keyed by the canonical (Spanish) rune name.
+
+    Reads never touch the network: a miss returns None and schedules a
+    background lookup whose result is persisted to RunePriceModel.image_url,
+    so the next process start can warm from the database. URLs written by
+    any worker reach every store through price_snapshots.on_image.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float, negative_ttl_seconds: float, fetch_concurrency: int):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[Optional[str], float]]" = OrderedDict()
+        self._pending = set()
+        self._tasks = set()
+        self._fetch_sem = asyncio.Semaphore(fetch_concurrency)
+        price_snapshots.on_image(self.put)
+
+    def put(self, rune_name: str, url: Optional[str]):
+        ttl = self.ttl_seconds if url else self.negative_ttl_seconds
+        self._entries[rune_name] = (url, time.monotonic() + ttl)
+        self._entries.move_to_end(rune_name)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, rune_name: str) -> Optional[str]:
+        """
+        Returns the cached URL (even if stale) and refreshes in the background
+        when the entry is missing or expired. Expects the Spanish rune name.
+        """
+        entry = self._entries.get(rune_name)
+        if entry is None:
+            self._schedule_fetch(rune_name)
+            return None
+
+        url, expires_at = entry
+        self._entries.move_to_end(rune_name)
+        if expires_at < time.monotonic():
+            self._schedule_fetch(rune_name)
+        return url
+
+    def get_many(self, rune_names: Iterable[str]) -> Dict[str, Optional[str]]:
+        return {name: self.get(name) for name in rune_names}
+
+    def _schedule_fetch(self, rune_name: str):
+        if rune_name in self._pending:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # Sin event loop (scripts): solo se sirve lo que haya en caché
+
+        self._pending.add(rune_name)
+        task = loop.create_task(self._fetch(rune_name))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _fetch(self, rune_name: str):
+        try:
+            async with self._fetch_sem:
+                # Search in Spanish for consistency with sync-images
+                url = await search_rune_image(rune_name, lang="es")
+            # None es un "no encontrado" real: queda en caché negativo
+            self.put(rune_name, url)
+            if url:
+                await self._persist(rune_name, url)
+        except ImageSearchError as e:
+            # dofusdu.de falló: se conserva la entrada que hubiera y se reintenta en el próximo get
+            logger.warning("image_search_error rune=%r error=%s", rune_name, e)
+        except Exception as e:
+            logger.warning("image_refresh_error rune=%r error=%s", rune_name, e)
+        finally:
+            self._pending.discard(rune_name)
+
+    async def _persist(self, rune_name: str, url: str):
+        # Images are the same on every server: fill every row that lacks it or has an older one
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                update(RunePriceModel)
+                .where(RunePriceModel.rune_name == rune_name, RunePriceModel.image_url.is_distinct_from(url))
+                .values(image_url=url)
+            )
+            if result.rowcount:
+                await notify_image_change(db, rune_name, url)
+            await db.commit()
+        if result.rowcount:
+            price_snapshots.apply_image(rune_name, url)
+
+    async def warm_from_db(self):
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(RunePriceModel.rune_name, RunePriceModel.image_url)
+                .where(RunePriceModel.image_url.isnot(None))
+            )
+            rows = result.all()
+
+        for rune_name, url in rows:
+            self.put(rune_name, url)
+        logger.info("image_store_warmed entries=%d", len(self._entries))
+
+    async def close(self):
+        for task in list(self._tasks):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+rune_image_store = RuneImageStore(
+    max_entries=env_settings.image_cache_max_entries,
+    ttl_seconds=env_settings.image_cache_ttl_seconds,
+    negative_ttl_seconds=env_settings.image_cache_negative_ttl_seconds,
+    fetch_concurrency=env_settings.image_fetch_concurrency,
+)
@@ -0,0 +1,253 @@
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import time
+import uuid
+from typing import Dict, Iterable, Optional
+import asyncpg
+from sqlalchemy import text, update
+from src.db.database import AsyncSessionLocal
+from src.models.sql_models import RunePriceModel
+from src.services.calculator import LOCALIZATION
+from src.services.image_store import ImageSearchError, search_rune_image, rune_image_store
+from src.services.price_snapshot import price_snapshots, notify_image_change
+from src.settings.config import env_settings
+
+logger = logging.getLogger(__name__)
+
+# Resultado por runa
+PENDING = "pending"
+UPDATED = "updated"
+UNCHANGED = "unchanged"
+NOT_FOUND = "not_found"
+FAILED = "failed"
+
+DONE_OUTCOMES = {UPDATED, UNCHANGED, NOT_FOUND}
+
+# Clave de pg_try_advisory_lock (de sesión, el job dura minutos): un solo job a la vez entre workers
+IMAGE_SYNC_LOCK_KEY = 0x696d6773
+
+
+class RuneImageSyncJob:
+    """
+    Re-fetches the image of every rune in the background and writes it to
+    every server's row at once (images do not depend on the server).
+
+    Runes are fetched concurrently up to image_sync_concurrency. The outcome
+    of each rune is saved to image_sync_state_file as it lands, so a job that
+    failed or was interrupted by a restart resumes with the runes that are
+    not done yet.
+
+    Only one worker runs the job: it holds a session advisory lock on a
+    dedicated connection until the job ends. The state file is shared, so
+    any worker reports the same status, and every image written is
+    NOTIFYed so all workers refresh their image store and rune snapshots.
+    """
+
+    def __init__(self, state_file: str, concurrency: int, dsn: str):
+        self.state_file = state_file
+        self.concurrency = concurrency
+        self.dsn = dsn
+        self._task: Optional[asyncio.Task] = None
+        self._state: dict = {}
+        # Un solo guardado a la vez, en orden: ninguna copia vieja pisa una más nueva
+        self._save_lock = asyncio.Lock()
+
+    # --- Estado ---
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def status(self) -> dict:
+        if self.running:
+            state, status = self._state, "running"
+        else:
+            # El job puede estar corriendo en otro worker: se lee el archivo compartido
+            state = await asyncio.to_thread(self._read_state)
+            status = state.get("status", "idle")
+            if status == "running" and not await self._locked_elsewhere():
+                status = "interrupted"  # Murió con su proceso
+
+        outcomes = state.get("runes", {})
+        counts: Dict[str, int] = {}
+        for outcome in outcomes.values():
+            counts[outcome["status"]] = counts.get(outcome["status"], 0) + 1
+        return {
+            "job_id": state.get("job_id"),
+            "status": status,
+            "started_at": state.get("started_at"),
+            "finished_at": state.get("finished_at"),
+            "counts": counts,
+            "runes": outcomes,
+        }
+
+    async def _locked_elsewhere(self) -> bool:
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                text("SELECT EXISTS (SELECT 1 FROM pg_locks WHERE locktype = 'advisory' AND objid = :key AND granted)"),
+                {"key": IMAGE_SYNC_LOCK_KEY}
+            )
+            return bool(result.scalar())
+
+    def _read_state(self) -> dict:
+        if not os.path.exists(self.state_file):
+            return {}
+        try:
+            with open(self.state_file, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (json.JSONDecodeError, OSError) as e:
+            logger.warning("image_sync_state_unreadable path=%s error=%s", self.state_file, e)
+            return {}
+
+    def _write_state(self, state: dict):
+        directory = os.path.dirname(self.state_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Temporal propio por escritura, en el mismo directorio para que os.replace sea atómico
+        with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=directory or ".", delete=False,
+                                         prefix=f"{os.path.basename(self.state_file)}.", suffix=".tmp") as f:
+            json.dump(state, f, ensure_ascii=False)
+        try:
+            os.replace(f.name, self.state_file)
+        except OSError:
+            os.unlink(f.name)
+            raise
+
+    async def _save(self):
+        async with self._save_lock:
+            # Copia: el hilo serializa mientras otras runas siguen escribiendo en el dict
+            state = json.loads(json.dumps(self._state))
+            try:
+                await asyncio.to_thread(self._write_state, state)
+            except OSError as e:
+                # El job sigue: el próximo guardado vuelve a escribir todo el estado
+                logger.warning("image_sync_state_write_failed path=%s error=%s", self.state_file, e)
+
+    # --- Ejecución ---
+
+    async def start(self, resume: bool = True) -> dict:
+        """
+        Starts a job in the background. With resume, a job that did not
+        finish cleanly continues with its pending and failed runes; a finished
+        one (or resume=False) starts over with every rune. Returns
+        already_running when this or another worker is running one.
+        """
+        if self.running:
+            return {"status": "already_running", "job_id": self._state.get("job_id")}
+
+        connection = await asyncpg.connect(self.dsn)
+        try:
+            locked = await connection.fetchval("SELECT pg_try_advisory_lock($1)", IMAGE_SYNC_LOCK_KEY)
+        except Exception:
+            await connection.close()
+            raise
+        state = await asyncio.to_thread(self._read_state)
+        if not locked:
+            await connection.close()
+            return {"status": "already_running", "job_id": state.get("job_id")}
+
+        # Con el lock tomado, un job "running" en disco es uno que murió con su proceso
+        if state.get("status") == "running":
+            state["status"] = "interrupted"
+        rune_names = sorted(LOCALIZATION.rune_names_es)
+        previous = state.get("runes", {})
+        resumable = resume and state.get("status") in {"failed", "interrupted"}
+
+        if resumable:
+            runes = {name: previous.get(name, {"status": PENDING}) for name in rune_names}
+            todo = [name for name, outcome in runes.items() if outcome["status"] not in DONE_OUTCOMES]
+        else:
+            runes = {name: {"status": PENDING} for name in rune_names}
+            todo = rune_names
+
+        self._state = {
+            "job_id": state.get("job_id") if resumable else uuid.uuid4().hex[:12],
+            "status": "running",
+            "started_at": time.time(),
+            "finished_at": None,
+            "runes": runes,
+        }
+        self._task = asyncio.create_task(self._run(todo, connection))
+        logger.info("image_sync_started job_id=%s runes=%d resumed=%s", self._state["job_id"], len(todo), resumable)
+        return {"status": "resumed" if resumable else "started", "job_id": self._state["job_id"], "runes": len(todo)}
+
+    async def _run(self, rune_names: Iterable[str], lock_connection: asyncpg.Connection):
+        started = time.perf_counter()
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def sync_one(rune_name: str):
+            async with semaphore:
+                self._state["runes"][rune_name] = await self._sync_rune(rune_name)
+            await self._save()
+
+        status = "failed"
+        try:
+            await self._save()
+            await asyncio.gather(*(sync_one(name) for name in rune_names))
+            outcomes = self._state["runes"].values()
+            status = "failed" if any(o["status"] == FAILED for o in outcomes) else "done"
+        except asyncio.CancelledError:
+            status = "interrupted"
+            raise
+        except Exception as e:
+            logger.exception("image_sync_error error=%s", e)
+        finally:
+            self._state["status"] = status
+            self._state["finished_at"] = time.time()
+            try:
+                await asyncio.shield(self._save())
+            finally:
+                # Cerrar la conexión suelta el lock
+                await lock_connection.close()
+            logger.info(
+                "image_sync_finished job_id=%s status=%s duration_s=%.1f",
+                self._state["job_id"], status, time.perf_counter() - started
+            )
+
+    async def _sync_rune(self, rune_name: str) -> dict:
+        try:
+            # Search in Spanish for consistency with the image store
+            url = await search_rune_image(rune_name, lang="es")
+        except ImageSearchError as e:
+            return {"status": FAILED, "error": str(e)}
+
+        if not url:
+            return {"status": NOT_FOUND}
+
+        rune_image_store.put(rune_name, url)
+        try:
+            async with AsyncSessionLocal() as db:
+                result = await db.execute(
+                    update(RunePriceModel)
+                    .where(RunePriceModel.rune_name == rune_name, RunePriceModel.image_url.is_distinct_from(url))
+                    .values(image_url=url)
+                )
+                if result.rowcount:
+                    await notify_image_change(db, rune_name, url)
+                await db.commit()
+        except Exception as e:
+            logger.warning("image_sync_persist_failed rune=%r error=%s", rune_name, e)
+            return {"status": FAILED, "url": url, "error": str(e)}
+
+        if result.rowcount:
+            price_snapshots.apply_image(rune_name, url)
+
+        return {"status": UPDATED if result.rowcount else UNCHANGED, "url": url, "rows": result.rowcount}
+
+    async def close(self):
+        if self.running:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+
+rune_image_sync = RuneImageSyncJob(
+    state_file=env_settings.image_sync_state_file,
+    concurrency=env_settings.image_sync_concurrency,
+    dsn=price_snapshots.dsn,
+)
@@ -0,0 +1,176 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from src.services.profit import ItemProfile
+
+
+class ItemRef:
+    """Lo mínimo para construir un ProfitItem (ver build_profit_item)."""
+
+    __slots__ = ("id", "name", "img", "level")
+
+    def __init__(self, item_id: int, name: str, img: str, level: int):
+        self.id = item_id
+        self.name = name
+        self.img = img
+        self.level = level
+
+
+def _csr_gather(ptr: np.ndarray, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Entry indices of the given CSR rows and, for each entry, its position in rows."""
+    starts = ptr[rows]
+    lengths = ptr[rows + 1] - starts
+    owner = np.repeat(np.arange(len(rows)), lengths)
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return np.repeat(starts, lengths) + offsets, owner
+
+
+class ItemMatrix:
+    """
+    Structure-of-arrays view of the craftable items of the catalog.
+
+    Everything that does not depend on prices is computed once: level, VR
+    per stat (CSR rows: stat_ptr / stat_rune / stat_vr), total VR, and the
+    recipe (rec_ptr / rec_ing / rec_qty). Rune and ingredient prices are
+    dense vectors indexed by rune_index / ingredient_index, so evaluating
+    every item is a handful of gathers and bincounts.
+
+    Sums keep the per-item stat order of evaluate_profile, so results are
+    bit-identical to the scalar path.
+    """
+
+    def __init__(self, profiles: Iterable[ItemProfile], type_slugs: Iterable[str], is_backpack: Iterable[bool]):
+        self.refs: List[ItemRef] = []
+        self.rune_names: List[str] = []
+        self.rune_index: Dict[str, int] = {}
+        self.ingredient_ids: List[int] = []
+        self.ingredient_index: Dict[int, int] = {}
+        self.type_names: List[str] = []
+        type_index: Dict[str, int] = {}
+
+        levels, types, backpacks, total_vr, high_value = [], [], [], [], []
+        # Tipo canónico por ítem, para el modelo de coeficientes
+        self.type_label: List[str] = []
+        stat_ptr, stat_rune, stat_vr, stat_weight, stat_pods = [0], [], [], [], []
+        rec_ptr, rec_ing, rec_qty = [0], [], []
+
+        for profile, type_slug, backpack in zip(profiles, type_slugs, is_backpack):
+            self.refs.append(ItemRef(profile.id, profile.name, profile.img, profile.level))
+            levels.append(profile.level)
+            types.append(type_index.setdefault(type_slug, len(type_index)))
+            backpacks.append(backpack)
+            total_vr.append(profile.total_vr)
+            high_value.append(profile.high_value)
+            self.type_label.append(profile.type_name)
+
+            for name, vr, rune_name, rune_weight in profile.stats:
+                stat_rune.append(self.rune_index.setdefault(rune_name, len(self.rune_index)))
+                stat_vr.append(vr)
+                stat_weight.append(rune_weight)
+                stat_pods.append(name == "Pods")
+            stat_ptr.append(len(stat_vr))
+
+            for ing_id, qty in profile.recipe:
+                rec_ing.append(self.ingredient_index.setdefault(ing_id, len(self.ingredient_index)))
+                rec_qty.append(qty)
+            rec_ptr.append(len(rec_ing))
+
+        self.rune_names = list(self.rune_index)
+        self.ingredient_ids = list(self.ingredient_index)
+        self.type_names = list(type_index)
+        self.type_index = type_index
+
+        self.n_items = len(self.refs)
+        self.item_ids = np.array([ref.id for ref in self.refs], dtype=np.int64)
+        self.row_of: Dict[int, int] = {ref.id: i for i, ref in enumerate(self.refs)}
+        self.level = np.array(levels, dtype=np.int32)
+        self.item_type = np.array(types, dtype=np.int32)
+        self.is_backpack = np.array(backpacks, dtype=bool)
+        self.total_vr = np.array(total_vr, dtype=np.float64)
+        self.high_value = np.array(high_value, dtype=bool)
+
+        self.stat_ptr = np.array(stat_ptr, dtype=np.int64)
+        self.stat_rune = np.array(stat_rune, dtype=np.int32)
+        self.stat_vr = np.array(stat_vr, dtype=np.float64)
+        self.stat_weight = np.array(stat_weight, dtype=np.float64)
+        self.stat_pods = np.array(stat_pods, dtype=bool)
+        # Yield per stat en modo normal y focus: solo dependen del ítem
+        self.stat_yield = self.stat_vr / self.stat_weight
+        self.stat_owner = np.repeat(np.arange(self.n_items), np.diff(self.stat_ptr))
+        focus_vr = self.stat_vr + (0.5 * (self.total_vr[self.stat_owner] - self.stat_vr))
+        focus_vr = np.where(self.stat_pods, focus_vr / 2.5, focus_vr)
+        self.stat_focus_yield = focus_vr / self.stat_weight
+
+        self.rec_ptr = np.array(rec_ptr, dtype=np.int64)
+        self.rec_ing = np.array(rec_ing, dtype=np.int32)
+        self.rec_qty = np.array(rec_qty, dtype=np.float64)
+        self.recipe_size = np.diff(self.rec_ptr)
+
+        # Índices inversos runa -> filas e ingrediente -> filas
+        self._rows_by_rune = self._invert(self.stat_rune, self.stat_owner, len(self.rune_names))
+        rec_owner = np.repeat(np.arange(self.n_items), np.diff(self.rec_ptr))
+        self._rows_by_ingredient = self._invert(self.rec_ing, rec_owner, len(self.ingredient_ids))
+
+    @staticmethod
+    def _invert(columns: np.ndarray, owners: np.ndarray, n_columns: int) -> List[np.ndarray]:
+        order = np.argsort(columns, kind="stable")
+        bounds = np.searchsorted(columns[order], np.arange(n_columns + 1))
+        return [np.unique(owners[order[bounds[c]:bounds[c + 1]]]) for c in range(n_columns)]
+
+    # --- Vectores de precios ---
+
+    def rune_price_vector(self, rune_prices: Dict[str, int]) -> np.ndarray:
+        return np.array([rune_prices.get(name, 0) for name in self.rune_names], dtype=np.float64)
+
+    def ingredient_price_vector(self, ing_prices: Dict[int, int]) -> np.ndarray:
+        return np.array([ing_prices.get(ing_id, 0) for ing_id in self.ingredient_ids], dtype=np.float64)
+
+    def coefficient_vector(self, coef_map: Dict[int, float]) -> Tuple[np.ndarray, np.ndarray]:
+        """(coefficients, measured): items with no history get 100 and measured False."""
+        coef = np.array([coef_map.get(ref.id, 100) for ref in self.refs], dtype=np.float64)
+        measured = np.array([ref.id in coef_map for ref in self.refs], dtype=bool)
+        return coef, measured
+
+    def rows_with_rune(self, rune_name: str) -> np.ndarray:
+        column = self.rune_index.get(rune_name)
+        return self._rows_by_rune[column] if column is not None else np.empty(0, dtype=np.int64)
+
+    def rows_with_ingredient(self, ing_id: int) -> np.ndarray:
+        column = self.ingredient_index.get(ing_id)
+        return self._rows_by_ingredient[column] if column is not None else np.empty(0, dtype=np.int64)
+
+    def type_mask(self, types: Iterable[str]) -> np.ndarray:
+        filter_types = {t.lower() for t in types}
+        type_ids = [self.type_index[t] for t in filter_types if t in self.type_index]
+        mask = np.isin(self.item_type, type_ids)
+        if "backpack" in filter_types:
+            mask |= self.is_backpack
+        return mask
+
+    # --- Evaluación ---
+
+    def evaluate(self, rune_vec: np.ndarray, ing_vec: np.ndarray,
+                 rows: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Vectorized evaluate_profile for the given rows (all when None).
+        Returns (craft_cost, value_at_100, valid) aligned with rows.
+        """
+        if rows is None:
+            rows = np.arange(self.n_items)
+        n = len(rows)
+
+        # Craft cost: una suma por ítem de qty * precio, y -1 = no disponible
+        rec_idx, rec_owner = _csr_gather(self.rec_ptr, rows)
+        rec_price = ing_vec[self.rec_ing[rec_idx]]
+        craft_cost = np.bincount(rec_owner, weights=rec_price * self.rec_qty[rec_idx], minlength=n)
+        unavailable = np.bincount(rec_owner, weights=rec_price == -1, minlength=n) > 0
+
+        # Normal: suma de vr / peso * precio; Focus: el mejor stat, nunca por debajo de 0
+        stat_idx, stat_owner = _csr_gather(self.stat_ptr, rows)
+        stat_price = rune_vec[self.stat_rune[stat_idx]]
+        normal_value = np.bincount(stat_owner, weights=self.stat_yield[stat_idx] * stat_price, minlength=n)
+        max_focus_value = np.zeros(n)
+        np.maximum.at(max_focus_value, stat_owner, self.stat_focus_yield[stat_idx] * stat_price)
+
+        value_at_100 = np.maximum(normal_value, max_focus_value)
+        valid = ~unavailable & (craft_cost != 0) & (value_at_100 != 0)
+        return craft_cost, value_at_100, valid
@@ -0,0 +1,161 @@
+import logging
+import re
+from typing import Dict, List, Optional, Tuple
+from src.settings.logging_config import trace_enabled
+
+logger = logging.getLogger(__name__)
+
+REGEX_META_CHARS = set(".^$*+?{}[]\\|()")
+CLEAN_PREFIX_RE = re.compile(r"^[+\-\d\s:]+")
+
+
+class LocalizationIndex:
+    """
+    Lookup tables built once from STAT_MAPS, RUNE_DB and ITEM_TYPE_REGEX_PATTERNS.
+
+    Every lookup is a dict access. Raw effect strings coming from dofusdu.de
+    (e.g. "+50 Strength") are memoized per language after the first
+    resolution, since the scanner sees the same few hundred strings over and
+    over. When a table lists the same name twice, the first entry wins, as it
+    did with the old linear scans.
+    """
+
+    def __init__(self, stat_maps: Dict[str, Dict[str, str]], rune_db: Dict[str, List[dict]],
+                 item_type_patterns: Dict[str, List[Tuple[str, str]]], max_memo_entries: int = 50000):
+        self.stat_maps = stat_maps
+        self.rune_db = rune_db
+        self.max_memo_entries = max_memo_entries
+
+        # Stats: RUNE_DB keys in lower case, for the last fallback
+        self.rune_db_keys_lower: Dict[str, str] = {}
+        for db_key in rune_db:
+            self.rune_db_keys_lower.setdefault(db_key.lower(), db_key)
+
+        # Runes: Spanish name <-> localized names
+        self.rune_names_by_es: Dict[str, Dict[str, str]] = {}
+        self.rune_es_by_lang: Dict[str, Dict[str, str]] = {}
+        for data_list in rune_db.values():
+            for data in data_list:
+                names = data.get("name", {})
+                name_es = names.get("es")
+                if name_es is None:
+                    continue
+                self.rune_names_by_es.setdefault(name_es, names)
+                for lang, name in names.items():
+                    self.rune_es_by_lang.setdefault(lang, {}).setdefault(name, name_es)
+        self.rune_names_es = frozenset(self.rune_names_by_es)
+
+        # Item types: "^hat$" patterns are plain literals, so they become dict keys.
+        # Anything that really needs a regex is kept aside and tried in order.
+        self.item_types: Dict[str, Dict[str, str]] = {}
+        self.item_type_regexes: Dict[str, List[Tuple[re.Pattern, str]]] = {}
+        for lang, patterns in item_type_patterns.items():
+            literals = self.item_types.setdefault(lang, {})
+            regexes = self.item_type_regexes.setdefault(lang, [])
+            for pattern, canonical in patterns:
+                literal = pattern[1:-1] if pattern.startswith("^") and pattern.endswith("$") else None
+                if literal is not None and not REGEX_META_CHARS.intersection(literal):
+                    literals.setdefault(literal.lower(), canonical)
+                else:
+                    regexes.append((re.compile(pattern, re.IGNORECASE), canonical))
+
+        # Memos of already resolved raw strings: (lang, raw) -> result
+        self._stat_memo: Dict[Tuple[str, str], str] = {}
+        self._rune_info_memo: Dict[Tuple[str, str], Optional[dict]] = {}
+
+    def _remember(self, memo: dict, key, value):
+        # Bounded: the universe of raw strings is small, this only guards against garbage input
+        if len(memo) >= self.max_memo_entries:
+            memo.clear()
+        memo[key] = value
+
+    def canonical_stat_name(self, stat_name: str, lang: str = "es") -> str:
+        """
+        Prioridad: Match Exacto > Match Limpio (sin números) > RUNE_DB > Fallback.
+        """
+        if not stat_name:
+            return ""
+
+        key = (lang, stat_name)
+        canonical = self._stat_memo.get(key)
+        if canonical is None:
+            canonical = self._resolve_stat_name(stat_name, lang)
+            self._remember(self._stat_memo, key, canonical)
+        return canonical
+
+    def _resolve_stat_name(self, stat_name: str, lang: str) -> str:
+        canonical, match = self._match_stat_name(stat_name, lang)
+        if trace_enabled():
+            logger.debug("stat_map lang=%s raw=%r match=%s result=%r", lang, stat_name, match, canonical)
+        return canonical
+
+    def _match_stat_name(self, stat_name: str, lang: str) -> Tuple[str, str]:
+        current_map = self.stat_maps.get(lang, {})
+
+        # INTENTO 1: Búsqueda Exacta (Solo strip básico)
+        raw_key = stat_name.strip()
+        if raw_key in current_map:
+            return current_map[raw_key], "direct"
+
+        # INTENTO 2: Búsqueda Limpia ("+50 Strength" -> "Strength")
+        clean_name = CLEAN_PREFIX_RE.sub("", stat_name).strip()
+        if clean_name in current_map:
+            return current_map[clean_name], "clean"
+
+        # FALLBACK: nombre de la base de datos de runas
+        db_key = self.rune_db_keys_lower.get(clean_name.lower())
+        if db_key is not None:
+            return db_key, "rune_db"
+
+        return clean_name, "none"
+
+    def rune_info(self, stat_name: str, lang: str = "es") -> Optional[dict]:
+        """
+        Returns {"name": <localized rune name>, "weight": float} or None.
+        The returned dict is shared between callers and must not be mutated.
+        """
+        key = (lang, stat_name)
+        if key in self._rune_info_memo:
+            return self._rune_info_memo[key]
+
+        info = None
+        canonical_name = self.canonical_stat_name(stat_name, lang)
+        if canonical_name in self.rune_db:
+            rune_data = self.rune_db[canonical_name][0]
+            info = {
+                "name": rune_data["name"].get(lang, rune_data["name"]["es"]),
+                "weight": rune_data["weight"]
+            }
+        self._remember(self._rune_info_memo, key, info)
+        return info
+
+    def canonical_item_type(self, item_type: str, lang: str = "es") -> str:
+        literals = self.item_types.get(lang)
+        if literals is None:
+            return item_type
+
+        item_type_lower = item_type.lower()
+        canonical = literals.get(item_type_lower)
+        if canonical is not None:
+            return canonical
+
+        for pattern, canonical in self.item_type_regexes[lang]:
+            if pattern.search(item_type_lower):
+                return canonical
+        return item_type
+
+    def rune_name_translation(self, rune_name_es: str, target_lang: str = "es") -> str:
+        if target_lang == "es":
+            return rune_name_es
+        names = self.rune_names_by_es.get(rune_name_es)
+        if names is None:
+            return rune_name_es
+        return names.get(target_lang, rune_name_es)
+
+    def canonical_rune_name(self, rune_name: str, lang: str = "es") -> str:
+        if lang == "es":
+            return rune_name
+        return self.rune_es_by_lang.get(lang, {}).get(rune_name, rune_name)
+
+    def is_rune_name_es(self, rune_name: str) -> bool:
+        return rune_name in self.rune_names_es
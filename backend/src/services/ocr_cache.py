@@ -0,0 +1,129 @@
+import copy
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Optional, Tuple
+import cv2
+import numpy as np
+from src.ocr.ocr import recortar_nombre, recortar_precios
+from src.settings.config import env_settings
+
+logger = logging.getLogger(__name__)
+
+# (alto, ancho, dHash del nombre, digest exacto de los precios)
+ScreenshotKey = Tuple[int, int, int, bytes]
+
+# Grilla (ancho, alto) del dHash del nombre
+NAME_HASH_GRID = (64, 8)
+
+
+def dhash(gray: np.ndarray, grid: Tuple[int, int]) -> int:
+    """Difference hash: one bit per horizontally adjacent pixel pair of a (width + 1) x height thumbnail."""
+    width, height = grid
+    if gray.size == 0:
+        return 0
+    thumb = cv2.resize(gray, (width + 1, height), interpolation=cv2.INTER_AREA).astype(np.int16)
+    bits = (thumb[:, 1:] > thumb[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def price_digest(gray: np.ndarray) -> bytes:
+    """Exact digest of the price ROI pixels: any changed digit gives another key."""
+    return hashlib.blake2b(np.ascontiguousarray(gray).tobytes(), digest_size=16).digest()
+
+
+def screenshot_key(image_bytes: bytes) -> Optional[ScreenshotKey]:
+    """
+    Key of a market panel (None when it does not decode): a dHash of the
+    name ROI and an exact digest of the price ROI, since a price a few
+    pixels off is a different price.
+    """
+    img = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_GRAYSCALE)
+    if img is None:
+        return None
+    height, width = img.shape[:2]
+    return height, width, dhash(recortar_nombre(img), NAME_HASH_GRID), price_digest(recortar_precios(img))
+
+
+class OcrResultCache:
+    """
+    Bounded LRU of OCR results keyed by screenshot_key. The price ROI must
+    always match exactly; the name hash may differ by up to max_distance
+    bits (0, the default, only reuses panels that look the same).
+    Errors are never stored. Results are copied in and out, since callers
+    add fields to them.
+    """
+
+    def __init__(self, max_entries: int, max_distance: int):
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        # Solo key() corre en un hilo; lookup/store, en el loop
+        self._entries: "OrderedDict[ScreenshotKey, dict]" = OrderedDict()
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def key(self, image_bytes: bytes) -> Optional[ScreenshotKey]:
+        if not self.enabled:
+            return None
+        try:
+            return screenshot_key(image_bytes)
+        except cv2.error:
+            return None
+
+    def lookup(self, key: Optional[ScreenshotKey]) -> Optional[dict]:
+        if key is None:
+            return None
+        match = key if key in self._entries else self._nearest(key)
+        if match is None:
+            self.misses += 1
+            return None
+        if match == key:
+            self.hits += 1
+        else:
+            self.near_hits += 1
+        self._entries.move_to_end(match)
+        return copy.deepcopy(self._entries[match])
+
+    def _nearest(self, key: ScreenshotKey) -> Optional[ScreenshotKey]:
+        if self.max_distance <= 0:
+            return None
+        height, width, name_hash, prices = key
+        best, best_distance = None, None
+        for candidate in self._entries:
+            if candidate[0] != height or candidate[1] != width or candidate[3] != prices:
+                continue
+            distance = (candidate[2] ^ name_hash).bit_count()
+            if distance <= self.max_distance and (best_distance is None or distance < best_distance):
+                best, best_distance = candidate, distance
+        return best
+
+    def store(self, key: Optional[ScreenshotKey], result: dict):
+        if key is None or "error" in result:
+            return
+        self._entries[key] = copy.deepcopy(result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def snapshot(self) -> dict:
+        lookups = self.hits + self.near_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "max_distance": self.max_distance,
+            "hits": self.hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.near_hits) / lookups, 3) if lookups else 0.0,
+        }
+
+
+ocr_cache = OcrResultCache(
+    max_entries=env_settings.ocr_cache_entries,
+    max_distance=env_settings.ocr_cache_max_distance,
+)
@@ -0,0 +1,300 @@
+import asyncio
+import copy
+import itertools
+import logging
+import multiprocessing
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, List, Optional, Tuple, Union
+from src.services.ocr_cache import ocr_cache
+from src.settings.config import env_settings
+
+logger = logging.getLogger(__name__)
+
+
+class OcrBusy(Exception):
+    """Running and queued OCR jobs are at ocr_workers + ocr_max_queue."""
+
+
+class OcrTimeout(Exception):
+    """The job ran for longer than ocr_timeout_seconds."""
+
+
+# --- Lado del proceso worker ---
+
+# Cola por la que el worker avisa al proceso de la API que empezó un job
+_started = None
+
+
+def _init_worker(started):
+    global _started
+    _started = started
+    # Un hilo de OpenCV por proceso: el paralelismo lo dan los procesos
+    import cv2
+    cv2.setNumThreads(1)
+    # El motor OCR (con tesserocr, el handle y los datos de idioma) se crea una vez por worker
+    from src.ocr.engine import get_engine
+    get_engine()
+
+
+def _ocr_job(image_bytes: bytes, tesseract_timeout: float) -> Tuple[dict, float, str]:
+    from src.ocr.engine import get_engine
+    from src.ocr.ocr import get_ocr_data
+
+    started = time.perf_counter()
+    try:
+        data = get_ocr_data(image_bytes=image_bytes, verbose=False, timeout=tesseract_timeout)
+    except RuntimeError as e:
+        # pytesseract mata el subproceso y lanza RuntimeError al pasar su timeout
+        if "timeout" in str(e).lower():
+            raise OcrTimeout(str(e))
+        raise
+    return data, (time.perf_counter() - started) * 1000, get_engine().name
+
+
+def _run_job(job: Callable, job_id: int, *args):
+    # El timeout corre desde este aviso, no desde que el job entró a la cola
+    _started.put(job_id)
+    return job(*args)
+
+
+class LatencyStats:
+    """Average, max and p95 over the last `window` samples, in ms."""
+
+    def __init__(self, window: int = 500):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self._recent = deque(maxlen=window)
+
+    def record(self, elapsed_ms: float):
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        self._recent.append(elapsed_ms)
+
+    def as_dict(self) -> dict:
+        recent = sorted(self._recent)
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total_ms / self.count, 2) if self.count else 0.0,
+            "p95_ms": round(recent[min(len(recent) - 1, int(len(recent) * 0.95))], 2) if recent else 0.0,
+            "max_ms": round(self.max_ms, 2),
+        }
+
+
+class OcrPool:
+    """
+    Runs get_ocr_data (OpenCV preprocessing + Tesseract) on a dedicated
+    process pool so screenshots never block the event loop.
+
+    At most `workers` jobs run and `max_queue` wait; past that, run()
+    raises OcrBusy right away instead of letting a burst pile up.
+
+    Workers report when they pick a job up, and timeout_seconds counts from
+    there: time spent in the queue does not count. A job that runs longer
+    is abandoned with OcrTimeout and, since tesserocr cannot be
+    interrupted, the pool is replaced and its processes killed. The job
+    stays in `pending` until then. pytesseract also kills Tesseract after
+    the same time.
+    """
+
+    def __init__(self, workers: int, max_queue: int, timeout_seconds: float):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout_seconds = timeout_seconds
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._started = None
+        # job_id -> future que se completa cuando un worker toma el job
+        self._starts: Dict[int, asyncio.Future] = {}
+        self._job_ids = itertools.count()
+        self.pending = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.engine: Optional[str] = None
+        self.wait = LatencyStats()
+        self.run_time = LatencyStats()
+        self.total = LatencyStats()
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: el proceso de la API tiene hilos y conexiones que no deben heredarse con fork
+            context = multiprocessing.get_context("spawn")
+            self._started = context.SimpleQueue()
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=context, initializer=_init_worker, initargs=(self._started,)
+            )
+            threading.Thread(target=self._read_starts, args=(self._started, asyncio.get_running_loop()),
+                             name="ocr-pool-starts", daemon=True).start()
+        return self._pool
+
+    def _read_starts(self, started, loop: asyncio.AbstractEventLoop):
+        while True:
+            job_id = started.get()
+            if job_id is None:
+                return
+            try:
+                loop.call_soon_threadsafe(self._on_start, job_id)
+            except RuntimeError:
+                return  # El loop ya cerró
+
+    def _on_start(self, job_id: int):
+        started = self._starts.get(job_id)
+        if started is not None and not started.done():
+            started.set_result(None)
+
+    def close(self):
+        if self._pool is not None:
+            self._discard(self._pool)
+
+    def _discard(self, pool: ProcessPoolExecutor, terminate: bool = False):
+        """Stops pool; the next job starts a new one. terminate also kills busy workers."""
+        if self._pool is pool:
+            self._pool = None
+            # Detiene el hilo que lee los avisos de este pool
+            self._started.put(None)
+        processes = list((getattr(pool, "_processes", None) or {}).values())
+        pool.shutdown(wait=False, cancel_futures=True)
+        if terminate:
+            # shutdown no interrumpe un job en curso: se matan los procesos y sus futures fallan con BrokenProcessPool
+            for process in processes:
+                process.terminate()
+
+    def _release(self, _future):
+        self.pending -= 1
+
+    def _admit(self, jobs: int = 1):
+        if self.pending + jobs > self.workers + self.max_queue:
+            self.rejected += 1
+            raise OcrBusy()
+
+    async def run(self, image_bytes: bytes) -> dict:
+        """OCR of one image; a screenshot already in ocr_cache skips the pool (and its queue limit)."""
+        key = await asyncio.to_thread(ocr_cache.key, image_bytes) if ocr_cache.enabled else None
+        cached = ocr_cache.lookup(key)
+        if cached is not None:
+            return cached
+
+        self._admit()
+        data = await self._execute(image_bytes)
+        ocr_cache.store(key, data)
+        return data
+
+    async def run_many(self, images: List[bytes]) -> List[Union[dict, Exception]]:
+        """
+        OCR of many images, in order. Cached screenshots are answered right
+        away and identical ones in the batch are processed once. The rest is
+        fed to the pool at most `workers` at a time, so the batch reserves
+        that many places of workers + max_queue up front (OcrBusy when they
+        are not free) and holds them until it ends; single screenshots keep
+        the rest of the queue. A failed image gives its exception in place
+        of the result.
+        """
+        keys = [None] * len(images)
+        if ocr_cache.enabled:
+            keys = await asyncio.to_thread(lambda: [ocr_cache.key(image) for image in images])
+        results: List[Union[dict, Exception, None]] = [ocr_cache.lookup(key) for key in keys]
+
+        # Un job por clave distinta (sin clave, un job por imagen)
+        jobs: dict = {}
+        for i, key in enumerate(keys):
+            if results[i] is None:
+                jobs.setdefault(key if key is not None else ("image", i), []).append(i)
+        if not jobs:
+            return results
+
+        slots = min(len(jobs), self.workers)
+        self._admit(slots)
+        self.pending += slots
+        semaphore = asyncio.Semaphore(slots)
+
+        async def one(indexes: List[int]):
+            async with semaphore:
+                data = await self._execute(images[indexes[0]], reserved=True)
+            ocr_cache.store(keys[indexes[0]], data)
+            return data
+
+        try:
+            outputs = await asyncio.gather(*(one(indexes) for indexes in jobs.values()), return_exceptions=True)
+        finally:
+            self.pending -= slots
+        for indexes, output in zip(jobs.values(), outputs):
+            for position, i in enumerate(indexes):
+                # Cada resultado es un dict propio: la ruta les agrega campos
+                results[i] = output if position == 0 or isinstance(output, BaseException) else copy.deepcopy(output)
+        return results
+
+    async def _execute(self, image_bytes: bytes, reserved: bool = False) -> dict:
+        """reserved: the caller already counts this job in pending (run_many)."""
+        pool = self.pool
+        job_id = next(self._job_ids)
+        started = self._starts[job_id] = asyncio.get_running_loop().create_future()
+        submitted = time.perf_counter()
+        try:
+            future = pool.submit(_run_job, _ocr_job, job_id, image_bytes, self.timeout_seconds)
+        except BrokenProcessPool:
+            self._starts.pop(job_id, None)
+            self.errors += 1
+            self._discard(pool)
+            raise
+        waiter = asyncio.wrap_future(future)
+        if not reserved:
+            # pending baja cuando el worker termina de verdad, no cuando se deja de esperar
+            self.pending += 1
+            waiter.add_done_callback(self._release)
+        try:
+            # En la cola no hay límite de tiempo: la admisión ya acota cuántos esperan
+            await asyncio.wait([started, waiter], return_when=asyncio.FIRST_COMPLETED)
+            data, run_ms, self.engine = await asyncio.wait_for(asyncio.shield(waiter), timeout=self.timeout_seconds)
+        except asyncio.TimeoutError:
+            # Corrió de más y no se puede interrumpir: se cambia de pool
+            self.timeouts += 1
+            logger.warning("ocr_pool_recycled reason=timeout workers=%d", self.workers)
+            self._discard(pool, terminate=True)
+            raise OcrTimeout()
+        except OcrTimeout:
+            self.timeouts += 1
+            raise
+        except BrokenProcessPool:
+            # Un worker murió (p. ej. OOM): el pool se rehace en el próximo job
+            self.errors += 1
+            self._discard(pool)
+            raise
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self._starts.pop(job_id, None)
+
+        total_ms = (time.perf_counter() - submitted) * 1000
+        self.run_time.record(run_ms)
+        self.wait.record(max(total_ms - run_ms, 0.0))
+        self.total.record(total_ms)
+        return data
+
+    def snapshot(self) -> dict:
+        return {
+            "workers": self.workers,
+            "engine": self.engine,
+            "max_queue": self.max_queue,
+            "pending": self.pending,
+            "queued": max(self.pending - self.workers, 0),
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "errors": self.errors,
+            "wait": self.wait.as_dict(),
+            "run": self.run_time.as_dict(),
+            "total": self.total.as_dict(),
+        }
+
+
+ocr_pool = OcrPool(
+    workers=env_settings.ocr_workers,
+    max_queue=env_settings.ocr_max_queue,
+    timeout_seconds=env_settings.ocr_timeout_seconds,
+)
@@ -0,0 +1,260 @@
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional
+import numpy as np
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.models.schemas import PaginatedProfitResponse
+from src.services.catalog import catalog
+from src.services.coefficient_model import coefficient_predictor
+from src.services.item_matrix import ItemMatrix
+from src.services.scan_executor import scan_executor
+from src.services.profit import (
+    ItemProfile, build_profit_item, select_page_arrays, page_response, load_latest_coefficients
+)
+from src.services.price_snapshot import price_snapshots, price_diff
+
+logger = logging.getLogger(__name__)
+
+
+class ServerOpportunities:
+    """
+    Profit figures of one server as arrays aligned with the ItemMatrix rows:
+    price vectors, latest coefficients, and per item craft cost, value at
+    100%, min coefficient and profit. Price changes re-evaluate only the
+    rows that use the rune or ingredient.
+
+    Items with no coefficient history use the coefficient model; their
+    prediction is redone with the rows (it depends on cost and value) and
+    for every row when a new model is loaded.
+    """
+
+    def __init__(self, server: str, matrix: ItemMatrix,
+                 ing_prices: Dict[int, int], rune_prices: Dict[str, int], coef_map: Dict[int, float]):
+        self.server = server
+        self.matrix = matrix
+        self.rune_vec = matrix.rune_price_vector(rune_prices)
+        self.ing_vec = matrix.ingredient_price_vector(ing_prices)
+        self.coef, self.measured = matrix.coefficient_vector(coef_map)
+        self.model_version = None
+
+        n = matrix.n_items
+        self.craft_cost = np.zeros(n)
+        self.value_at_100 = np.zeros(n)
+        self.valid = np.zeros(n, dtype=bool)
+        self.min_coefficient = np.zeros(n)
+        self.profit = np.zeros(n)
+        self.recompute()
+
+    def recompute(self, rows: Optional[np.ndarray] = None) -> int:
+        if rows is None:
+            rows = np.arange(self.matrix.n_items)
+        if not len(rows):
+            return 0
+
+        craft_cost, value_at_100, valid = self.matrix.evaluate(self.rune_vec, self.ing_vec, rows)
+        self.craft_cost[rows] = craft_cost
+        self.value_at_100[rows] = value_at_100
+        self.valid[rows] = valid
+        self.predict_coefficients(rows)
+        self.update_metrics(rows)
+        return len(rows)
+
+    def predict_coefficients(self, rows: np.ndarray):
+        matrix = self.matrix
+        rows = rows[~self.measured[rows]]
+        if len(rows):
+            self.coef[rows] = coefficient_predictor.predict(
+                self.craft_cost[rows], self.value_at_100[rows], matrix.level[rows], matrix.recipe_size[rows],
+                matrix.high_value[rows], [matrix.type_label[i] for i in rows], self.server
+            )
+        self.model_version = coefficient_predictor.version
+
+    def refresh_predictions(self):
+        """Re-predicts every row without history if the model changed since the last prediction."""
+        coefficient_predictor.current()
+        if self.model_version != coefficient_predictor.version:
+            rows = np.arange(self.matrix.n_items)
+            self.predict_coefficients(rows)
+            self.update_metrics(rows)
+
+    def update_metrics(self, rows: np.ndarray):
+        # Mismos redondeos que profit_metrics
+        craft_cost = self.craft_cost[rows]
+        value_at_100 = np.where(self.valid[rows], self.value_at_100[rows], 1.0)
+        real_rune_value = np.round(value_at_100 * (self.coef[rows] / 100.0), 2)
+        self.min_coefficient[rows] = np.round((craft_cost / value_at_100) * 100, 2)
+        self.profit[rows] = real_rune_value - np.round(craft_cost, 2)
+
+    @property
+    def rows(self) -> int:
+        return int(self.valid.sum())
+
+    def query(self, types: List[str], min_level: int, max_level: int, min_profit: int, min_craft_cost: int,
+              page: int, limit: int, sort_by: str, sort_order: str, cursor: Optional[str] = None) -> PaginatedProfitResponse:
+        matrix = self.matrix
+        mask = (
+            self.valid
+            & matrix.type_mask(types)
+            & (matrix.level >= min_level) & (matrix.level <= max_level)
+            & (self.craft_cost >= min_craft_cost)
+            & (self.profit >= min_profit)
+        )
+        values = self.min_coefficient if sort_by == 'risk' else self.profit
+        selected, total, next_cursor = select_page_arrays(
+            values, matrix.item_ids, mask, sort_by, sort_order, page, limit, cursor
+        )
+
+        has_model = coefficient_predictor.current() is not None
+        items = [
+            build_profit_item(matrix.refs[i], float(self.craft_cost[i]), float(self.value_at_100[i]), float(self.coef[i]),
+                              predicted=has_model and not self.measured[i])
+            for i in selected
+        ]
+        return page_response(items, total, page, limit, next_cursor)
+
+
+class OpportunityTable:
+    """
+    Precomputed /items/profit/best per server, built from the local catalog.
+
+    The catalog is compiled once into an ItemMatrix (VR, yields and recipes
+    as arrays); each server only adds price vectors. Rune and ingredient
+    price updates (published by price_snapshots, from any worker) only
+    re-evaluate the rows that use them, and saved coefficients only their
+    item's row. Everything is dropped when the catalog is re-indexed and
+    rebuilt on the next read. While price_snapshots is not listening, tables
+    are built for the request and not kept.
+    """
+
+    def __init__(self):
+        self._matrix: Optional[ItemMatrix] = None
+        self._catalog_version: Optional[int] = None
+        self._servers: Dict[str, ServerOpportunities] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        price_snapshots.on_change(self.apply_price_changes)
+        price_snapshots.on_coefficient(self.update_coefficient)
+
+    @property
+    def available(self) -> bool:
+        return catalog.can_filter_equipment("es")
+
+    def _build_matrix(self) -> ItemMatrix:
+        profiles, type_slugs, backpacks = [], [], []
+        for item in catalog.equipment("es"):
+            profile = ItemProfile(item)
+            if not profile.id or not profile.is_candidate:
+                continue
+            profiles.append(profile)
+            type_slugs.append(catalog.type_slug(item))
+            backpacks.append(catalog.is_backpack(item))
+        return ItemMatrix(profiles, type_slugs, backpacks)
+
+    async def _ensure_matrix(self) -> ItemMatrix:
+        version = catalog.version
+        if self._matrix is None or self._catalog_version != version:
+            started = time.perf_counter()
+            matrix = await scan_executor.run(self._build_matrix)
+            self._matrix, self._catalog_version = matrix, version
+            self._servers.clear()
+            logger.info(
+                "opportunities_indexed items=%d runes=%d ingredients=%d duration_ms=%.1f",
+                matrix.n_items, len(matrix.rune_names), len(matrix.ingredient_ids), (time.perf_counter() - started) * 1000
+            )
+        return self._matrix
+
+    async def get(self, server: str, db: AsyncSession) -> ServerOpportunities:
+        table = self._servers.get(server)
+        if table is not None and self._catalog_version == catalog.version:
+            table.refresh_predictions()
+            return table
+
+        lock = self._locks.setdefault(server, asyncio.Lock())
+        async with lock:
+            matrix = await self._ensure_matrix()
+            table = self._servers.get(server)
+            if table is None:
+                started = time.perf_counter()
+                prices = await price_snapshots.get(db, server)
+                coef_map = await load_latest_coefficients(db, server)
+                async with scan_executor.slot():
+                    table = await scan_executor.run(
+                        ServerOpportunities, server, matrix, prices.ing_prices, prices.rune_prices, coef_map
+                    )
+                if not price_snapshots.listening:
+                    # No llegarían los cambios de otros workers: se sirve sin guardarla
+                    return table
+                self._servers[server] = table
+
+                # Cambios publicados mientras se construía la tabla
+                latest = await price_snapshots.get(db, server)
+                if latest is not prices:
+                    self.update_rune_prices(server, price_diff(prices.rune_prices, latest.rune_prices))
+                    self.update_ingredient_prices(server, price_diff(prices.ing_prices, latest.ing_prices))
+                logger.info(
+                    "opportunities_built server=%s rows=%d duration_ms=%.1f",
+                    server, table.rows, (time.perf_counter() - started) * 1000
+                )
+        return table
+
+    async def query(self, server: str, db: AsyncSession, types: List[str], min_level: int, max_level: int,
+                    min_profit: int, min_craft_cost: int, page: int, limit: int, sort_by: str, sort_order: str,
+                    cursor: Optional[str] = None) -> PaginatedProfitResponse:
+        table = await self.get(server, db)
+        return table.query(types, min_level, max_level, min_profit, min_craft_cost, page, limit, sort_by, sort_order, cursor)
+
+    # --- Actualizaciones incrementales (no-op si el servidor aún no está construido) ---
+
+    def apply_price_changes(self, server: Optional[str], runes: Optional[Dict[str, int]],
+                            ingredients: Optional[Dict[int, int]]):
+        """price_snapshots listener. Unknown changes (None) drop the server's table."""
+        if runes is None or ingredients is None:
+            if server is None:
+                self._servers.clear()
+            else:
+                self._servers.pop(server, None)
+            return
+        if runes:
+            self.update_rune_prices(server, runes)
+        if ingredients:
+            self.update_ingredient_prices(server, ingredients)
+
+    def update_rune_prices(self, server: str, prices: Dict[str, int]):
+        table = self._servers.get(server)
+        if table is None:
+            return
+        affected = []
+        for rune_name, price in prices.items():
+            column = table.matrix.rune_index.get(rune_name)
+            if column is None or table.rune_vec[column] == price:
+                continue
+            table.rune_vec[column] = price
+            affected.append(table.matrix.rows_with_rune(rune_name))
+        changed = table.recompute(np.unique(np.concatenate(affected))) if affected else 0
+        logger.debug("opportunities_runes server=%s runes=%d recomputed=%d", server, len(prices), changed)
+
+    def update_ingredient_prices(self, server: str, prices: Dict[int, int]):
+        table = self._servers.get(server)
+        if table is None:
+            return
+        affected = []
+        for item_id, price in prices.items():
+            column = table.matrix.ingredient_index.get(item_id)
+            if column is None or table.ing_vec[column] == price:
+                continue
+            table.ing_vec[column] = price
+            affected.append(table.matrix.rows_with_ingredient(item_id))
+        changed = table.recompute(np.unique(np.concatenate(affected))) if affected else 0
+        logger.debug("opportunities_ingredients server=%s ingredients=%d recomputed=%d", server, len(prices), changed)
+
+    def update_coefficient(self, server: str, item_id: int, coefficient: float):
+        table = self._servers.get(server)
+        row = table.matrix.row_of.get(item_id) if table is not None else None
+        if row is None:
+            return
+        table.coef[row] = coefficient
+        table.measured[row] = True
+        table.update_metrics(np.array([row]))
+
+
+opportunity_table = OpportunityTable()
@@ -0,0 +1,387 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import select, desc, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from src.db.database import AsyncSessionLocal
+from src.models.schemas import CalculateRequest, ItemStat
+from src.models.sql_models import ItemCoefficientHistoryModel, PredictionDataset
+from src.services.calculator import calculate_profit, get_canonical_stat_name, get_canonical_item_type
+from src.services.catalog import catalog
+from src.services.coefficient_model import HIGH_VALUE_STATS
+from src.services.equipment import get_item_details, parse_item_stats
+from src.services.price_snapshot import price_snapshots
+from src.settings.config import env_settings
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFull(Exception):
+    """The ingestion queue is at prediction_queue_max."""
+
+
+class Submission:
+    """One coefficient report, as received. previous is filled in by the consumer when None."""
+
+    __slots__ = ("item_id", "server", "lang", "coefficient", "craft_cost", "rune_value", "profit", "saved",
+                 "received_at", "previous")
+
+    def __init__(self, item_id: int, server: str, lang: str, coefficient: float, craft_cost: int, rune_value: int,
+                 profit: int, saved: bool, previous: Optional[Tuple[Optional[float], float]] = None):
+        self.item_id = item_id
+        self.server = server
+        self.lang = lang
+        self.coefficient = coefficient
+        self.craft_cost = craft_cost
+        self.rune_value = rune_value
+        self.profit = profit
+        self.saved = saved
+        self.received_at = datetime.now().astimezone()
+        # (previous_coefficient, days_since_last_update)
+        self.previous = previous
+
+
+class ItemMeta:
+    """What the prediction features need from an item."""
+
+    __slots__ = ("level", "type", "recipe_size", "stats")
+
+    def __init__(self, level: int, item_type: Optional[str], recipe_size: int, stats: List[ItemStat]):
+        self.level = level
+        self.type = item_type
+        self.recipe_size = recipe_size
+        self.stats = stats
+
+
+def previous_from_history(entry_coefficient: Optional[float], entry_created_at: Optional[datetime],
+                          now: datetime) -> Tuple[Optional[float], float]:
+    """(previous_coefficient, days_since_last_update), -1 days when there is no history."""
+    if entry_created_at is None:
+        return None, -1
+    if entry_created_at.tzinfo is None:
+        now = now.replace(tzinfo=None)
+    return entry_coefficient, (now - entry_created_at).total_seconds() / 86400.0
+
+
+class PredictionIngest:
+    """
+    Queue for prediction dataset submissions.
+
+    Routes enqueue and answer right away. A single consumer takes up to
+    prediction_batch_size submissions (waiting at most
+    prediction_batch_wait_ms for a batch to fill), looks up the previous
+    coefficient of the whole batch in one query, derives the features from
+    item metadata cached per (item, lang), and writes the batch with one
+    multi-row INSERT. Only items missing from the local catalog go to
+    dofusdu.de, once per cache entry.
+    """
+
+    def __init__(self, max_queue: int, batch_size: int, batch_wait_ms: float, meta_cache_entries: int):
+        self.batch_size = batch_size
+        self.batch_wait_seconds = batch_wait_ms / 1000.0
+        self.meta_cache_entries = meta_cache_entries
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self._meta: "OrderedDict[Tuple[int, str, int], Optional[ItemMeta]]" = OrderedDict()
+        self._task: Optional[asyncio.Task] = None
+        # Lote que el consumidor ya sacó de la cola y aún no escribió (lo rescata close())
+        self._batch: List[Submission] = []
+        self.accepted = 0
+        self.rejected = 0
+        self.written = 0
+        self.failed = 0
+        self.batches = 0
+
+    # --- Productores ---
+
+    def submit(self, submission: Submission):
+        """
+        Raises QueueFull instead of waiting. The save route still answers
+        200, with a warning that the entry was not recorded.
+        """
+        try:
+            self._queue.put_nowait(submission)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise QueueFull()
+        self.accepted += 1
+
+    # --- Consumidor ---
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._consume())
+
+    async def close(self, timeout: float = 10.0):
+        """
+        Stops the consumer and flushes, within timeout, the batch it was
+        building or writing and everything still queued.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        pending, self._batch = self._batch, []
+        while not self._queue.empty():
+            pending.append(self._queue.get_nowait())
+        if pending:
+            try:
+                await asyncio.wait_for(self._flush_all(pending), timeout)
+            except asyncio.TimeoutError:
+                logger.warning("prediction_ingest_shutdown_dropped pending=%d", len(pending))
+
+    async def _flush_all(self, pending: List[Submission]):
+        for start in range(0, len(pending), self.batch_size):
+            await self._write_batch(pending[start:start + self.batch_size])
+
+    async def _next_batch(self) -> List[Submission]:
+        # El lote vive en self mientras se llena: una cancelación no pierde lo ya sacado
+        self._batch = batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.batch_wait_seconds
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _consume(self):
+        while True:
+            batch = await self._next_batch()
+            # Una cancelación aquí deja el lote en self._batch para el flush de close()
+            try:
+                await self._write_batch(batch)
+            except Exception as e:
+                self.failed += len(batch)
+                logger.exception("prediction_batch_error size=%d error=%s", len(batch), e)
+            self._batch = []
+
+    # --- Enriquecimiento ---
+
+    async def _item_meta(self, item_id: int, lang: str) -> Optional[ItemMeta]:
+        key = (item_id, lang, catalog.version)
+        if key in self._meta:
+            self._meta.move_to_end(key)
+            return self._meta[key]
+
+        item = catalog.get("equipment", lang, item_id)
+        if item is not None:
+            meta = ItemMeta(item.get('level', 1), (item.get('type') or {}).get('name'),
+                            len(item.get('recipe') or []), parse_item_stats(item, lang))
+        else:
+            details = await get_item_details(item_id, lang)
+            meta = ItemMeta(details.level, details.type, len(details.recipe or []), details.stats) if details else None
+
+        self._meta[key] = meta
+        while len(self._meta) > self.meta_cache_entries:
+            self._meta.popitem(last=False)
+        return meta
+
+    async def _previous_coefficients(self, db, batch: List[Submission]) -> Dict[Tuple[int, str], Tuple[float, datetime]]:
+        pairs = {(s.item_id, s.server) for s in batch if s.previous is None}
+        if not pairs:
+            return {}
+        history = ItemCoefficientHistoryModel
+        result = await db.execute(
+            select(history.item_id, history.server, history.coefficient, history.created_at)
+            .where(tuple_(history.item_id, history.server).in_(list(pairs)))
+            .distinct(history.item_id, history.server)
+            .order_by(history.item_id, history.server, desc(history.created_at))
+        )
+        return {(item_id, server): (coefficient, created_at) for item_id, server, coefficient, created_at in result}
+
+    async def _features(self, db, submission: Submission, meta: Optional[ItemMeta]) -> Optional[dict]:
+        if meta is None:
+            logger.warning("prediction_item_not_found item_id=%s lang=%s", submission.item_id, submission.lang)
+            return None
+
+        lang = submission.lang
+        has_high_value_rune = any(
+            stat.value > 0 and get_canonical_stat_name(stat.name, lang) in HIGH_VALUE_STATS for stat in meta.stats
+        )
+
+        dominant_rune_type = "Generic"
+        if meta.stats:
+            rune_prices = (await price_snapshots.get(db, submission.server)).rune_prices
+            calc_res = await calculate_profit(CalculateRequest(
+                item_level=meta.level,
+                stats=meta.stats,
+                coefficient=submission.coefficient,
+                item_cost=submission.craft_cost,
+                rune_prices=dict(rune_prices),
+                lang=lang,
+                server=submission.server
+            ))
+            if calc_res.net_profit == calc_res.max_focus_profit and calc_res.best_focus_stat:
+                dominant_rune_type = get_canonical_stat_name(calc_res.best_focus_stat, lang)
+            else:
+                dominant_rune_type = "Mixed"
+
+        previous_coefficient, days_since = submission.previous
+        craft_cost = submission.craft_cost
+        return dict(
+            item_id=submission.item_id,
+            server=submission.server,
+            real_coefficient=submission.coefficient,
+            craft_cost=craft_cost,
+            rune_value_real=submission.rune_value,  # NOTE: value at REAL coefficient
+            ratio_profit=(submission.rune_value / craft_cost) if craft_cost > 0 else 0,
+            profit_amount=submission.profit,
+            item_level=meta.level,
+            item_type=get_canonical_item_type(meta.type or "Unknown", lang),
+            recipe_difficulty=meta.recipe_size,
+            has_high_value_rune=has_high_value_rune,
+            dominant_rune_type=dominant_rune_type,
+            previous_coefficient_24h=previous_coefficient,
+            day_of_week=submission.received_at.weekday(),
+            hour_of_day=submission.received_at.hour,
+            days_since_last_update=days_since,
+            saved=submission.saved,
+            created_at=submission.received_at,
+        )
+
+    async def _write_batch(self, batch: List[Submission]):
+        started = time.perf_counter()
+        async with AsyncSessionLocal() as db:
+            latest = await self._previous_coefficients(db, batch)
+            for submission in batch:
+                if submission.previous is None:
+                    coefficient, created_at = latest.get((submission.item_id, submission.server), (None, None))
+                    submission.previous = previous_from_history(coefficient, created_at, submission.received_at)
+
+            rows = []
+            for submission in batch:
+                try:
+                    meta = await self._item_meta(submission.item_id, submission.lang)
+                    row = await self._features(db, submission, meta)
+                except Exception as e:
+                    logger.warning("prediction_entry_error item_id=%s server=%s error=%s",
+                                   submission.item_id, submission.server, e)
+                    row = None
+                if row is None:
+                    self.failed += 1
+                else:
+                    rows.append(row)
+
+            if rows:
+                await db.execute(insert(PredictionDataset).values(rows))
+                await db.commit()
+
+        self.written += len(rows)
+        self.batches += 1
+        logger.info("prediction_batch_written size=%d written=%d duration_ms=%.1f",
+                    len(batch), len(rows), (time.perf_counter() - started) * 1000)
+
+    def snapshot(self) -> dict:
+        return {
+            "queued": self._queue.qsize(),
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "written": self.written,
+            "failed": self.failed,
+            "batches": self.batches,
+            "meta_cache": len(self._meta),
+        }
+
+
+class SubmissionDebouncer:
+    """
+    Coalesces automatic submissions per (client, item, server).
+
+    Each new value replaces the pending one and restarts a quiet window of
+    quiet_seconds; only the value that survives the window is handed to the
+    ingest queue. A key that keeps changing is still emitted after
+    max_hold_seconds. Past max_pending keys the oldest one is emitted early,
+    so memory stays bounded.
+    """
+
+    def __init__(self, ingest: PredictionIngest, quiet_seconds: float, max_hold_seconds: float, max_pending: int):
+        self.ingest = ingest
+        self.quiet_seconds = quiet_seconds
+        self.max_hold_seconds = max_hold_seconds
+        self.max_pending = max_pending
+        # key -> (último valor, handle del timer, monotonic del primer valor)
+        self._pending: "OrderedDict[Tuple[str, int, str], Tuple[Submission, asyncio.TimerHandle, float]]" = OrderedDict()
+        self.received = 0
+        self.collapsed = 0
+        self.emitted = 0
+        self.dropped = 0
+
+    def submit(self, client: str, submission: Submission):
+        key = (client, submission.item_id, submission.server)
+        loop = asyncio.get_running_loop()
+        now = time.monotonic()
+        self.received += 1
+
+        first_seen = now
+        previous = self._pending.pop(key, None)
+        if previous is not None:
+            _, handle, first_seen = previous
+            handle.cancel()
+            self.collapsed += 1
+
+        delay = min(self.quiet_seconds, max(first_seen + self.max_hold_seconds - now, 0))
+        handle = loop.call_later(delay, self._emit, key)
+        self._pending[key] = (submission, handle, first_seen)
+
+        while len(self._pending) > self.max_pending:
+            oldest = next(iter(self._pending))
+            self._pending[oldest][1].cancel()
+            self._emit(oldest)
+
+    def discard(self, client: str, item_id: int, server: str):
+        """Drops the pending value of a key (e.g. superseded by a manual save)."""
+        pending = self._pending.pop((client, item_id, server), None)
+        if pending is not None:
+            pending[1].cancel()
+            self.collapsed += 1
+
+    def _emit(self, key: Tuple[str, int, str]):
+        pending = self._pending.pop(key, None)
+        if pending is None:
+            return
+        try:
+            self.ingest.submit(pending[0])
+            self.emitted += 1
+        except QueueFull:
+            self.dropped += 1
+            logger.warning("prediction_debounce_dropped item_id=%s server=%s reason=queue_full", key[1], key[2])
+
+    def flush(self):
+        """Emits every pending value now (shutdown)."""
+        for key in list(self._pending):
+            self._pending[key][1].cancel()
+            self._emit(key)
+
+    def snapshot(self) -> dict:
+        return {
+            "pending": len(self._pending),
+            "received": self.received,
+            "collapsed": self.collapsed,
+            "emitted": self.emitted,
+            "dropped": self.dropped,
+        }
+
+
+prediction_ingest = PredictionIngest(
+    max_queue=env_settings.prediction_queue_max,
+    batch_size=env_settings.prediction_batch_size,
+    batch_wait_ms=env_settings.prediction_batch_wait_ms,
+    meta_cache_entries=env_settings.prediction_meta_cache_entries,
+)
+
+prediction_debouncer = SubmissionDebouncer(
+    prediction_ingest,
+    quiet_seconds=env_settings.prediction_debounce_seconds,
+    max_hold_seconds=env_settings.prediction_debounce_max_seconds,
+    max_pending=env_settings.prediction_debounce_max_pending,
+)
@@ -0,0 +1,256 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import select, delete, func, cast, literal, String, Integer
+from sqlalchemy.dialects.postgresql import insert, aggregate_order_by, ARRAY
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.db.database import AsyncSessionLocal
+from src.models.sql_models import RunePriceHistoryModel, IngredientPriceHistoryModel, PriceRollupModel
+from src.settings.config import env_settings
+
+logger = logging.getLogger(__name__)
+
+RUNE = "rune"
+INGREDIENT = "ingredient"
+RAW, HOUR, DAY = "raw", "hour", "day"
+RESOLUTION_SECONDS = {HOUR: 3600, DAY: 86400}
+
+# Clave de pg_try_advisory_xact_lock: una sola compactación a la vez entre workers
+COMPACTION_LOCK_KEY = 0x70726963
+
+
+# --- Escritura (en la transacción del que llama) ---
+
+async def record_rune_prices(db: AsyncSession, server: str, prices: Dict[str, int]):
+    if prices:
+        await db.execute(insert(RunePriceHistoryModel).values([
+            {"rune_name": name, "server": server, "price": price} for name, price in prices.items()
+        ]))
+
+
+async def record_ingredient_prices(db: AsyncSession, server: str, prices: Dict[int, int]):
+    if prices:
+        await db.execute(insert(IngredientPriceHistoryModel).values([
+            {"item_id": item_id, "server": server, "price": price} for item_id, price in prices.items()
+        ]))
+
+
+class _Series:
+    """Columns of one raw history table, seen as (key, server, price, time)."""
+
+    def __init__(self, kind: str, model):
+        self.kind = kind
+        self.model = model
+        self.key = model.rune_name if kind == RUNE else model.item_id
+        self.key_text = self.key if kind == RUNE else cast(self.key, String)
+        self.key_value = (lambda key: key) if kind == RUNE else (lambda key: int(key))
+
+
+SERIES = {
+    RUNE: _Series(RUNE, RunePriceHistoryModel),
+    INGREDIENT: _Series(INGREDIENT, IngredientPriceHistoryModel),
+}
+
+
+def _first(column, order_by):
+    return func.array_agg(aggregate_order_by(column, order_by), type_=ARRAY(Integer))[1]
+
+
+def _merge(buckets: Dict[datetime, list], rows):
+    """Folds (bucket, open, high, low, close, count) rows, oldest source first."""
+    for bucket, open_, high, low, close, count in rows:
+        current = buckets.get(bucket)
+        if current is None:
+            buckets[bucket] = [open_, high, low, close, count]
+        else:
+            current[1] = max(current[1], high)
+            current[2] = min(current[2], low)
+            current[3] = close
+            current[4] += count
+
+
+class PriceHistory:
+    """
+    Append-only rune and ingredient price history with rollups.
+
+    Every price change adds a raw point. compact() folds raw points older
+    than price_history_raw_days into hourly OHLC buckets, and hourly buckets
+    older than price_history_hourly_days into daily ones, so each series
+    stays bounded. Reads pick the coarsest resolution needed to keep a
+    range under price_history_max_points and merge the stored rollups with
+    finer data aggregated on the fly.
+    """
+
+    def __init__(self, raw_days: float, hourly_days: float, compact_minutes: float, max_points: int):
+        self.raw_days = raw_days
+        self.hourly_days = hourly_days
+        self.compact_minutes = compact_minutes
+        self.max_points = max_points
+
+    # --- Cortes ---
+
+    def raw_cutoff(self, now: datetime) -> datetime:
+        cutoff = now - timedelta(days=self.raw_days)
+        return cutoff.replace(minute=0, second=0, microsecond=0)
+
+    def hourly_cutoff(self, now: datetime) -> datetime:
+        cutoff = now - timedelta(days=self.hourly_days)
+        return cutoff.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    # --- Compactación ---
+
+    async def compact(self) -> dict:
+        now = datetime.now(timezone.utc)
+        raw_cutoff, hourly_cutoff = self.raw_cutoff(now), self.hourly_cutoff(now)
+        started = time.perf_counter()
+        counts = {}
+
+        async with AsyncSessionLocal() as db:
+            # Los buckets se cortan en UTC, igual que los cortes de arriba
+            await db.execute(select(func.set_config("timezone", "UTC", True)))
+            locked = (await db.execute(select(func.pg_try_advisory_xact_lock(COMPACTION_LOCK_KEY)))).scalar()
+            if not locked:
+                return {"skipped": "another worker is compacting"}
+
+            for series in SERIES.values():
+                counts[f"{series.kind}_raw"] = await self._raw_to_hourly(db, series, raw_cutoff)
+            counts["hourly"] = await self._hourly_to_daily(db, hourly_cutoff)
+            await db.commit()
+
+        logger.info("price_history_compacted %s duration_ms=%.1f",
+                    " ".join(f"{k}={v}" for k, v in counts.items()), (time.perf_counter() - started) * 1000)
+        return counts
+
+    async def _upsert_rollups(self, db: AsyncSession, source):
+        stmt = insert(PriceRollupModel).from_select(
+            ["kind", "key", "server", "resolution", "bucket_start", "open", "high", "low", "close", "count"], source
+        )
+        # Solo choca si una pasada anterior quedó a medias: se combinan los dos trozos
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["kind", "key", "server", "resolution", "bucket_start"],
+            set_={
+                "high": func.greatest(PriceRollupModel.high, stmt.excluded.high),
+                "low": func.least(PriceRollupModel.low, stmt.excluded.low),
+                "close": stmt.excluded.close,
+                "count": PriceRollupModel.count + stmt.excluded.count,
+            }
+        )
+        await db.execute(stmt)
+
+    async def _raw_to_hourly(self, db: AsyncSession, series: _Series, cutoff: datetime) -> int:
+        model = series.model
+        bucket = func.date_trunc(HOUR, model.recorded_at)
+        source = (
+            select(
+                literal(series.kind), series.key_text, model.server, literal(HOUR), bucket,
+                _first(model.price, model.recorded_at.asc()), func.max(model.price), func.min(model.price),
+                _first(model.price, model.recorded_at.desc()), func.count()
+            )
+            .where(model.recorded_at < cutoff)
+            .group_by(series.key, model.server, bucket)
+        )
+        await self._upsert_rollups(db, source)
+        result = await db.execute(delete(model).where(model.recorded_at < cutoff))
+        return result.rowcount
+
+    async def _hourly_to_daily(self, db: AsyncSession, cutoff: datetime) -> int:
+        rollup = PriceRollupModel
+        bucket = func.date_trunc(DAY, rollup.bucket_start)
+        is_old_hourly = (rollup.resolution == HOUR) & (rollup.bucket_start < cutoff)
+        source = (
+            select(
+                rollup.kind, rollup.key, rollup.server, literal(DAY), bucket,
+                _first(rollup.open, rollup.bucket_start.asc()), func.max(rollup.high), func.min(rollup.low),
+                _first(rollup.close, rollup.bucket_start.desc()), func.sum(rollup.count)
+            )
+            .where(is_old_hourly)
+            .group_by(rollup.kind, rollup.key, rollup.server, bucket)
+        )
+        await self._upsert_rollups(db, source)
+        result = await db.execute(delete(rollup).where(is_old_hourly))
+        return result.rowcount
+
+    async def compaction_loop(self):
+        """Background task: compact every price_history_compact_minutes."""
+        while True:
+            try:
+                await self.compact()
+            except Exception as e:
+                logger.warning("price_history_compact_error error=%s", e)
+            await asyncio.sleep(max(self.compact_minutes * 60, 60))
+
+    # --- Lecturas ---
+
+    def pick_resolution(self, start: datetime, end: datetime, now: datetime) -> str:
+        span = (end - start).total_seconds()
+        if start >= self.raw_cutoff(now) and span <= RESOLUTION_SECONDS[HOUR] * 24:
+            return RAW
+        if start >= self.hourly_cutoff(now) and span / RESOLUTION_SECONDS[HOUR] <= self.max_points:
+            return HOUR
+        return DAY
+
+    async def query(self, db: AsyncSession, kind: str, key: str, server: str, start: datetime, end: datetime,
+                    resolution: Optional[str] = None) -> Tuple[str, List[dict]]:
+        """
+        Returns (resolution, points). Raw points are {t, price}; buckets are
+        {t, open, high, low, close, count}. resolution None picks one.
+        """
+        now = datetime.now(timezone.utc)
+        resolution = resolution or self.pick_resolution(start, end, now)
+        series = SERIES[kind]
+        model = series.model
+        in_series = (series.key == series.key_value(key)) & (model.server == server)
+
+        if resolution == RAW:
+            result = await db.execute(
+                select(model.recorded_at, model.price)
+                .where(in_series, model.recorded_at >= start, model.recorded_at <= end)
+                .order_by(model.recorded_at)
+            )
+            return RAW, [{"t": recorded_at, "price": price} for recorded_at, price in result]
+
+        await db.execute(select(func.set_config("timezone", "UTC", True)))
+        rollup = PriceRollupModel
+        in_rollups = (rollup.kind == kind) & (rollup.key == str(key)) & (rollup.server == server)
+        buckets: Dict[datetime, list] = {}
+
+        # De lo más viejo (más grueso) a lo más nuevo, para que open/close salgan en orden
+        levels = [DAY, HOUR] if resolution == DAY else [HOUR]
+        for level in levels:
+            bucket = func.date_trunc(resolution, rollup.bucket_start)
+            result = await db.execute(
+                select(
+                    bucket, _first(rollup.open, rollup.bucket_start.asc()), func.max(rollup.high),
+                    func.min(rollup.low), _first(rollup.close, rollup.bucket_start.desc()), func.sum(rollup.count)
+                )
+                .where(in_rollups, rollup.resolution == level, rollup.bucket_start <= end,
+                       rollup.bucket_start >= func.date_trunc(level, start))
+                .group_by(bucket).order_by(bucket)
+            )
+            _merge(buckets, result)
+
+        bucket = func.date_trunc(resolution, model.recorded_at)
+        result = await db.execute(
+            select(
+                bucket, _first(model.price, model.recorded_at.asc()), func.max(model.price),
+                func.min(model.price), _first(model.price, model.recorded_at.desc()), func.count()
+            )
+            .where(in_series, model.recorded_at >= start, model.recorded_at <= end)
+            .group_by(bucket).order_by(bucket)
+        )
+        _merge(buckets, result)
+
+        return resolution, [
+            {"t": t, "open": o, "high": h, "low": l, "close": c, "count": n}
+            for t, (o, h, l, c, n) in sorted(buckets.items())
+        ]
+
+
+price_history = PriceHistory(
+    raw_days=env_settings.price_history_raw_days,
+    hourly_days=env_settings.price_history_hourly_days,
+    compact_minutes=env_settings.price_history_compact_minutes,
+    max_points=env_settings.price_history_max_points,
+)
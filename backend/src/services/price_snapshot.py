@@ -0,0 +1,297 @@
+import asyncio
+import json
+import logging
+from datetime import datetime, timezone
+from types import MappingProxyType
+from typing import Callable, Dict, List, Mapping, Optional
+import asyncpg
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.db.database import DATABASE_URL, AsyncSessionLocal
+from src.models.sql_models import RunePriceModel, IngredientPriceModel, PriceSetVersionModel
+
+logger = logging.getLogger(__name__)
+
+PRICE_CHANNEL = "price_changes"
+
+# listener(server, rune_changes, ingredient_changes) con solo los precios que cambiaron.
+# Cambios None: no se sabe qué cambió y el consumidor debe rehacer ese servidor
+# (server None: todos los servidores).
+PriceListener = Callable[[Optional[str], Optional[Dict[str, int]], Optional[Dict[int, int]]], None]
+
+# Los coeficientes guardados viajan por el mismo canal con kind="coefficient".
+# listener(server, item_id, coefficient); se llama también en el worker que escribió
+COEFFICIENT_KIND = "coefficient"
+CoefficientListener = Callable[[str, int, float], None]
+
+# Imágenes de runas guardadas (son las mismas en todos los servidores), con kind="image".
+# listener(rune_name, image_url)
+IMAGE_KIND = "image"
+ImageListener = Callable[[str, str], None]
+
+
+class PriceSnapshot:
+    """
+    Read-only rune and ingredient prices of one server at a price-set
+    version, plus when each ingredient row was last written.
+    """
+
+    __slots__ = ("server", "version", "rune_prices", "ing_prices", "ing_updated")
+
+    def __init__(self, server: str, version: int, rune_prices: Dict[str, int], ing_prices: Dict[int, int],
+                 ing_updated: Optional[Dict[int, Optional[datetime]]] = None):
+        self.server = server
+        self.version = version
+        self.rune_prices: Mapping[str, int] = MappingProxyType(rune_prices)
+        self.ing_prices: Mapping[int, int] = MappingProxyType(ing_prices)
+        self.ing_updated: Mapping[int, Optional[datetime]] = MappingProxyType(ing_updated or {})
+
+    def with_changes(self, version: int, runes: Dict[str, int], ingredients: Dict[int, int]) -> "PriceSnapshot":
+        # Hora local del worker en vez del now() de la transacción: difiere en milisegundos
+        now = datetime.now(timezone.utc)
+        return PriceSnapshot(
+            self.server, version, {**self.rune_prices, **runes}, {**self.ing_prices, **ingredients},
+            {**self.ing_updated, **{item_id: now for item_id in ingredients}}
+        )
+
+
+def price_diff(old: Mapping, new: Mapping) -> dict:
+    """Prices of new that differ from old (missing keys count as 0)."""
+    changed = {key: price for key, price in new.items() if old.get(key, 0) != price}
+    # Una fila borrada vuelve al precio por defecto
+    changed.update({key: 0 for key in old.keys() - new.keys() if old[key] != 0})
+    return changed
+
+
+class PriceSnapshotCache:
+    """
+    In-process price snapshot per server, shared by every reader.
+
+    Writers bump price_set_versions and NOTIFY PRICE_CHANNEL with
+    {"server", "version"} in the same transaction. Each worker LISTENs on a
+    dedicated connection and reloads only the server that changed, then
+    hands the price diff to the registered listeners (opportunity tables,
+    rune price snapshots). The writing worker applies its own changes right
+    away, so it reads its writes before the notification comes back.
+
+    Saved item coefficients use the same channel with
+    {"kind": "coefficient", "server", "item_id", "coefficient"} and saved
+    rune images with {"kind": "image", "rune", "url"}; they go straight to
+    their own listeners and nothing is reloaded for them.
+
+    While the LISTEN connection is down nothing is cached: every read goes
+    to the database, as before. Losing the connection publishes an
+    invalidation of every server, and the dependent caches do not keep what
+    they build until `listening` is back.
+    """
+
+    def __init__(self, dsn: str, reconnect_seconds: float = 5.0, keepalive_seconds: float = 30.0):
+        self.dsn = dsn
+        self.reconnect_seconds = reconnect_seconds
+        self.keepalive_seconds = keepalive_seconds
+        self._snapshots: Dict[str, PriceSnapshot] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._listeners: List[PriceListener] = []
+        self._coefficient_listeners: List[CoefficientListener] = []
+        self._image_listeners: List[ImageListener] = []
+        self._tasks = set()
+        self.listening = False
+        self.reloads = 0
+        self.notifications = 0
+
+    def on_change(self, listener: PriceListener):
+        self._listeners.append(listener)
+
+    def on_coefficient(self, listener: CoefficientListener):
+        self._coefficient_listeners.append(listener)
+
+    def on_image(self, listener: ImageListener):
+        self._image_listeners.append(listener)
+
+    def _publish(self, server: Optional[str], runes: Optional[Dict[str, int]], ingredients: Optional[Dict[int, int]]):
+        if runes is not None and ingredients is not None and not runes and not ingredients:
+            return
+        for listener in self._listeners:
+            try:
+                listener(server, runes, ingredients)
+            except Exception as e:
+                logger.warning("price_listener_error server=%s error=%s", server, e)
+
+    # --- Lecturas ---
+
+    async def get(self, db: AsyncSession, server: str) -> PriceSnapshot:
+        snapshot = self._snapshots.get(server)
+        if snapshot is not None:
+            return snapshot
+
+        lock = self._locks.setdefault(server, asyncio.Lock())
+        async with lock:
+            snapshot = self._snapshots.get(server)
+            if snapshot is None:
+                snapshot = await self._load(db, server)
+                if self.listening:
+                    self._snapshots[server] = snapshot
+        return snapshot
+
+    async def _load(self, db: AsyncSession, server: str) -> PriceSnapshot:
+        # La versión va primero: si un write se cuela entre medio, su NOTIFY fuerza otra recarga
+        version_result = await db.execute(select(PriceSetVersionModel.version).where(PriceSetVersionModel.server == server))
+        version = version_result.scalar_one_or_none() or 0
+
+        ing_result = await db.execute(
+            select(IngredientPriceModel.item_id, IngredientPriceModel.price, IngredientPriceModel.updated_at)
+            .where(IngredientPriceModel.server == server)
+        )
+        rune_result = await db.execute(
+            select(RunePriceModel.rune_name, RunePriceModel.price).where(RunePriceModel.server == server)
+        )
+        ing_prices, ing_updated = {}, {}
+        for item_id, price, updated_at in ing_result:
+            ing_prices[item_id] = price
+            ing_updated[item_id] = updated_at
+        self.reloads += 1
+        return PriceSnapshot(server, version, dict(rune_result.all()), ing_prices, ing_updated)
+
+    # --- Escrituras de este proceso ---
+
+    def apply(self, server: str, version: int, runes: Optional[Dict[str, int]] = None,
+              ingredients: Optional[Dict[int, int]] = None):
+        """
+        Called by the writer after commit. Patches the cached snapshot when
+        it is exactly one version behind; otherwise drops it so the next
+        read (or the notification) reloads it.
+        """
+        runes, ingredients = runes or {}, ingredients or {}
+        snapshot = self._snapshots.get(server)
+        if snapshot is not None:
+            if snapshot.version == version - 1:
+                self._snapshots[server] = snapshot.with_changes(version, runes, ingredients)
+            elif snapshot.version < version:
+                self._snapshots.pop(server, None)
+        self._publish(server, runes, ingredients)
+
+    def apply_coefficient(self, server: str, item_id: int, coefficient: float):
+        """Called by the writer after commit; other workers get it from the notification."""
+        for listener in self._coefficient_listeners:
+            try:
+                listener(server, item_id, coefficient)
+            except Exception as e:
+                logger.warning("coefficient_listener_error server=%s item_id=%s error=%s", server, item_id, e)
+
+    def apply_image(self, rune_name: str, url: str):
+        """Called by the writer after commit; other workers get it from the notification."""
+        for listener in self._image_listeners:
+            try:
+                listener(rune_name, url)
+            except Exception as e:
+                logger.warning("image_listener_error rune=%r error=%s", rune_name, e)
+
+    # --- Notificaciones de otros procesos ---
+
+    async def _on_notify(self, payload: str):
+        try:
+            data = json.loads(payload)
+            if data.get("kind") == COEFFICIENT_KIND:
+                # Aplicarlo dos veces en el worker que escribió no cambia nada
+                self.notifications += 1
+                self.apply_coefficient(data["server"], int(data["item_id"]), float(data["coefficient"]))
+                return
+            if data.get("kind") == IMAGE_KIND:
+                self.notifications += 1
+                self.apply_image(data["rune"], data["url"])
+                return
+            server, version = data["server"], int(data["version"])
+        except (ValueError, KeyError, TypeError, AttributeError):
+            logger.warning("price_notify_invalid payload=%r", payload)
+            return
+
+        self.notifications += 1
+        old = self._snapshots.get(server)
+        if old is None:
+            # Nada cacheado de este servidor: se carga en la próxima lectura, y lo
+            # que se haya construido sin snapshot se rehace
+            self._publish(server, None, None)
+            return
+        if old.version >= version:
+            return  # Ya aplicado (el write fue de este proceso)
+
+        lock = self._locks.setdefault(server, asyncio.Lock())
+        async with lock:
+            current = self._snapshots.get(server)
+            if current is not old:
+                # Otra recarga o un apply() local llegó primero
+                if current is None or current.version < version:
+                    self._snapshots.pop(server, None)
+                    self._publish(server, None, None)
+                return
+            async with AsyncSessionLocal() as db:
+                new = await self._load(db, server)
+            self._snapshots[server] = new
+
+        logger.debug("price_snapshot_reloaded server=%s version=%d", server, new.version)
+        self._publish(server, price_diff(old.rune_prices, new.rune_prices), price_diff(old.ing_prices, new.ing_prices))
+
+    def _handle(self, connection, pid, channel, payload):
+        task = asyncio.get_running_loop().create_task(self._on_notify(payload))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def listen(self):
+        """Background task: keeps a LISTEN connection open, reconnecting on failure."""
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(self.dsn)
+                await connection.add_listener(PRICE_CHANNEL, self._handle)
+                # Lo construido mientras no escuchábamos puede estar viejo
+                self._snapshots.clear()
+                self._publish(None, None, None)
+                self.listening = True
+                logger.info("price_listener_connected channel=%s", PRICE_CHANNEL)
+                while True:
+                    await asyncio.sleep(self.keepalive_seconds)
+                    await connection.fetchval("SELECT 1")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("price_listener_error error=%s", e)
+            finally:
+                was_listening, self.listening = self.listening, False
+                self._snapshots.clear()
+                if was_listening:
+                    # Los cambios de otros workers dejan de llegar: lo derivado se descarta
+                    self._publish(None, None, None)
+                if connection is not None and not connection.is_closed():
+                    await connection.close()
+            await asyncio.sleep(self.reconnect_seconds)
+
+    def snapshot(self) -> dict:
+        return {
+            "listening": self.listening,
+            "servers": {server: snapshot.version for server, snapshot in self._snapshots.items()},
+            "reloads": self.reloads,
+            "notifications": self.notifications,
+        }
+
+
+async def _notify(db: AsyncSession, data: dict):
+    # pg_notify en la transacción del que llama: se entrega a todos los workers al hacer commit
+    await db.execute(select(func.pg_notify(PRICE_CHANNEL, json.dumps(data, separators=(",", ":")))))
+
+
+async def notify_price_change(db: AsyncSession, server: str, version: int):
+    """NOTIFY in the caller's transaction: delivered to every worker on commit."""
+    await _notify(db, {"server": server, "version": version})
+
+
+async def notify_coefficient_change(db: AsyncSession, server: str, item_id: int, coefficient: float):
+    """Like notify_price_change, for a saved item coefficient."""
+    await _notify(db, {"kind": COEFFICIENT_KIND, "server": server, "item_id": item_id, "coefficient": coefficient})
+
+
+async def notify_image_change(db: AsyncSession, rune_name: str, url: str):
+    """Like notify_price_change, for a rune image written to the database."""
+    await _notify(db, {"kind": IMAGE_KIND, "rune": rune_name, "url": url})
+
+
+price_snapshots = PriceSnapshotCache(dsn=DATABASE_URL.replace("postgresql+asyncpg://", "postgresql://", 1))
@@ -0,0 +1,129 @@
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import select, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.models.sql_models import RunePriceModel, IngredientPriceModel, PriceSetVersionModel
+from src.services.price_history import record_rune_prices, record_ingredient_prices
+from src.services.price_snapshot import price_snapshots, notify_price_change
+from src.settings.config import env_settings
+
+logger = logging.getLogger(__name__)
+
+
+def _batches(rows: List[dict], size: int) -> Iterable[List[dict]]:
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+async def _bump_version(db: AsyncSession, server: str, changed: bool) -> int:
+    """
+    Increments the server's price-set version when something changed and
+    NOTIFYs the other workers, in the caller's transaction; otherwise
+    returns the current version (0 if none).
+    """
+    if not changed:
+        result = await db.execute(select(PriceSetVersionModel.version).where(PriceSetVersionModel.server == server))
+        return result.scalar_one_or_none() or 0
+
+    stmt = insert(PriceSetVersionModel).values(server=server, version=1)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[PriceSetVersionModel.server],
+        set_={"version": PriceSetVersionModel.version + 1, "updated_at": func.now()}
+    ).returning(PriceSetVersionModel.version)
+    result = await db.execute(stmt)
+    version = result.scalar_one()
+    await notify_price_change(db, server, version)
+    return version
+
+
+async def upsert_rune_prices(db: AsyncSession, server: str, prices: Dict[str, int]) -> Tuple[Dict[str, int], int]:
+    """
+    Writes canonical rune prices with one INSERT ... ON CONFLICT per batch.
+    Rows whose price is unchanged are not touched; the others also get a
+    price-history point. Commits.
+
+    Returns ({rune_name: price} of the rows written, price-set version).
+    """
+    rows = [{"rune_name": name, "server": server, "price": price} for name, price in prices.items()]
+    changed: Dict[str, int] = {}
+
+    for batch in _batches(rows, env_settings.price_upsert_batch_size):
+        stmt = insert(RunePriceModel).values(batch)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[RunePriceModel.rune_name, RunePriceModel.server],
+            set_={"price": stmt.excluded.price, "updated_at": func.now()},
+            # La comparación la hace Postgres bajo el lock de la fila: sin read-modify-write
+            where=RunePriceModel.price.is_distinct_from(stmt.excluded.price)
+        ).returning(RunePriceModel.rune_name, RunePriceModel.price)
+        result = await db.execute(stmt)
+        changed.update({row.rune_name: row.price for row in result})
+
+    await record_rune_prices(db, server, changed)
+    version = await _bump_version(db, server, bool(changed))
+    await db.commit()
+    price_snapshots.apply(server, version, runes=changed)
+    logger.info("rune_prices_upserted server=%s received=%d changed=%d version=%d", server, len(rows), len(changed), version)
+    return changed, version
+
+
+async def upsert_ingredient_prices(db: AsyncSession, server: str,
+                                   prices: Dict[int, Tuple[int, Optional[str]]]) -> Tuple[Dict[int, int], int]:
+    """
+    Writes ingredient prices ({item_id: (price, name)}) with one
+    INSERT ... ON CONFLICT (item_id, server) DO UPDATE per batch. A None
+    name keeps the stored one. Rows with nothing new are not touched; the
+    others also get a price-history point. Commits.
+
+    Returns ({item_id: price} of the rows written, price-set version).
+    """
+    rows = [
+        {"item_id": item_id, "server": server, "price": price, "name": name}
+        for item_id, (price, name) in prices.items()
+    ]
+    changed: Dict[int, int] = {}
+
+    for batch in _batches(rows, env_settings.price_upsert_batch_size):
+        stmt = insert(IngredientPriceModel).values(batch)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[IngredientPriceModel.item_id, IngredientPriceModel.server],
+            set_={
+                "price": stmt.excluded.price,
+                "name": func.coalesce(stmt.excluded.name, IngredientPriceModel.name),
+                "updated_at": func.now()
+            },
+            where=(
+                IngredientPriceModel.price.is_distinct_from(stmt.excluded.price)
+                | (stmt.excluded.name.isnot(None) & IngredientPriceModel.name.is_distinct_from(stmt.excluded.name))
+            )
+        ).returning(IngredientPriceModel.item_id, IngredientPriceModel.price)
+        result = await db.execute(stmt)
+        changed.update({row.item_id: row.price for row in result})
+
+    # Un cambio solo de nombre deja un punto con el mismo precio: no altera el OHLC
+    await record_ingredient_prices(db, server, changed)
+    version = await _bump_version(db, server, bool(changed))
+    await db.commit()
+    price_snapshots.apply(server, version, ingredients=changed)
+    logger.info("ingredient_prices_upserted server=%s received=%d changed=%d version=%d", server, len(rows), len(changed), version)
+    return changed, version
+
+
+async def seed_rune_rows(db: AsyncSession, server: str, rune_names: Iterable[str]) -> int:
+    """
+    Creates the missing rune rows of a server at price 0 in one
+    INSERT ... ON CONFLICT DO NOTHING. Commits. Returns how many were added.
+    """
+    rows = [{"rune_name": name, "server": server, "price": 0} for name in rune_names]
+    if not rows:
+        return 0
+
+    stmt = insert(RunePriceModel).values(rows).on_conflict_do_nothing(
+        index_elements=[RunePriceModel.rune_name, RunePriceModel.server]
+    ).returning(RunePriceModel.rune_name)
+    result = await db.execute(stmt)
+    added = len(result.all())
+    await db.commit()
+    if added:
+        logger.info("rune_rows_seeded server=%s added=%d", server, added)
+    return added
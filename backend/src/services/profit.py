@@ -1,221 +1,411 @@
-from typing import List, Dict
+from typing import Any, Awaitable, Callable, Iterable, List, Dict, Optional, Set, Tuple
+import base64
+import heapq
+import json
+import logging
 import math
+import time
+import numpy as np
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, desc, func
-from src.models.sql_models import IngredientPriceModel, RunePriceModel, ItemCoefficientHistoryModel
+from src.models.sql_models import ItemCoefficientHistoryModel
 from src.services.equipment import fetch_raw_equipment
-from src.services.calculator import get_rune_info, get_stat_density
+from src.services.calculator import get_rune_info, get_stat_density, get_canonical_item_type, get_canonical_stat_name
+from src.services.coefficient_model import HIGH_VALUE_STATS, coefficient_predictor
+from src.services.scan_executor import scan_executor
+from src.services.price_snapshot import price_snapshots
 from src.models.schemas import ProfitItem, PaginatedProfitResponse
 
-async def calculate_profitability(types: List[str], min_level: int, max_level: int, min_profit: int, min_craft_cost: int, page: int, limit: int, sort_by: str, sort_order: str, db: AsyncSession, lang: str, server: str = "Dakal") -> PaginatedProfitResponse:
-    # 1. Fetch items
-    items = await fetch_raw_equipment(types, min_level, max_level)
-    if not items:
-        return []
+logger = logging.getLogger(__name__)
 
-    # 2. Fetch prices
-    ing_prices_result = await db.execute(select(IngredientPriceModel).where(IngredientPriceModel.server == server))
-    ing_prices = {row.IngredientPriceModel.item_id: row.IngredientPriceModel.price for row in ing_prices_result}
-    
-    rune_prices_result = await db.execute(select(RunePriceModel).where(RunePriceModel.server == server))
-    rune_prices = {row.RunePriceModel.rune_name: row.RunePriceModel.price for row in rune_prices_result}
 
-    # 3. Fetch latest coefficients for all items
-    item_ids = [item.get('ankama_id') for item in items if isinstance(item, dict) and item.get('ankama_id')]
-    
-    coef_map = {}
-    if item_ids:
-        # Subquery to find the latest timestamp for each item
-        subq = select(
-            ItemCoefficientHistoryModel.item_id,
-            func.max(ItemCoefficientHistoryModel.created_at).label('max_date')
-        ).where(
-            ItemCoefficientHistoryModel.item_id.in_(item_ids),
-            ItemCoefficientHistoryModel.server == server
-        ).group_by(ItemCoefficientHistoryModel.item_id).subquery()
-        
-        # Join to get the coefficient
-        query = select(ItemCoefficientHistoryModel.item_id, ItemCoefficientHistoryModel.coefficient).join(
-            subq, 
-            (ItemCoefficientHistoryModel.item_id == subq.c.item_id) & 
-            (ItemCoefficientHistoryModel.created_at == subq.c.max_date)
-        )
-        
-        coef_result = await db.execute(query)
-        coef_map = {row.item_id: row.coefficient for row in coef_result}
-
-    results = []
-
-    for item in items:
-        if not isinstance(item, dict): continue
-        
-        # Calculate Craft Cost
-        recipe = item.get('recipe', [])
-        if not recipe: continue # Skip items without recipe
-        
-        craft_cost = 0
-        is_craftable = True
-        for ing in recipe:
-            ing_id = ing.get('item_ankama_id')
-            qty = ing.get('quantity', 1)
-            price = ing_prices.get(ing_id, 0)
-            
-            # If price is -1, the ingredient is marked as unavailable
-            if price == -1:
-                is_craftable = False
-                break
-                
-            # If price is 0, the cost is underestimated, but we proceed as requested
-            craft_cost += price * qty
-            
-        if not is_craftable or craft_cost == 0:
-            continue
-
-        # Filter by Min Craft Cost
-        if craft_cost < min_craft_cost:
-            continue
-
-        # Calculate Rune Value (Base)
-        effects = item.get('effects', [])
-        if not effects: continue
-        
-        item_level = item.get('level', 1)
-        
-        # Store stat data for focus calculation
-        stat_data_list = []
-        total_vr_sum = 0
-        
-        for effect in effects:
+class ItemProfile:
+    """
+    Parte de un ítem que no depende de los precios: receta y VR por stat.
+    Se calcula una vez por ítem; evaluate_profile aplica los precios.
+    """
+
+    __slots__ = ("id", "name", "img", "level", "type_name", "recipe", "stats", "total_vr", "high_value")
+
+    def __init__(self, item: dict):
+        self.id = item.get('ankama_id')
+        self.name = item.get('name')
+        self.img = item.get('image_urls', {}).get('icon')
+        self.level = item.get('level', 1)
+        # Tipo canónico, como item_type en prediction_dataset
+        self.type_name = get_canonical_item_type((item.get('type') or {}).get('name') or "Unknown")
+        self.recipe: List[Tuple[int, int]] = [
+            (ing.get('item_ankama_id'), ing.get('quantity', 1)) for ing in item.get('recipe', []) or []
+        ]
+
+        # (name, vr, rune_name, rune_weight) por stat con runa
+        self.stats: List[Tuple[str, float, str, float]] = []
+        self.total_vr = 0
+
+        for effect in item.get('effects', []) or []:
             # Skip active effects (e.g. weapon damage, spells)
             if effect.get('type', {}).get('is_active'):
                 continue
 
             type_name = effect.get('type', {}).get('name')
             if not type_name: continue
-            
+
             # Use average value for estimation
             min_val = effect.get('int_minimum', 0)
             max_val = effect.get('int_maximum', 0)
-            
+
             # Handle cases where min/max might be inverted or zero
             if max_val == 0 and min_val != 0: max_val = min_val
             if min_val == 0 and max_val != 0: min_val = max_val
-            
+
             # Use integer division to match frontend Math.floor()
             avg_val = int((min_val + max_val) / 2)
-            
+
             if avg_val <= 0: continue
-            
+
             rune_info = get_rune_info(type_name)
             if not rune_info: continue
-            
-            rune_name = rune_info["name"]
-            rune_weight = rune_info["weight"]
-            rune_price = rune_prices.get(rune_name, 0)
-            
+
             density = get_stat_density(type_name)
-            
+
             # Apply calculator.py logic for value adjustments
             adjusted_val = avg_val
             if type_name in {"PA", "PM", "Alcance", "Invocaciones"} and 0 <= adjusted_val <= 1:
                 adjusted_val = 1
-            
+
             if type_name == "Pods":
                 adjusted_val = adjusted_val / 2.5
 
             # Formula: ((value * density * item_lvl * 0.0150) + 1)
-            vr = ((adjusted_val * density * item_level * 0.0150) + 1)
-            
-            stat_data_list.append({
-                'name': type_name,
-                'vr': vr,
-                'rune_weight': rune_weight,
-                'rune_price': rune_price
-            })
-            total_vr_sum += vr
-            
-        if not stat_data_list:
-            continue
-            
-        # Calculate Normal Value (Sum of all stats)
-        normal_value = 0
-        for stat in stat_data_list:
-            # Normal: vr / weight * price
-            num_runes = stat['vr'] / stat['rune_weight']
-            normal_value += num_runes * stat['rune_price']
-            
-        # Calculate Focus Values
-        max_focus_value = 0
-        
-        for stat in stat_data_list:
-            vr_propio = stat['vr']
-            vr_resto = total_vr_sum - vr_propio
-            
-            # Focus Formula: Propio + (0.5 * Resto)
-            vr_focus_total = vr_propio + (0.5 * vr_resto)
-            
-            # Pods adjustment for Focus
-            if stat['name'] == "Pods":
-                vr_focus_total = vr_focus_total / 2.5
-                
-            num_runes_focus = vr_focus_total / stat['rune_weight']
-            focus_value = num_runes_focus * stat['rune_price']
-            
-            if focus_value > max_focus_value:
-                max_focus_value = focus_value
-                
-        # Best Value (Normal vs Focus)
-        total_rune_value_100 = max(normal_value, max_focus_value)
-            
-        if total_rune_value_100 == 0:
-            continue
-            
-        # Calculate min coefficient as percentage (e.g. 50.0 for 50%)
-        # Coef = Cost / BaseValue
-        # If Cost=100, Base=200 -> Coef=0.5 -> 50%
-        min_coef = (craft_cost / total_rune_value_100) * 100
-        
-        # Filter by Risk (CMR < 120%) - REMOVED to show all items
-        # if min_coef > 120:
-        #    continue
-
-        # Calculate Real Value based on Current Coefficient
-        current_coef = coef_map.get(item.get('ankama_id'), 100)
-        real_rune_value = total_rune_value_100 * (current_coef / 100.0)
-
-        results.append(ProfitItem(
-            id=item.get('ankama_id'),
-            name=item.get('name'),
-            img=item.get('image_urls', {}).get('icon'),
-            level=item_level,
-            min_coefficient=round(min_coef, 2),
-            craft_cost=round(craft_cost, 2),
-            estimated_rune_value=round(real_rune_value, 2),
-            value_at_100=round(total_rune_value_100, 2),
-            last_coefficient=current_coef
-        ))
-        
-    # Sort
-    reverse = sort_order == 'desc'
-    
-    if sort_by == 'risk':
-        results.sort(key=lambda x: x.min_coefficient, reverse=reverse)
-    else:
-        results.sort(key=lambda x: (x.estimated_rune_value - x.craft_cost), reverse=reverse)
-    
-    # Pagination Logic
-    total_items = len(results)
-    total_pages = math.ceil(total_items / limit)
-    
-    start_idx = (page - 1) * limit
-    end_idx = start_idx + limit
-    
-    paginated_items = results[start_idx:end_idx]
-    
+            vr = ((adjusted_val * density * self.level * 0.0150) + 1)
+
+            self.stats.append((type_name, vr, rune_info["name"], rune_info["weight"]))
+            self.total_vr += vr
+
+        self.high_value = any(get_canonical_stat_name(name) in HIGH_VALUE_STATS for name, _, _, _ in self.stats)
+
+    @property
+    def is_candidate(self) -> bool:
+        return bool(self.recipe) and bool(self.stats)
+
+    def rune_names(self) -> Set[str]:
+        return {rune_name for _, _, rune_name, _ in self.stats}
+
+    def ingredient_ids(self) -> Set[int]:
+        return {ing_id for ing_id, _ in self.recipe}
+
+
+def evaluate_profile(profile: ItemProfile, ing_prices: Dict[int, int], rune_prices: Dict[str, int]) -> Optional[Tuple[float, float]]:
+    """
+    Returns (craft_cost, value_at_100), or None when the item cannot be
+    crafted or yields nothing at current prices.
+    """
+    if not profile.is_candidate:
+        return None
+
+    # Calculate Craft Cost
+    craft_cost = 0
+    for ing_id, qty in profile.recipe:
+        price = ing_prices.get(ing_id, 0)
+
+        # If price is -1, the ingredient is marked as unavailable
+        if price == -1:
+            return None
+
+        # If price is 0, the cost is underestimated, but we proceed as requested
+        craft_cost += price * qty
+
+    if craft_cost == 0:
+        return None
+
+    # Calculate Normal Value (Sum of all stats)
+    normal_value = 0
+    for _, vr, rune_name, rune_weight in profile.stats:
+        # Normal: vr / weight * price
+        num_runes = vr / rune_weight
+        normal_value += num_runes * rune_prices.get(rune_name, 0)
+
+    # Calculate Focus Values
+    max_focus_value = 0
+
+    for name, vr_propio, rune_name, rune_weight in profile.stats:
+        vr_resto = profile.total_vr - vr_propio
+
+        # Focus Formula: Propio + (0.5 * Resto)
+        vr_focus_total = vr_propio + (0.5 * vr_resto)
+
+        # Pods adjustment for Focus
+        if name == "Pods":
+            vr_focus_total = vr_focus_total / 2.5
+
+        num_runes_focus = vr_focus_total / rune_weight
+        focus_value = num_runes_focus * rune_prices.get(rune_name, 0)
+
+        if focus_value > max_focus_value:
+            max_focus_value = focus_value
+
+    # Best Value (Normal vs Focus)
+    total_rune_value_100 = max(normal_value, max_focus_value)
+
+    if total_rune_value_100 == 0:
+        return None
+
+    return craft_cost, total_rune_value_100
+
+
+def profit_metrics(craft_cost: float, value_at_100: float, current_coef: float) -> Tuple[float, float, float]:
+    """
+    Returns (min_coefficient, estimated_rune_value, profit) rounded as in
+    ProfitItem, so filters and sort keys match what the client sees.
+    """
+    # Calculate min coefficient as percentage (e.g. 50.0 for 50%)
+    # Coef = Cost / BaseValue
+    # If Cost=100, Base=200 -> Coef=0.5 -> 50%
+    min_coef = round((craft_cost / value_at_100) * 100, 2)
+
+    # Calculate Real Value based on Current Coefficient
+    real_rune_value = round(value_at_100 * (current_coef / 100.0), 2)
+
+    return min_coef, real_rune_value, real_rune_value - round(craft_cost, 2)
+
+
+def predict_coefficients(profiles: List[ItemProfile], craft_cost: List[float], value_at_100: List[float],
+                         server: str) -> np.ndarray:
+    """Batched coefficient_predictor call for items with no coefficient history."""
+    return coefficient_predictor.predict(
+        craft_cost, value_at_100,
+        [profile.level for profile in profiles],
+        [len(profile.recipe) for profile in profiles],
+        [profile.high_value for profile in profiles],
+        [profile.type_name for profile in profiles],
+        server
+    )
+
+
+def build_profit_item(profile: ItemProfile, craft_cost: float, value_at_100: float, current_coef: float,
+                      predicted: bool = False) -> ProfitItem:
+    min_coef, real_rune_value, _ = profit_metrics(craft_cost, value_at_100, current_coef)
+    return ProfitItem(
+        id=profile.id,
+        name=profile.name,
+        img=profile.img,
+        level=profile.level,
+        min_coefficient=min_coef,
+        craft_cost=round(craft_cost, 2),
+        estimated_rune_value=real_rune_value,
+        value_at_100=round(value_at_100, 2),
+        last_coefficient=current_coef,
+        coefficient_predicted=predicted
+    )
+
+
+def sort_value(sort_by: str, min_coef: float, profit: float) -> float:
+    return min_coef if sort_by == 'risk' else profit
+
+
+# --- Paginación: top-k con heap acotado y cursores keyset ---
+
+def encode_cursor(value: float, item_id: int, sort_by: str, sort_order: str) -> str:
+    raw = json.dumps({"v": value, "id": item_id, "s": sort_by, "o": sort_order}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort_by: str, sort_order: str) -> Tuple[float, int]:
+    """Raises ValueError when the cursor is malformed or from another ordering."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data = json.loads(raw)
+        value, item_id = float(data["v"]), int(data["id"])
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError("Invalid cursor") from e
+    if data.get("s") != sort_by or data.get("o") != sort_order:
+        raise ValueError("Cursor does not match sort_by/sort_order")
+    return value, item_id
+
+
+def select_page(candidates: Iterable[Tuple[float, int, Any]], sort_by: str, sort_order: str,
+                page: int, limit: int, cursor: Optional[str] = None) -> Tuple[List[Any], int, Optional[str]]:
+    """
+    Picks one page from (sort_value, item_id, payload) candidates without
+    sorting them all: a bounded heap keeps the best page * limit (or limit
+    after a cursor). Ties are ordered by item_id so cursors are stable.
+
+    Returns (payloads, total, next_cursor).
+    """
+    descending = sort_order == 'desc'
+
+    def rank(candidate):
+        return (-candidate[0] if descending else candidate[0], candidate[1])
+
+    after = None
+    if cursor:
+        value, item_id = decode_cursor(cursor, sort_by, sort_order)
+        after = (-value if descending else value, item_id)
+
+    total = 0
+
+    def remaining():
+        nonlocal total
+        for candidate in candidates:
+            total += 1
+            if after is None or rank(candidate) > after:
+                yield candidate
+
+    # Uno de más para saber si hay página siguiente
+    offset = 0 if after is not None else (page - 1) * limit
+    top = heapq.nsmallest(offset + limit + 1, remaining(), key=rank)
+    selected = top[offset:offset + limit]
+
+    next_cursor = None
+    if len(top) > offset + limit and selected:
+        last_value, last_id, _ = selected[-1]
+        next_cursor = encode_cursor(last_value, last_id, sort_by, sort_order)
+
+    return [payload for _, _, payload in selected], total, next_cursor
+
+
+def select_page_arrays(values: np.ndarray, item_ids: np.ndarray, mask: np.ndarray, sort_by: str, sort_order: str,
+                       page: int, limit: int, cursor: Optional[str] = None) -> Tuple[np.ndarray, int, Optional[str]]:
+    """
+    select_page over parallel arrays: same ordering (ties by item_id) and
+    the same cursors. Only the rows that can reach the page are sorted.
+    Returns (row indices, total, next_cursor).
+    """
+    descending = sort_order == 'desc'
+    rows = np.flatnonzero(mask)
+    total = len(rows)
+
+    rank = -values[rows] if descending else values[rows]
+    ids = item_ids[rows]
+    if cursor:
+        value, item_id = decode_cursor(cursor, sort_by, sort_order)
+        after_value = -value if descending else value
+        keep = (rank > after_value) | ((rank == after_value) & (ids > item_id))
+        rows, rank, ids = rows[keep], rank[keep], ids[keep]
+
+    offset = 0 if cursor else (page - 1) * limit
+    wanted = offset + limit + 1
+    if wanted < len(rank):
+        # Solo se ordena el top: argpartition da el rank de corte y entran todos
+        # los empatados con él, para que el desempate por item_id siga siendo exacto
+        boundary = rank[np.argpartition(rank, wanted - 1)[wanted - 1]]
+        top = np.flatnonzero(rank <= boundary)
+        rows, rank, ids = rows[top], rank[top], ids[top]
+    order = np.lexsort((ids, rank))[:wanted]
+    selected = rows[order[offset:offset + limit]]
+
+    next_cursor = None
+    if len(order) > offset + limit and len(selected):
+        last = selected[-1]
+        next_cursor = encode_cursor(float(values[last]), int(item_ids[last]), sort_by, sort_order)
+
+    return selected, total, next_cursor
+
+
+def page_response(items: List[ProfitItem], total: int, page: int, limit: int, next_cursor: Optional[str]) -> PaginatedProfitResponse:
     return PaginatedProfitResponse(
-        items=paginated_items,
-        total=total_items,
+        items=items,
+        total=total,
         page=page,
         size=limit,
-        total_pages=total_pages
+        total_pages=math.ceil(total / limit),
+        next_cursor=next_cursor
     )
+
+
+async def load_latest_coefficients(db: AsyncSession, server: str, item_ids: Optional[List[int]] = None) -> Dict[int, float]:
+    """Latest coefficient per item on a server; all items when item_ids is None."""
+    # Subquery to find the latest timestamp for each item
+    subq = select(
+        ItemCoefficientHistoryModel.item_id,
+        func.max(ItemCoefficientHistoryModel.created_at).label('max_date')
+    ).where(ItemCoefficientHistoryModel.server == server)
+    if item_ids is not None:
+        subq = subq.where(ItemCoefficientHistoryModel.item_id.in_(item_ids))
+    subq = subq.group_by(ItemCoefficientHistoryModel.item_id).subquery()
+
+    # Join to get the coefficient
+    query = select(ItemCoefficientHistoryModel.item_id, ItemCoefficientHistoryModel.coefficient).join(
+        subq,
+        (ItemCoefficientHistoryModel.item_id == subq.c.item_id) &
+        (ItemCoefficientHistoryModel.created_at == subq.c.max_date)
+    ).where(ItemCoefficientHistoryModel.server == server)
+
+    coef_result = await db.execute(query)
+    return {row.item_id: row.coefficient for row in coef_result}
+
+
+async def calculate_profitability(types: List[str], min_level: int, max_level: int, min_profit: int, min_craft_cost: int, page: int, limit: int, sort_by: str, sort_order: str, db: AsyncSession, lang: str, server: str = "Dakal", cursor: Optional[str] = None, is_cancelled: Optional[Callable[[], Awaitable[bool]]] = None) -> PaginatedProfitResponse:
+    """
+    Full scan: fetches the items and prices and evaluates everything.
+    Fallback for when the opportunity table is not available.
+
+    The evaluation runs in chunks on the scan pool (see scan_executor);
+    raises ScanBusy / ScanCancelled from there.
+    """
+    started = time.perf_counter()
+
+    # 1. Fetch items
+    items = await fetch_raw_equipment(types, min_level, max_level)
+    if not items:
+        return []
+
+    # 2. Prices (in-process snapshot, see price_snapshots)
+    prices = await price_snapshots.get(db, server)
+    ing_prices, rune_prices = prices.ing_prices, prices.rune_prices
+
+    # 3. Fetch latest coefficients for all items
+    item_ids = [item.get('ankama_id') for item in items if isinstance(item, dict) and item.get('ankama_id')]
+    coef_map = await load_latest_coefficients(db, server, item_ids) if item_ids else {}
+    has_model = coefficient_predictor.current() is not None
+
+    # Candidates feed the top-k heap; ProfitItem is only built for the page
+    def evaluate_chunk(chunk: List[dict]) -> List[Tuple[float, int, Any]]:
+        evaluated = []
+        for item in chunk:
+            if not isinstance(item, dict): continue
+
+            profile = ItemProfile(item)
+            evaluation = evaluate_profile(profile, ing_prices, rune_prices)
+            if evaluation is None:
+                continue
+
+            craft_cost, value_at_100 = evaluation
+
+            # Filter by Min Craft Cost
+            if craft_cost < min_craft_cost:
+                continue
+
+            evaluated.append((profile, craft_cost, value_at_100))
+
+        # Sin historial: coeficiente del modelo, en un solo lote por chunk (sin modelo, 100)
+        missing = [i for i, (profile, _, _) in enumerate(evaluated) if profile.id not in coef_map] if has_model else []
+        predicted = dict(zip(missing, predict_coefficients(
+            [evaluated[i][0] for i in missing], [evaluated[i][1] for i in missing], [evaluated[i][2] for i in missing], server
+        ))) if missing else {}
+
+        candidates = []
+        for i, (profile, craft_cost, value_at_100) in enumerate(evaluated):
+            is_predicted = i in predicted
+            current_coef = float(predicted[i]) if is_predicted else coef_map.get(profile.id, 100)
+            min_coef, _, profit = profit_metrics(craft_cost, value_at_100, current_coef)
+
+            # Filter by Min Profit
+            if profit < min_profit:
+                continue
+
+            candidates.append((sort_value(sort_by, min_coef, profit), profile.id,
+                               (profile, craft_cost, value_at_100, current_coef, is_predicted)))
+        return candidates
+
+    async with scan_executor.slot():
+        candidates = await scan_executor.map_chunks(evaluate_chunk, items, is_cancelled)
+        selected, total, next_cursor = await scan_executor.run(select_page, candidates, sort_by, sort_order, page, limit, cursor)
+    page_items = [build_profit_item(*payload) for payload in selected]
+
+    logger.info(
+        "profit_scan server=%s types=%s items=%d results=%d duration_ms=%.1f",
+        server, ",".join(types), len(items), total, (time.perf_counter() - started) * 1000
+    )
+
+    return page_response(page_items, total, page, limit, next_cursor)
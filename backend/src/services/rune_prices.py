@@ -0,0 +1,144 @@
+import asyncio
+import hashlib
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+from sqlalchemy import select, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.db.database import AsyncSessionLocal
+from src.models.sql_models import RunePriceModel
+from src.services.calculator import LOCALIZATION, get_rune_name_translation
+from src.services.price_snapshot import price_snapshots
+from src.services.price_writer import seed_rune_rows
+
+logger = logging.getLogger(__name__)
+
+
+class RunePriceSnapshot:
+    """
+    Rune prices of one server as served by GET /prices/runes: canonical
+    name -> (price, image_url, updated_at), with images borrowed from other
+    servers when the row has none. The etag is a digest of the content.
+    """
+
+    __slots__ = ("server", "rows", "etag", "_by_lang")
+
+    def __init__(self, server: str, rows: Dict[str, Tuple[int, Optional[str], Optional[datetime]]]):
+        self.server = server
+        self.rows = rows
+        digest = hashlib.sha1()
+        for name in sorted(rows):
+            price, image_url, updated_at = rows[name]
+            digest.update(f"{name}\x1f{price}\x1f{image_url}\x1f{updated_at.isoformat() if updated_at else ''}\x1e".encode())
+        self.etag = digest.hexdigest()[:20]
+        self._by_lang: Dict[str, Dict[str, dict]] = {}
+
+    def etag_for(self, lang: str) -> str:
+        return f'"{self.etag}-{lang}"'
+
+    def payload(self, lang: str) -> Dict[str, dict]:
+        """Response body for a language, built once per snapshot."""
+        body = self._by_lang.get(lang)
+        if body is None:
+            body = {
+                get_rune_name_translation(name, lang): {"price": price, "image_url": image_url, "updated_at": updated_at}
+                for name, (price, image_url, updated_at) in self.rows.items()
+            }
+            self._by_lang[lang] = body
+        return body
+
+
+class RunePriceSnapshots:
+    """
+    In-memory snapshot per server for the most polled endpoint.
+
+    Missing rune rows are seeded once per server (at startup for the known
+    servers, otherwise on first read). A snapshot is loaded with a single
+    query and kept until a price write (from any worker, see
+    price_snapshots) or an image update invalidates it. A load that an
+    invalidation overtakes is served once but not kept, and nothing is kept
+    while price_snapshots is not listening.
+    """
+
+    def __init__(self):
+        self._seeded: Set[str] = set()
+        self._snapshots: Dict[str, RunePriceSnapshot] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        # Generación por servidor (y global, para invalidate()): sube en cada invalidación
+        self._generations: Dict[str, int] = {}
+        self._generation = 0
+        # Una imagen nueva (de este u otro worker) se guarda en todos los servidores
+        price_snapshots.on_image(lambda rune_name, url: self.invalidate())
+        # Precios escritos por este u otro worker
+        price_snapshots.on_change(self._on_price_change)
+
+    def _on_price_change(self, server: Optional[str], runes: Optional[Dict[str, int]], ingredients):
+        if runes is None or runes:
+            self.invalidate(server)
+
+    async def seed_known_servers(self):
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(select(RunePriceModel.server).distinct())
+            servers: List[str] = list(result.scalars())
+            for server in servers:
+                await self._seed(db, server)
+
+    async def _seed(self, db: AsyncSession, server: str):
+        await seed_rune_rows(db, server, LOCALIZATION.rune_names_es)
+        self._seeded.add(server)
+
+    async def get(self, db: AsyncSession, server: str) -> RunePriceSnapshot:
+        snapshot = self._snapshots.get(server)
+        if snapshot is not None:
+            return snapshot
+
+        lock = self._locks.setdefault(server, asyncio.Lock())
+        async with lock:
+            snapshot = self._snapshots.get(server)
+            if snapshot is None:
+                if server not in self._seeded:
+                    await self._seed(db, server)
+                generation = self._generation_of(server)
+                snapshot = await self._load(db, server)
+                # Si hubo una escritura durante la carga, la foto puede ser vieja: no se guarda.
+                # Sin LISTEN tampoco: no llegarían los cambios de otros workers
+                if price_snapshots.listening and self._generation_of(server) == generation:
+                    self._snapshots[server] = snapshot
+        return snapshot
+
+    def _generation_of(self, server: str) -> Tuple[int, int]:
+        return self._generation, self._generations.get(server, 0)
+
+    async def _load(self, db: AsyncSession, server: str) -> RunePriceSnapshot:
+        # Una sola consulta: las filas del servidor y las imágenes de los demás
+        result = await db.execute(
+            select(RunePriceModel.rune_name, RunePriceModel.server, RunePriceModel.price,
+                   RunePriceModel.image_url, RunePriceModel.updated_at)
+            .where(or_(RunePriceModel.server == server, RunePriceModel.image_url.isnot(None)))
+        )
+        own, images = {}, {}
+        for rune_name, row_server, price, image_url, updated_at in result:
+            if row_server == server:
+                own[rune_name] = (price, image_url, updated_at)
+            if image_url:
+                images.setdefault(rune_name, image_url)
+
+        rows = {
+            name: (price, image_url or images.get(name), updated_at)
+            for name, (price, image_url, updated_at) in own.items()
+        }
+        snapshot = RunePriceSnapshot(server, rows)
+        logger.debug("rune_snapshot_loaded server=%s runes=%d etag=%s", server, len(rows), snapshot.etag)
+        return snapshot
+
+    def invalidate(self, server: Optional[str] = None):
+        """Drops one server's snapshot, or all of them (images are shared)."""
+        if server is None:
+            self._generation += 1
+            self._snapshots.clear()
+        else:
+            self._generations[server] = self._generations.get(server, 0) + 1
+            self._snapshots.pop(server, None)
+
+
+rune_price_snapshots = RunePriceSnapshots()
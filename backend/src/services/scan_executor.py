@@ -0,0 +1,103 @@
+import asyncio
+import contextvars
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, List, Optional, Sequence, TypeVar
+from src.settings.config import env_settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class ScanBusy(Exception):
+    """Every scan slot stayed taken for scan_queue_timeout_seconds."""
+
+
+class ScanCancelled(Exception):
+    """The client went away between two chunks."""
+
+
+class ScanExecutor:
+    """
+    Runs CPU-bound scan kernels off the event loop.
+
+    Work is split in chunks that run one at a time on a small thread pool,
+    so the loop keeps serving cheap requests in between and a disconnected
+    client stops the scan at the next chunk boundary. A semaphore caps how
+    many scans run at once; the rest wait up to scan_queue_timeout_seconds.
+    """
+
+    def __init__(self, workers: int, max_concurrent: int, chunk_size: int):
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.max_concurrent = max_concurrent
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._slots = asyncio.Semaphore(max_concurrent)
+        self.running = 0
+        self.rejected = 0
+        self.cancelled = 0
+
+    @property
+    def pool(self) -> ThreadPoolExecutor:
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="scan")
+        return self._pool
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    @asynccontextmanager
+    async def slot(self):
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=env_settings.scan_queue_timeout_seconds)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise ScanBusy()
+        self.running += 1
+        try:
+            yield
+        finally:
+            self.running -= 1
+            self._slots.release()
+
+    async def run(self, fn: Callable[..., R], *args) -> R:
+        # El contexto (request_id, trazas) viaja con la tarea al hilo
+        ctx = contextvars.copy_context()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.pool, functools.partial(ctx.run, fn, *args))
+
+    async def map_chunks(self, fn: Callable[[Sequence[T]], List[R]], items: Sequence[T],
+                         is_cancelled: Optional[Callable[[], Awaitable[bool]]] = None) -> List[R]:
+        """
+        Calls fn on consecutive chunks of items in the pool and concatenates
+        the results. Raises ScanCancelled if is_cancelled() turns true.
+        """
+        results: List[R] = []
+        for start in range(0, len(items), self.chunk_size):
+            if is_cancelled is not None and await is_cancelled():
+                self.cancelled += 1
+                raise ScanCancelled()
+            results.extend(await self.run(fn, items[start:start + self.chunk_size]))
+        return results
+
+    def snapshot(self) -> dict:
+        return {
+            "workers": self.workers,
+            "max_concurrent": self.max_concurrent,
+            "running": self.running,
+            "rejected": self.rejected,
+            "cancelled": self.cancelled,
+        }
+
+
+scan_executor = ScanExecutor(
+    workers=env_settings.scan_workers,
+    max_concurrent=env_settings.scan_max_concurrent,
+    chunk_size=env_settings.scan_chunk_size,
+)
@@ -0,0 +1,296 @@
+import asyncio
+import importlib.util
+import logging
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Deque, Dict, Optional
+import httpx
+from src.settings.config import env_settings
+
+logger = logging.getLogger(__name__)
+
+DOFUSDUDE_API_BASE_URL = "https://api.dofusdu.de/dofus3/v1"
+
+# Carriles de prioridad: lo que espera un usuario pasa antes que los listados en segundo plano
+INTERACTIVE = "interactive"
+BULK = "bulk"
+LANES = (INTERACTIVE, BULK)
+
+THROTTLE_STATUSES = {429, 503}
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After in seconds, either as delta-seconds or as an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Request rate limit shared by every caller in the process."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class AdaptiveLimiter:
+    """
+    Concurrency limit with AIMD: +1 slot per window of healthy responses,
+    halved on throttling. Free slots go to the interactive lane first.
+    """
+
+    def __init__(self, initial: int, minimum: int, maximum: int):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = float(min(max(initial, minimum), maximum))
+        self.in_flight = 0
+        self._waiters: Dict[str, Deque[asyncio.Future]] = {lane: deque() for lane in LANES}
+        self._last_decrease = 0.0
+
+    def _has_waiters(self) -> bool:
+        return any(self._waiters[lane] for lane in LANES)
+
+    def _wake(self):
+        for lane in LANES:
+            waiters = self._waiters[lane]
+            while waiters and self.in_flight < int(self.limit):
+                future = waiters.popleft()
+                if future.done():
+                    continue
+                self.in_flight += 1
+                future.set_result(None)
+
+    async def acquire(self, lane: str):
+        if self.in_flight < int(self.limit) and not self._has_waiters():
+            self.in_flight += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[lane].append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Slot concedido justo antes de cancelar: se devuelve
+                self.release()
+            else:
+                self._waiters[lane].remove(future)
+            raise
+
+    def release(self):
+        self.in_flight -= 1
+        self._wake()
+
+    def on_success(self):
+        self.limit = min(self.maximum, self.limit + 1 / self.limit)
+        self._wake()
+
+    def on_throttle(self):
+        # Una ráfaga de 429 concurrentes cuenta como una sola señal
+        now = time.monotonic()
+        if now - self._last_decrease < 1.0:
+            return
+        self._last_decrease = now
+        self.limit = max(self.minimum, self.limit / 2)
+
+    def waiting(self) -> Dict[str, int]:
+        return {lane: sum(1 for f in self._waiters[lane] if not f.done()) for lane in LANES}
+
+
+class EndpointStats:
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.status_counts: Dict[int, int] = {}
+
+    def record(self, elapsed_ms: float, status_code: Optional[int]):
+        self.requests += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        if status_code is None:
+            self.errors += 1
+        else:
+            self.status_counts[status_code] = self.status_counts.get(status_code, 0) + 1
+
+    def as_dict(self) -> dict:
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "avg_ms": round(self.total_ms / self.requests, 2) if self.requests else 0.0,
+            "max_ms": round(self.max_ms, 2),
+            "status_counts": dict(self.status_counts),
+        }
+
+
+class UpstreamClient:
+    """
+    Single pooled httpx client for all dofusdu.de traffic.
+
+    Started and closed by the FastAPI lifespan. Scripts that never run the
+    lifespan still work: the client is created lazily on first use.
+
+    Every request goes through the same scheduler: an adaptive concurrency
+    limit with priority lanes, a token bucket, and a shared pause when
+    upstream answers 429/503 with Retry-After.
+    """
+
+    def __init__(self):
+        self._client: Optional[httpx.AsyncClient] = None
+        self.stats: Dict[str, EndpointStats] = {}
+        self.limiter = AdaptiveLimiter(
+            initial=env_settings.upstream_initial_concurrency,
+            minimum=env_settings.upstream_min_concurrency,
+            maximum=env_settings.upstream_max_concurrency,
+        )
+        self.bucket = TokenBucket(env_settings.upstream_rate_per_second, env_settings.upstream_burst)
+        self._paused_until = 0.0
+        self.throttled = 0
+
+    def _build_client(self) -> httpx.AsyncClient:
+        http2 = env_settings.upstream_http2
+        if http2 and importlib.util.find_spec("h2") is None:
+            logger.warning("upstream_http2_unavailable reason=h2_not_installed")
+            http2 = False
+
+        return httpx.AsyncClient(
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=env_settings.upstream_max_connections,
+                max_keepalive_connections=env_settings.upstream_max_keepalive_connections,
+                keepalive_expiry=env_settings.upstream_keepalive_expiry_seconds,
+            ),
+            timeout=httpx.Timeout(
+                env_settings.upstream_timeout_seconds,
+                connect=env_settings.upstream_connect_timeout_seconds,
+            ),
+        )
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = self._build_client()
+        return self._client
+
+    async def start(self):
+        _ = self.client
+        logger.info(
+            "upstream_started max_connections=%s keepalive=%s",
+            env_settings.upstream_max_connections, env_settings.upstream_max_keepalive_connections
+        )
+
+    async def close(self):
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+
+    def _pause(self, seconds: float) -> float:
+        # Un Retry-After enorme (o una fecha lejana) no deja al cliente parado indefinidamente
+        seconds = min(seconds, env_settings.upstream_max_retry_after_seconds)
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        return seconds
+
+    async def _wait_if_paused(self):
+        delay = self._paused_until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def _send(self, url: str, endpoint: str, priority: str, kwargs: dict) -> httpx.Response:
+        await self.limiter.acquire(priority)
+        try:
+            await self._wait_if_paused()
+            await self.bucket.acquire()
+
+            started = time.perf_counter()
+            status_code = None
+            try:
+                response = await self.client.get(url, **kwargs)
+                status_code = response.status_code
+                return response
+            finally:
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                self.stats.setdefault(endpoint, EndpointStats()).record(elapsed_ms, status_code)
+        finally:
+            self.limiter.release()
+
+    async def get(self, url: str, *, endpoint: str, params: dict = None, timeout: float = None,
+                  priority: str = INTERACTIVE) -> httpx.Response:
+        """
+        GET through the shared pool. `endpoint` is a short label used for the
+        latency counters (e.g. "equipment.search"); `priority` is the lane
+        (INTERACTIVE or BULK). Throttled responses are retried up to
+        upstream_max_retries times and the last one is returned. Network
+        errors are counted and re-raised.
+        """
+        kwargs = {"params": params}
+        if timeout is not None:
+            kwargs["timeout"] = timeout
+
+        attempt = 0
+        while True:
+            response = await self._send(url, endpoint, priority, kwargs)
+            if response.status_code not in THROTTLE_STATUSES:
+                self.limiter.on_success()
+                return response
+
+            self.throttled += 1
+            self.limiter.on_throttle()
+            delay = parse_retry_after(response.headers.get("Retry-After"))
+            if delay is None:
+                delay = env_settings.upstream_backoff_seconds * (2 ** attempt)
+            delay = self._pause(delay)
+
+            if attempt >= env_settings.upstream_max_retries:
+                logger.warning(
+                    "upstream_throttled endpoint=%s status=%s attempts=%d reason=max_retries",
+                    endpoint, response.status_code, attempt + 1
+                )
+                return response
+            logger.info(
+                "upstream_throttled endpoint=%s status=%s retry_in_s=%.1f limit=%.1f",
+                endpoint, response.status_code, delay, self.limiter.limit
+            )
+            attempt += 1
+
+    def snapshot(self) -> dict:
+        return {
+            "scheduler": {
+                "concurrency_limit": round(self.limiter.limit, 2),
+                "in_flight": self.limiter.in_flight,
+                "waiting": self.limiter.waiting(),
+                "tokens": round(self.bucket.tokens, 2),
+                "paused_for_s": round(max(self._paused_until - time.monotonic(), 0.0), 2),
+                "throttled": self.throttled,
+            },
+            "endpoints": {name: stats.as_dict() for name, stats in sorted(self.stats.items())},
+        }
+
+
+upstream = UpstreamClient()
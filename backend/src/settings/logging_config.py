@@ -0,0 +1,72 @@
+import logging
+import random
+import sys
+from contextvars import ContextVar
+from src.settings.config import env_settings, Environment
+
+# Header para activar trazas detalladas en una sola petición
+DEBUG_TRACE_HEADER = "X-Debug-Trace"
+
+# Paquetes propios: siempre en DEBUG, el filtro del handler decide qué sale
+APP_LOGGERS = ("src", "api", "services", "db", "models", "ocr", "settings")
+
+request_id_var: ContextVar[str] = ContextVar("request_id", default="-")
+request_debug_var: ContextVar[bool] = ContextVar("request_debug", default=False)
+
+_base_level = logging.INFO
+
+
+class RequestContextFilter(logging.Filter):
+    """
+    Adds request_id to every record and drops records below the configured
+    level, unless the current request asked for a debug trace.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return record.levelno >= _base_level or request_debug_var.get()
+
+
+def configure_logging(level: str = None):
+    global _base_level
+    _base_level = logging.getLevelName((level or env_settings.log_level).upper())
+    if not isinstance(_base_level, int):
+        _base_level = logging.INFO
+
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter(
+        "%(asctime)s level=%(levelname)s logger=%(name)s request_id=%(request_id)s %(message)s"
+    ))
+    handler.addFilter(RequestContextFilter())
+
+    for name in APP_LOGGERS:
+        app_logger = logging.getLogger(name)
+        app_logger.handlers = [handler]
+        app_logger.setLevel(logging.DEBUG)
+        app_logger.propagate = False
+
+
+def is_debug_trace_requested(header_value: str) -> bool:
+    if not header_value:
+        return False
+    if env_settings.debug_trace_token:
+        return header_value == env_settings.debug_trace_token
+    # Sin token configurado, el header solo se acepta fuera de producción
+    return env_settings.environment != Environment.PRODUCTION and header_value.lower() in {"1", "true", "yes"}
+
+
+def trace_enabled() -> bool:
+    """
+    Decide si se emite una traza detallada (por stat / por efecto).
+
+    Siempre en peticiones con el header de debug; si no, solo cuando el nivel
+    configurado es DEBUG, y muestreado con trace_sample_rate. Se llama una vez
+    por unidad de trabajo (un ítem, una resolución) para que la traza salga
+    completa o no salga.
+    """
+    if request_debug_var.get():
+        return True
+    if _base_level > logging.DEBUG:
+        return False
+    rate = env_settings.trace_sample_rate
+    return rate >= 1.0 or random.random() < rate
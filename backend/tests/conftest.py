@@ -0,0 +1,59 @@
+import os
+
+# Settings exige las credenciales de Postgres; los tests no abren conexiones
+os.environ.setdefault("POSTGRES_USER", "test")
+os.environ.setdefault("POSTGRES_PASSWORD", "test")
+os.environ.setdefault("POSTGRES_DB", "test")
+
+from types import SimpleNamespace
+from sqlalchemy.dialects import postgresql
+
+
+class FakeResult:
+    """The parts of a SQLAlchemy result the services read."""
+
+    def __init__(self, rows=(), scalar=None, rowcount=0):
+        self.rows = [SimpleNamespace(**row) if isinstance(row, dict) else row for row in rows]
+        self._scalar = scalar
+        self.rowcount = rowcount
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def all(self):
+        return list(self.rows)
+
+    def scalar(self):
+        return self._scalar
+
+    scalar_one = scalar
+    scalar_one_or_none = scalar
+
+
+class FakeSession:
+    """
+    AsyncSession stand-in: records every statement and answers each one
+    with respond(statement, compiled), a FakeResult.
+    """
+
+    def __init__(self, respond=None):
+        self.statements = []
+        self.commits = 0
+        self.respond = respond or (lambda statement, compiled: FakeResult())
+
+    async def execute(self, statement):
+        compiled = statement.compile(dialect=postgresql.dialect())
+        self.statements.append(compiled)
+        return self.respond(statement, compiled)
+
+    async def commit(self):
+        self.commits += 1
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def sql(self) -> list:
+        return [str(compiled) for compiled in self.statements]
@@ -0,0 +1,58 @@
+import asyncio
+import pytest
+from src.models.schemas import CalculateRequest, ItemStat
+from src.services.batch_calculator import calculate_profit_batch
+from src.services.calculator import calculate_profit
+from src.services.image_store import rune_image_store
+
+
+@pytest.fixture(autouse=True)
+def no_image_fetch(monkeypatch):
+    # Sin red: las imágenes salen vacías
+    monkeypatch.setattr(rune_image_store, "get", lambda rune_name: None)
+
+
+def request(stats, coefficient=211, item_cost=5000, level=200, prices=None):
+    return CalculateRequest(
+        item_level=level,
+        stats=[ItemStat(name=name, value=value) for name, value in stats],
+        coefficient=coefficient,
+        item_cost=item_cost,
+        rune_prices=prices if prices is not None else {"Runa Fo": 40, "Runa Vi": 12, "Runa Ga Pa": 90000, "Runa Pod": 30},
+    )
+
+
+REQUESTS = [
+    request([("Fuerza", 50)]),
+    request([("Fuerza", 80), ("Vitalidad", 300), ("PA", 1)], coefficient=95, item_cost=120000),
+    request([("Vitalidad", 150), ("Fuerza", -20), ("Pods", 400)], level=120),
+    # Stat repetida: calculate_profit usa el VR de la última aparición
+    request([("Fuerza", 10), ("Fuerza", 60)]),
+    request([("Estadística desconocida", 5)]),
+    request([], item_cost=100),
+]
+
+
+def test_batch_matches_calculate_profit():
+    async def run():
+        singles = [await calculate_profit(req) for req in REQUESTS]
+        return singles, await calculate_profit_batch(REQUESTS)
+
+    singles, batch = asyncio.run(run())
+    assert len(batch) == len(singles)
+    for single, batched in zip(singles, batch):
+        assert batched.net_profit == pytest.approx(single.net_profit)
+        assert batched.total_estimated_value == pytest.approx(single.total_estimated_value)
+        assert batched.max_focus_profit == pytest.approx(single.max_focus_profit)
+        assert batched.best_focus_stat == single.best_focus_stat
+        assert len(batched.breakdown) == len(single.breakdown)
+        for b, s in zip(batched.breakdown, single.breakdown):
+            assert (b.stat, b.rune_name) == (s.stat, s.rune_name)
+            assert b.count == pytest.approx(s.count)
+            assert b.value == pytest.approx(s.value)
+            assert b.focus_count == pytest.approx(s.focus_count)
+            assert b.focus_value == pytest.approx(s.focus_value)
+
+
+def test_empty_batch():
+    assert asyncio.run(calculate_profit_batch([])) == []
@@ -0,0 +1,120 @@
+import threading
+import time
+import httpx
+import numpy as np
+from src.ocr import capture
+from src.ocr.capture import BatchUploader, FrameDiff
+
+RealClient = httpx.Client
+
+
+def panel(price_shade: int = 30) -> np.ndarray:
+    img = np.full((120, 200, 3), 30, dtype=np.uint8)
+    img[40:60, 100:130] = price_shade
+    return img
+
+
+def test_frame_diff_ignores_noise_but_sees_a_changed_block():
+    diff = FrameDiff()
+    base = diff.thumbnail(panel())
+    noisy = diff.thumbnail(np.clip(panel().astype(np.int16) + 10, 0, 255).astype(np.uint8))
+    changed = diff.thumbnail(panel(price_shade=230))
+
+    assert base.shape == (60, 100)
+    assert diff.changed(None, base)
+    assert not diff.changed(base, base)
+    assert not diff.changed(base, noisy)
+    assert diff.changed(base, changed)
+    assert diff.changed(base, diff.thumbnail(np.zeros((100, 200, 3), dtype=np.uint8)))
+
+
+def test_frame_diff_needs_min_changed_pixels():
+    diff = FrameDiff(scale=1.0, min_changed_pixels=4)
+    base = diff.thumbnail(panel())
+    speck = panel()
+    speck[0, 0:3] = 255
+
+    assert not diff.changed(base, diff.thumbnail(speck))
+    speck[0, 3] = 255
+    assert diff.changed(base, diff.thumbnail(speck))
+
+
+def client_for(handler) -> httpx.Client:
+    return RealClient(transport=httpx.MockTransport(handler))
+
+
+def test_send_reports_results_and_survives_a_failing_callback():
+    seen = []
+
+    def on_result(result):
+        seen.append(result["filename"])
+        raise RuntimeError("ui closed")
+
+    def handler(request):
+        assert request.url.params["server"] == "Dakal"
+        return httpx.Response(200, json={"saved": 2, "changed": 1,
+                                         "results": [{"filename": "a.png"}, {"filename": "b.png"}]})
+
+    uploader = BatchUploader("http://api/api/", "Dakal", on_result=on_result)
+    uploader._send(client_for(handler), [("a.png", b"1"), ("b.png", b"2")])
+
+    assert uploader.url == "http://api/api/scan/batch"
+    assert seen == ["a.png", "b.png"]
+    assert uploader.sent == 2 and uploader.failed == 0
+
+
+def test_send_tolerates_a_body_that_is_not_json():
+    uploader = BatchUploader("http://api", "Dakal", on_result=lambda result: None)
+    uploader._send(client_for(lambda request: httpx.Response(200, text="<html>proxy</html>")), [("a.png", b"1")])
+
+    assert uploader.sent == 1 and uploader.failed == 0
+
+
+def test_send_counts_failures_and_retries_once_after_429(monkeypatch):
+    monkeypatch.setattr(capture.time, "sleep", lambda seconds: None)
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(429, headers={"Retry-After": "Wed, 21 Oct 2026 07:28:00 GMT"})
+
+    uploader = BatchUploader("http://api", "Dakal")
+    uploader._send(client_for(handler), [("a.png", b"1"), ("b.png", b"2")])
+
+    assert len(calls) == 2
+    assert uploader.failed == 2 and uploader.sent == 0
+
+
+def test_batches_leave_by_size_and_the_rest_on_close(monkeypatch):
+    batches = []
+
+    def handler(request):
+        batches.append(request.content.count(b'name="files"'))
+        return httpx.Response(200, json={"results": []})
+
+    monkeypatch.setattr(capture.httpx, "Client", lambda timeout: client_for(handler))
+    uploader = BatchUploader("http://api", "Dakal", batch_size=2, flush_seconds=60)
+    uploader.start()
+    for i in range(3):
+        uploader.put(f"{i}.png", b"png")
+    uploader.close(timeout=5)
+
+    assert batches == [2, 1]
+    assert uploader.sent == 3
+
+
+def test_put_and_close_drop_the_oldest_frames_instead_of_blocking():
+    uploader = BatchUploader("http://api", "Dakal", max_pending=2)
+    for i in range(3):
+        uploader.put(f"{i}.png", b"png")
+    assert uploader.dropped == 1
+
+    # Un hilo de envío atascado no consume la cola
+    uploader._thread = threading.Thread(target=time.sleep, args=(0.2,), daemon=True)
+    uploader._thread.start()
+    started = time.monotonic()
+    uploader.close(timeout=1)
+
+    assert time.monotonic() - started < 1.5
+    assert uploader.dropped == 2
+    assert [uploader._frames.get_nowait(), uploader._frames.get_nowait()] == [("2.png", b"png"), None]
@@ -0,0 +1,106 @@
+import os
+import numpy as np
+import pytest
+from src.services.coefficient_model import CoefficientModel, CoefficientPredictor, training_columns
+
+
+def make_rows(n=60, seed=0):
+    """Export-like rows (strings, as read back from the CSV) with coefficient ~ cost ratio."""
+    rng = np.random.default_rng(seed)
+    rows = []
+    for i in range(n):
+        value_at_100 = float(rng.uniform(1_000, 50_000))
+        craft_cost = float(value_at_100 * rng.uniform(0.2, 2.0))
+        coefficient = round(60 + 40 * craft_cost / value_at_100, 2)
+        rows.append({
+            "real_coefficient": str(coefficient),
+            "craft_cost": str(craft_cost),
+            "rune_value_real": str(value_at_100 * coefficient / 100),
+            "item_level": str(int(rng.integers(1, 200))),
+            "recipe_difficulty": str(int(rng.integers(1, 8))),
+            "has_high_value_rune": "true" if i % 3 == 0 else "false",
+            "item_type": "Anillo" if i % 2 else "Amuleto",
+            "server": "Dakal",
+        })
+    return rows
+
+
+def predict_rows(model, rows):
+    columns = training_columns(rows)
+    return model.predict(columns["craft_cost"], columns["value_at_100"], columns["item_level"],
+                         columns["recipe_size"], columns["high_value"], columns["item_type"], columns["server"])
+
+
+def test_training_columns_skip_unusable_rows_and_scale_the_rune_value():
+    rows = [
+        {"real_coefficient": "200", "craft_cost": "1000", "rune_value_real": "3000", "has_high_value_rune": "t"},
+        {"real_coefficient": "", "craft_cost": "1000", "rune_value_real": "3000"},
+        {"real_coefficient": "120", "craft_cost": "0", "rune_value_real": "3000"},
+        {"real_coefficient": "120", "craft_cost": "1000", "rune_value_real": None},
+    ]
+    columns = training_columns(rows)
+
+    assert columns["target"].tolist() == [200.0]
+    # El valor guardado es al coeficiente real; se lleva a 100%
+    assert columns["value_at_100"].tolist() == [1500.0]
+    assert columns["item_level"].tolist() == [1.0]
+    assert columns["high_value"].tolist() == [1.0]
+    assert columns["item_type"].tolist() == [None]
+
+
+def test_fit_needs_two_usable_rows():
+    with pytest.raises(ValueError):
+        CoefficientModel.fit(make_rows(1))
+    with pytest.raises(ValueError):
+        CoefficientModel.fit([])
+
+
+def test_fit_learns_the_trend_and_clips_to_the_training_range():
+    rows = make_rows()
+    model = CoefficientModel.fit(rows, alpha=0.1)
+    target = training_columns(rows)["target"]
+    predicted = predict_rows(model, rows)
+
+    assert model.info["rows"] == len(rows)
+    assert model.item_types == ["Amuleto", "Anillo"]
+    assert np.mean(np.abs(predicted - target)) < np.mean(np.abs(target - target.mean())) / 2
+    assert predicted.min() >= target.min() and predicted.max() <= target.max()
+
+
+def test_predict_accepts_one_server_and_unknown_categories():
+    model = CoefficientModel.fit(make_rows(), alpha=0.1)
+    predicted = model.predict([5000.0, 5000.0], [10000.0, 10000.0], [100, 100], [3, 3], [False, False],
+                              ["Anillo", "Sombrero"], "Servidor nuevo")
+
+    assert predicted.shape == (2,)
+    assert np.isfinite(predicted).all()
+    assert model.predict([], [], [], [], [], [], "Dakal").shape == (0,)
+
+
+def test_save_and_load_round_trip(tmp_path):
+    rows = make_rows()
+    model = CoefficientModel.fit(rows)
+    path = str(tmp_path / "models" / "coefficients.npz")
+    model.save(path)
+    loaded = CoefficientModel.load(path)
+
+    assert not os.path.exists(f"{path}.tmp.npz")
+    assert loaded.servers == model.servers and loaded.clip == model.clip
+    assert loaded.info["rows"] == len(rows)
+    np.testing.assert_array_equal(predict_rows(loaded, rows), predict_rows(model, rows))
+
+
+def test_predictor_uses_the_default_until_a_model_appears(tmp_path):
+    path = str(tmp_path / "coefficients.npz")
+    predictor = CoefficientPredictor(path, default=100.0, check_seconds=0)
+
+    assert predictor.predict([1.0, 2.0], [1.0, 1.0], [1, 1], [1, 1], [0, 0], [None, None], "Dakal").tolist() == [100.0, 100.0]
+    assert predictor.snapshot()["loaded"] is False
+
+    CoefficientModel.fit(make_rows()).save(path)
+    assert predictor.current() is not None
+    assert predictor.version == 1
+
+    os.remove(path)
+    assert predictor.current() is None
+    assert predictor.version == 2
@@ -0,0 +1,103 @@
+import asyncio
+import csv
+import gzip
+import io
+from datetime import datetime, timezone
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from src.api import export_routes
+from src.services import dataset_export
+from src.services.dataset_export import ARROW, CSV_GZ, PARQUET, ExportQuery, export_stream, make_encoder
+
+ROWS = [
+    (1, 100, "Dakal", 120.5, datetime(2026, 1, 2, 3, 4, 5, tzinfo=timezone.utc)),
+    (2, 101, "Draconiros", None, datetime(2026, 1, 3, tzinfo=timezone.utc)),
+    (3, 102, "Dakal", 98.0, None),
+]
+
+
+def collect(monkeypatch, export, file_format, batches):
+    async def fake_batches(export, batch_rows):
+        for batch in batches:
+            yield batch
+
+    async def run():
+        return b"".join([chunk async for chunk in export_stream(export, file_format, batch_rows=2)])
+
+    # Los lotes que daría el cursor del servidor
+    monkeypatch.setattr(dataset_export, "stream_batches", fake_batches)
+    return asyncio.run(run())
+
+
+def test_csv_gz_is_one_gzip_member_with_header(monkeypatch):
+    export = ExportQuery("coefficients")
+    data = collect(monkeypatch, export, CSV_GZ, [ROWS[:2], ROWS[2:]])
+
+    lines = list(csv.reader(io.StringIO(gzip.decompress(data).decode("utf-8"))))
+    assert lines[0] == export.names == ["id", "item_id", "server", "coefficient", "created_at"]
+    assert lines[1] == ["1", "100", "Dakal", "120.5", "2026-01-02T03:04:05+00:00"]
+    assert lines[2][3] == ""
+    assert len(lines) == 4
+
+
+def test_empty_csv_export_still_has_a_header(monkeypatch):
+    export = ExportQuery("coefficients")
+    data = collect(monkeypatch, export, CSV_GZ, [])
+    assert gzip.decompress(data).decode("utf-8").strip() == ",".join(export.names)
+
+
+def test_filters_are_applied_to_the_query():
+    sql = str(ExportQuery("predictions", server="Dakal", saved=True,
+                          start=datetime(2026, 1, 1), end=datetime(2026, 2, 1)).query)
+    assert "prediction_dataset.server = :server_1" in sql
+    assert "prediction_dataset.saved = true" in sql
+    assert "created_at >= :created_at_1" in sql and "created_at < :created_at_2" in sql
+    assert "ORDER BY prediction_dataset.id" in sql
+    # coefficients no tiene saved: el filtro se ignora
+    assert "saved" not in str(ExportQuery("coefficients", saved=True).query)
+
+
+@pytest.mark.parametrize("file_format", [PARQUET, ARROW])
+def test_arrow_formats_round_trip(monkeypatch, file_format):
+    pa = pytest.importorskip("pyarrow")
+    export = ExportQuery("coefficients")
+    data = collect(monkeypatch, export, file_format, [ROWS[:2], ROWS[2:]])
+
+    if file_format == PARQUET:
+        import pyarrow.parquet as pq
+        table = pq.read_table(pa.BufferReader(data))
+    else:
+        table = pa.ipc.open_stream(data).read_all()
+    assert table.column_names == export.names
+    assert table.column("coefficient").to_pylist() == [120.5, None, 98.0]
+    assert table.column("item_id").type == pa.int64()
+
+
+def test_missing_pyarrow_is_reported(monkeypatch):
+    monkeypatch.setattr(dataset_export, "arrow_available", lambda: False)
+    with pytest.raises(dataset_export.ExportUnavailable):
+        make_encoder(ExportQuery("coefficients"), PARQUET)
+    assert dataset_export.available_formats() == {CSV_GZ: True, PARQUET: False, ARROW: False}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(export_routes.env_settings, "export_token", "secret")
+    app = FastAPI()
+    app.include_router(export_routes.router)
+    return TestClient(app)
+
+
+def test_route_rejects_arrow_formats_without_pyarrow(client, monkeypatch):
+    monkeypatch.setattr(export_routes, "arrow_available", lambda: False)
+    response = client.get("/export/predictions", params={"format": "parquet"}, headers={"X-Export-Token": "secret"})
+    assert response.status_code == 400
+    assert "pyarrow" in response.json()["detail"]
+
+
+def test_route_checks_token_dataset_and_format(client):
+    assert client.get("/export/predictions").status_code == 403
+    headers = {"X-Export-Token": "secret"}
+    assert client.get("/export/unknown", headers=headers).status_code == 404
+    assert client.get("/export/predictions", params={"format": "xlsx"}, headers=headers).status_code == 400
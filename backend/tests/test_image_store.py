@@ -0,0 +1,94 @@
+import asyncio
+import json
+from src.services import image_store
+from src.services.image_store import ImageSearchError, RuneImageStore
+from src.services.price_snapshot import price_snapshots
+from src.services.rune_prices import rune_price_snapshots
+from tests.conftest import FakeResult, FakeSession
+
+
+def make_store(monkeypatch, search):
+    store = RuneImageStore(max_entries=10, ttl_seconds=3600, negative_ttl_seconds=600, fetch_concurrency=2)
+    persisted = []
+
+    async def persist(rune_name, url):
+        persisted.append((rune_name, url))
+
+    monkeypatch.setattr(image_store, "search_rune_image", search)
+    monkeypatch.setattr(store, "_persist", persist)
+    return store, persisted
+
+
+def test_upstream_error_keeps_existing_entry(monkeypatch):
+    async def search(rune_name, lang="es"):
+        raise ImageSearchError("status 503")
+
+    store, persisted = make_store(monkeypatch, search)
+    store.put("Runa Fo", "https://img/fo.png")
+    asyncio.run(store._fetch("Runa Fo"))
+    asyncio.run(store._fetch("Runa Vi"))
+
+    assert store.get("Runa Fo") == "https://img/fo.png"
+    assert "Runa Vi" not in store._entries
+    assert persisted == []
+    assert not store._pending
+
+
+def test_not_found_is_negative_cached(monkeypatch):
+    async def search(rune_name, lang="es"):
+        return None
+
+    store, persisted = make_store(monkeypatch, search)
+    asyncio.run(store._fetch("Runa Rara"))
+
+    url, expires_at = store._entries["Runa Rara"]
+    assert url is None
+    assert persisted == []
+
+
+def test_found_url_is_cached_and_persisted(monkeypatch):
+    async def search(rune_name, lang="es"):
+        return "https://img/new.png"
+
+    store, persisted = make_store(monkeypatch, search)
+    store.put("Runa Fo", "https://img/old.png")
+    asyncio.run(store._fetch("Runa Fo"))
+
+    assert store.get("Runa Fo") == "https://img/new.png"
+    assert persisted == [("Runa Fo", "https://img/new.png")]
+
+
+def test_lru_is_bounded():
+    entries = 3
+    store = RuneImageStore(max_entries=entries, ttl_seconds=3600, negative_ttl_seconds=600, fetch_concurrency=1)
+    for i in range(entries + 2):
+        store.put(f"Runa {i}", f"https://img/{i}.png")
+    assert list(store._entries) == [f"Runa {i}" for i in range(2, entries + 2)]
+
+
+def test_persist_notifies_other_workers(monkeypatch):
+    db = FakeSession(lambda statement, compiled: FakeResult(rowcount=2))
+    monkeypatch.setattr(image_store, "AsyncSessionLocal", lambda: db)
+    applied = []
+    monkeypatch.setattr(price_snapshots, "apply_image", lambda rune_name, url: applied.append((rune_name, url)))
+    store = RuneImageStore(max_entries=10, ttl_seconds=3600, negative_ttl_seconds=600, fetch_concurrency=1)
+
+    asyncio.run(store._persist("Runa Fo", "https://img/fo.png"))
+
+    update, notify = db.sql()
+    assert "image_url IS DISTINCT FROM" in update
+    assert "pg_notify" in notify
+    assert '{"kind":"image","rune":"Runa Fo","url":"https://img/fo.png"}' in db.statements[1].params.values()
+    assert db.commits == 1
+    assert applied == [("Runa Fo", "https://img/fo.png")]
+
+
+def test_image_notification_refreshes_store_and_rune_snapshots(monkeypatch):
+    invalidated = []
+    monkeypatch.setattr(rune_price_snapshots, "invalidate", lambda server=None: invalidated.append(server))
+
+    payload = json.dumps({"kind": "image", "rune": "Runa Ga Pa", "url": "https://img/pa.png"})
+    asyncio.run(price_snapshots._on_notify(payload))
+
+    assert image_store.rune_image_store._entries["Runa Ga Pa"][0] == "https://img/pa.png"
+    assert invalidated == [None]
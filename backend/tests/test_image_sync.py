@@ -0,0 +1,112 @@
+import asyncio
+import json
+import threading
+import time
+import pytest
+from src.services.image_sync import RuneImageSyncJob
+
+
+@pytest.fixture
+def job(tmp_path):
+    return RuneImageSyncJob(state_file=str(tmp_path / "sync.json"), concurrency=2, dsn="postgresql://unused")
+
+
+def write_state(job, state):
+    with open(job.state_file, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+
+
+def locked(job, monkeypatch, value):
+    async def locked_elsewhere():
+        return value
+    monkeypatch.setattr(job, "_locked_elsewhere", locked_elsewhere)
+
+
+def test_status_is_idle_without_state(job, monkeypatch):
+    locked(job, monkeypatch, False)
+    status = asyncio.run(job.status())
+    assert status["status"] == "idle"
+    assert status["counts"] == {}
+
+
+def test_status_reads_the_shared_state_file(job, monkeypatch):
+    # Lo escribió el worker que corre el job y todavía tiene el lock
+    write_state(job, {"job_id": "abc", "status": "running", "started_at": 1.0, "finished_at": None,
+                      "runes": {"Runa Fo": {"status": "updated"}, "Runa Vi": {"status": "pending"}}})
+    locked(job, monkeypatch, True)
+
+    status = asyncio.run(job.status())
+    assert status["job_id"] == "abc"
+    assert status["status"] == "running"
+    assert status["counts"] == {"updated": 1, "pending": 1}
+
+
+def test_running_state_without_lock_is_interrupted(job, monkeypatch):
+    write_state(job, {"job_id": "abc", "status": "running", "runes": {}})
+    locked(job, monkeypatch, False)
+    assert asyncio.run(job.status())["status"] == "interrupted"
+
+
+def test_unreadable_state_is_ignored(job, monkeypatch):
+    with open(job.state_file, "w", encoding="utf-8") as f:
+        f.write("{not json")
+    locked(job, monkeypatch, False)
+    assert asyncio.run(job.status())["status"] == "idle"
+
+
+class FakeLockConnection:
+    closed = False
+
+    async def close(self):
+        self.closed = True
+
+
+def test_run_saves_one_state_at_a_time(job, monkeypatch, tmp_path):
+    names = [f"Runa {i}" for i in range(20)]
+    writing, overlaps, write_state = [0], [], job._write_state
+    guard = threading.Lock()
+
+    def tracked_write(state):
+        with guard:
+            writing[0] += 1
+            overlaps.append(writing[0])
+        time.sleep(0.002)
+        write_state(state)
+        with guard:
+            writing[0] -= 1
+
+    async def sync_rune(name):
+        await asyncio.sleep(0)
+        return {"status": "updated", "url": f"https://img/{name}.png", "rows": 1}
+
+    monkeypatch.setattr(job, "_write_state", tracked_write)
+    monkeypatch.setattr(job, "_sync_rune", sync_rune)
+    job.concurrency = 8
+    job._state = {"job_id": "abc", "status": "running", "runes": {name: {"status": "pending"} for name in names}}
+    connection = FakeLockConnection()
+
+    asyncio.run(job._run(names, connection))
+
+    assert max(overlaps) == 1
+    assert connection.closed
+    with open(job.state_file, encoding="utf-8") as f:
+        state = json.load(f)
+    assert state["status"] == "done"
+    assert all(outcome["status"] == "updated" for outcome in state["runes"].values())
+    # Cada escritura usa su propio temporal y no deja restos
+    assert [path.name for path in tmp_path.iterdir()] == ["sync.json"]
+
+
+def test_failed_state_write_does_not_stop_the_job(job, monkeypatch):
+    def broken_write(state):
+        raise OSError("disk full")
+
+    async def sync_rune(name):
+        return {"status": "unchanged", "url": "https://img/x.png", "rows": 0}
+
+    monkeypatch.setattr(job, "_write_state", broken_write)
+    monkeypatch.setattr(job, "_sync_rune", sync_rune)
+    job._state = {"job_id": "abc", "status": "running", "runes": {"Runa Fo": {"status": "pending"}}}
+
+    asyncio.run(job._run(["Runa Fo"], FakeLockConnection()))
+    assert job._state["status"] == "done"
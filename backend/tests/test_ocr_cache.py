@@ -0,0 +1,92 @@
+import cv2
+import numpy as np
+from src.services.ocr_cache import OcrResultCache, screenshot_key
+
+
+def panel(name: str, price: str, noise_at=None) -> bytes:
+    """PNG of a market panel: name at the top (name ROI), one lot row below y=180 (price ROI)."""
+    img = np.full((300, 420, 3), 30, dtype=np.uint8)
+    cv2.putText(img, name, (90, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (230, 230, 230), 1, cv2.LINE_AA)
+    cv2.putText(img, f"x1 {price}", (70, 220), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (230, 230, 230), 1, cv2.LINE_AA)
+    if noise_at is not None:
+        img[noise_at] = (120, 120, 120)
+    ok, png = cv2.imencode(".png", img)
+    assert ok
+    return png.tobytes()
+
+
+def test_same_panel_hits():
+    cache = OcrResultCache(max_entries=8, max_distance=0)
+    cache.store(cache.key(panel("Anillo", "792")), {"precios_mercado": {"x1": 792}})
+
+    cached = cache.lookup(cache.key(panel("Anillo", "792")))
+    assert cached == {"precios_mercado": {"x1": 792}}
+    assert cache.hits == 1
+
+
+def test_one_digit_price_change_misses():
+    cache = OcrResultCache(max_entries=8, max_distance=0)
+    cache.store(cache.key(panel("Anillo", "792")), {"precios_mercado": {"x1": 792}})
+
+    assert cache.lookup(cache.key(panel("Anillo", "793"))) is None
+    assert cache.misses == 1
+
+
+def test_one_digit_price_change_misses_even_with_name_tolerance():
+    # La tolerancia es solo para el nombre: los precios deben ser idénticos
+    cache = OcrResultCache(max_entries=8, max_distance=64)
+    cache.store(cache.key(panel("Anillo", "792")), {"precios_mercado": {"x1": 792}})
+
+    assert cache.lookup(cache.key(panel("Anillo", "793"))) is None
+    assert cache.near_hits == 0
+
+
+def test_name_tolerance_allows_near_hits_with_identical_prices():
+    # Una mancha de ruido en la ROI del nombre
+    noisy = panel("Anillo", "792", noise_at=(slice(44, 48), slice(300, 304)))
+
+    strict = OcrResultCache(max_entries=8, max_distance=0)
+    strict.store(strict.key(panel("Anillo", "792")), {"precios_mercado": {"x1": 792}})
+    assert strict.lookup(strict.key(noisy)) is None
+
+    tolerant = OcrResultCache(max_entries=8, max_distance=8)
+    tolerant.store(tolerant.key(panel("Anillo", "792")), {"precios_mercado": {"x1": 792}})
+    assert tolerant.lookup(tolerant.key(noisy)) == {"precios_mercado": {"x1": 792}}
+    assert tolerant.near_hits == 1
+
+
+def test_key_hashes_prices_exactly():
+    key = screenshot_key(panel("Anillo", "792"))
+    noisy = screenshot_key(panel("Anillo", "792", noise_at=(250, 200)))
+
+    assert key[:3] == noisy[:3]
+    assert key[3] != noisy[3]
+    assert screenshot_key(b"not an image") is None
+
+
+def test_errors_are_not_stored_and_results_are_copies():
+    cache = OcrResultCache(max_entries=8, max_distance=0)
+    key = cache.key(panel("Anillo", "792"))
+    cache.store(key, {"error": "no text"})
+    assert cache.lookup(key) is None
+
+    cache.store(key, {"precios_mercado": {"x1": 792}})
+    cache.lookup(key)["precios_mercado"]["x1"] = 1
+    assert cache.lookup(key) == {"precios_mercado": {"x1": 792}}
+
+
+def test_lru_evicts_the_oldest_entry():
+    cache = OcrResultCache(max_entries=2, max_distance=0)
+    keys = [cache.key(panel("Anillo", price)) for price in ("100", "200", "300")]
+    for key in keys:
+        cache.store(key, {"precios_mercado": {}})
+
+    assert cache.lookup(keys[0]) is None
+    assert cache.lookup(keys[2]) is not None
+    assert cache.snapshot()["entries"] == 2
+
+
+def test_disabled_cache_has_no_keys():
+    cache = OcrResultCache(max_entries=0, max_distance=0)
+    assert not cache.enabled
+    assert cache.key(panel("Anillo", "792")) is None
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+from pydantic import ValidationError
+from src.ocr import engine
+from src.ocr.engine import OcrEngine, PytesseractEngine, _create_engine
+from src.settings.config import OcrEngineName, Settings
+
+
+def test_engines_must_implement_image_to_string():
+    class Incomplete(OcrEngine):
+        name = "incomplete"
+
+    class Echo(OcrEngine):
+        name = "echo"
+
+        def image_to_string(self, image: np.ndarray, profile: str, timeout: float = 0) -> str:
+            return profile
+
+    with pytest.raises(TypeError):
+        OcrEngine()
+    with pytest.raises(TypeError):
+        Incomplete()
+    assert Echo().image_to_string(np.zeros((1, 1)), engine.PRECIOS) == engine.PRECIOS
+
+
+def test_unknown_engine_is_rejected():
+    with pytest.raises(ValueError, match="tesseroc"):
+        _create_engine("tesseroc")
+
+
+def test_auto_falls_back_to_pytesseract_without_tesserocr(monkeypatch):
+    monkeypatch.setattr(engine, "tesserocr_available", lambda: False)
+
+    assert isinstance(_create_engine("auto"), PytesseractEngine)
+    assert isinstance(_create_engine("pytesseract"), PytesseractEngine)
+
+
+def test_settings_reject_an_unknown_engine(monkeypatch):
+    monkeypatch.setenv("OCR_ENGINE", "tesseroc")
+    with pytest.raises(ValidationError):
+        Settings()
+
+    monkeypatch.setenv("OCR_ENGINE", "tesserocr")
+    assert Settings().ocr_engine == OcrEngineName.TESSEROCR
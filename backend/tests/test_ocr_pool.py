@@ -0,0 +1,189 @@
+import asyncio
+import time
+import pytest
+from src.services import ocr_pool as ocr_pool_module
+from src.services.ocr_pool import LatencyStats, OcrBusy, OcrPool, OcrTimeout
+
+
+# Jobs de prueba: a nivel de módulo para que el proceso spawn los importe
+
+def quick_job(image_bytes: bytes, tesseract_timeout: float):
+    return {"nombre_objeto": image_bytes.decode()}, 1.0, "fake"
+
+
+def stuck_job(image_bytes: bytes, tesseract_timeout: float):
+    time.sleep(60)
+
+
+def nap_job(image_bytes: bytes, tesseract_timeout: float):
+    time.sleep(float(image_bytes))
+    return {"slept": float(image_bytes)}, float(image_bytes) * 1000, "fake"
+
+
+def failing_job(image_bytes: bytes, tesseract_timeout: float):
+    raise ValueError("bad image")
+
+
+class NoCache:
+    enabled = False
+
+    def key(self, image_bytes):
+        return None
+
+    def lookup(self, key):
+        return None
+
+    def store(self, key, result):
+        pass
+
+
+def make_pool(monkeypatch, job, timeout_seconds=5.0, max_queue=2):
+    # El job se pasa al worker por referencia: los de este módulo se importan en el proceso spawn
+    monkeypatch.setattr(ocr_pool_module, "_ocr_job", job)
+    monkeypatch.setattr(ocr_pool_module, "ocr_cache", NoCache())
+    return OcrPool(workers=1, max_queue=max_queue, timeout_seconds=timeout_seconds)
+
+
+def wait_until(condition, seconds=10.0):
+    deadline = time.monotonic() + seconds
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return condition()
+
+
+def test_run_returns_the_worker_result_and_records_latency(monkeypatch):
+    pool = make_pool(monkeypatch, quick_job)
+    try:
+        data = asyncio.run(pool.run(b"Anillo"))
+    finally:
+        pool.close()
+
+    assert data == {"nombre_objeto": "Anillo"}
+    assert pool.engine == "fake"
+    assert pool.pending == 0
+    snapshot = pool.snapshot()
+    assert snapshot["run"]["count"] == snapshot["total"]["count"] == 1
+
+
+def test_run_many_keeps_order_and_reports_failures_in_place(monkeypatch):
+    pool = make_pool(monkeypatch, quick_job)
+    try:
+        results = asyncio.run(pool.run_many([b"a", b"b", b"c"]))
+    finally:
+        pool.close()
+
+    assert [result["nombre_objeto"] for result in results] == ["a", "b", "c"]
+
+    pool = make_pool(monkeypatch, failing_job)
+    try:
+        results = asyncio.run(pool.run_many([b"a"]))
+    finally:
+        pool.close()
+    assert isinstance(results[0], ValueError)
+    assert pool.errors == 1 and pool.pending == 0
+
+
+def test_admission_rejects_past_workers_plus_queue():
+    pool = OcrPool(workers=1, max_queue=1, timeout_seconds=1.0)
+    pool.pending = 2
+
+    with pytest.raises(OcrBusy):
+        asyncio.run(pool.run_many([b"a"]))
+    assert pool.rejected == 1
+
+
+def test_admission_counts_the_jobs_being_admitted():
+    pool = OcrPool(workers=2, max_queue=1, timeout_seconds=1.0)
+    pool.pending = 1
+
+    pool._admit(2)
+    with pytest.raises(OcrBusy):
+        pool._admit(3)
+
+
+def test_a_large_batch_only_holds_workers_places(monkeypatch):
+    pool = make_pool(monkeypatch, nap_job, max_queue=2)
+    seen = []
+
+    async def run():
+        task = asyncio.create_task(pool.run_many([b"0.2", b"0.21", b"0.22", b"0.23", b"0.24"]))
+        while not task.done():
+            seen.append(pool.pending)
+            await asyncio.sleep(0.02)
+        return await task
+
+    try:
+        results = asyncio.run(run())
+    finally:
+        pool.close()
+
+    assert [result["slept"] for result in results] == [0.2, 0.21, 0.22, 0.23, 0.24]
+    # Un worker: el lote ocupa un lugar y deja la cola para los /scan sueltos
+    assert max(seen) == 1
+    assert pool.pending == 0
+
+
+def test_timeout_of_a_running_job_replaces_the_pool(monkeypatch):
+    pool = make_pool(monkeypatch, stuck_job, timeout_seconds=0.5)
+    processes = []
+
+    async def run():
+        task = asyncio.create_task(pool.run(b"x"))
+        while not processes:
+            if pool._pool is not None:
+                processes.extend((pool._pool._processes or {}).values())
+            await asyncio.sleep(0.05)
+        with pytest.raises(OcrTimeout):
+            await task
+
+    asyncio.run(run())
+
+    # El job corría: el pool se descartó y sus procesos se mataron
+    assert pool.timeouts == 1
+    assert pool._pool is None
+    assert wait_until(lambda: not any(process.is_alive() for process in processes))
+
+
+def test_timed_out_job_is_released_when_the_worker_future_completes(monkeypatch):
+    pool = make_pool(monkeypatch, stuck_job, timeout_seconds=0.5)
+
+    async def run():
+        with pytest.raises(OcrTimeout):
+            await pool.run(b"x")
+        # Hasta que el worker muere (BrokenProcessPool) el job sigue contando
+        for _ in range(200):
+            if pool.pending == 0:
+                break
+            await asyncio.sleep(0.05)
+
+    asyncio.run(run())
+    assert pool.pending == 0
+
+
+def test_time_in_the_queue_does_not_count_against_the_timeout(monkeypatch):
+    pool = make_pool(monkeypatch, nap_job, timeout_seconds=1.0)
+
+    async def run():
+        # Un solo worker: el segundo espera ~0.7 s y corre otros ~0.7 s
+        return await asyncio.gather(pool.run(b"0.7"), pool.run(b"0.7"))
+
+    try:
+        results = asyncio.run(run())
+    finally:
+        pool.close()
+
+    assert [result["slept"] for result in results] == [0.7, 0.7]
+    assert pool.timeouts == 0
+    assert pool.wait.as_dict()["max_ms"] >= 500
+
+
+def test_latency_stats_p95_over_the_window():
+    stats = LatencyStats(window=20)
+    for elapsed in range(1, 101):
+        stats.record(float(elapsed))
+
+    snapshot = stats.as_dict()
+    assert snapshot["count"] == 100
+    assert snapshot["max_ms"] == 100.0
+    assert snapshot["avg_ms"] == 50.5
+    assert snapshot["p95_ms"] == 100.0
@@ -0,0 +1,93 @@
+import asyncio
+import json
+import numpy as np
+import pytest
+from src.services.item_matrix import ItemMatrix
+from src.services.opportunities import OpportunityTable, ServerOpportunities
+from src.services.price_snapshot import price_snapshots
+from src.services.profit import ItemProfile, evaluate_profile
+
+
+def effect(name, low, high):
+    return {"type": {"name": name, "is_active": False}, "int_minimum": low, "int_maximum": high}
+
+
+def item(ankama_id, level, effects, recipe):
+    return {
+        "ankama_id": ankama_id,
+        "name": f"Item {ankama_id}",
+        "level": level,
+        "type": {"name": "Anillo"},
+        "effects": effects,
+        "recipe": [{"item_ankama_id": ing, "quantity": qty} for ing, qty in recipe],
+    }
+
+
+ITEMS = [
+    item(1, 200, [effect("Fuerza", 40, 50), effect("Vitalidad", 200, 300)], [(100, 2), (101, 1)]),
+    item(2, 150, [effect("Vitalidad", 100, 150)], [(101, 3)]),
+    item(3, 80, [effect("Fuerza", 10, 20), effect("Pods", 300, 400)], [(100, 1), (102, 5)]),
+    item(4, 60, [effect("Fuerza", 5, 5)], [(102, 1)]),
+]
+ING_PRICES = {100: 1500, 101: 300, 102: -1}
+RUNE_PRICES = {"Runa Fo": 40, "Runa Vi": 12, "Runa Pod": 25}
+
+
+@pytest.fixture
+def matrix():
+    profiles = [ItemProfile(i) for i in ITEMS]
+    return ItemMatrix(profiles, ["anillo"] * len(profiles), [False] * len(profiles))
+
+
+def test_matrix_matches_evaluate_profile(matrix):
+    table = ServerOpportunities("Dakal", matrix, ING_PRICES, RUNE_PRICES, {})
+    for row, raw in enumerate(ITEMS):
+        expected = evaluate_profile(ItemProfile(raw), ING_PRICES, RUNE_PRICES)
+        assert bool(table.valid[row]) == (expected is not None)
+        if expected is not None:
+            assert (table.craft_cost[row], table.value_at_100[row]) == pytest.approx(expected)
+
+
+def test_price_changes_match_a_rebuild(matrix):
+    opportunities = OpportunityTable()
+    opportunities._servers["Dakal"] = ServerOpportunities("Dakal", matrix, ING_PRICES, RUNE_PRICES, {1: 120.0})
+
+    opportunities.apply_price_changes("Dakal", {"Runa Vi": 20}, {101: 450, 102: 10})
+    rebuilt = ServerOpportunities(
+        "Dakal", matrix, {**ING_PRICES, 101: 450, 102: 10}, {**RUNE_PRICES, "Runa Vi": 20}, {1: 120.0}
+    )
+    table = opportunities._servers["Dakal"]
+    np.testing.assert_array_equal(table.valid, rebuilt.valid)
+    np.testing.assert_allclose(table.profit, rebuilt.profit)
+    np.testing.assert_allclose(table.min_coefficient, rebuilt.min_coefficient)
+
+
+def test_unknown_changes_drop_the_server(matrix):
+    opportunities = OpportunityTable()
+    opportunities._servers["Dakal"] = ServerOpportunities("Dakal", matrix, ING_PRICES, RUNE_PRICES, {})
+    opportunities.apply_price_changes("Dakal", None, None)
+    assert "Dakal" not in opportunities._servers
+
+
+def test_coefficient_notification_updates_the_row(matrix):
+    opportunities = OpportunityTable()
+    opportunities._servers["Dakal"] = ServerOpportunities("Dakal", matrix, ING_PRICES, RUNE_PRICES, {})
+    table = opportunities._servers["Dakal"]
+    before = table.profit[1]
+
+    # Lo que llega por LISTEN cuando otro worker guarda un coeficiente
+    payload = json.dumps({"kind": "coefficient", "server": "Dakal", "item_id": 2, "coefficient": 250.0})
+    asyncio.run(price_snapshots._on_notify(payload))
+
+    assert table.coef[1] == 250.0
+    assert table.measured[1]
+    assert table.profit[1] > before
+    rebuilt = ServerOpportunities("Dakal", matrix, ING_PRICES, RUNE_PRICES, {2: 250.0})
+    assert table.profit[1] == pytest.approx(rebuilt.profit[1])
+
+
+def test_coefficient_for_another_server_is_ignored(matrix):
+    opportunities = OpportunityTable()
+    opportunities._servers["Dakal"] = ServerOpportunities("Dakal", matrix, ING_PRICES, RUNE_PRICES, {})
+    price_snapshots.apply_coefficient("Draconiros", 2, 250.0)
+    assert opportunities._servers["Dakal"].coef[1] == 100.0
@@ -0,0 +1,90 @@
+import asyncio
+from src.services.prediction_ingest import QueueFull, Submission, SubmissionDebouncer
+
+
+class Collector:
+    def __init__(self, full: bool = False):
+        self.submitted = []
+        self.full = full
+
+    def submit(self, submission):
+        if self.full:
+            raise QueueFull()
+        self.submitted.append(submission)
+
+
+def submission(item_id=1, coefficient=100.0, server="Dakal"):
+    return Submission(item_id=item_id, server=server, lang="es", coefficient=coefficient, craft_cost=1000,
+                      rune_value=1500, profit=500, saved=False)
+
+
+def debouncer(ingest, quiet=0.05, max_hold=1.0, max_pending=100):
+    return SubmissionDebouncer(ingest, quiet_seconds=quiet, max_hold_seconds=max_hold, max_pending=max_pending)
+
+
+def test_only_the_last_value_per_key_is_emitted():
+    async def run():
+        ingest = Collector()
+        d = debouncer(ingest)
+        for coefficient in (101, 102, 103):
+            d.submit("1.2.3.4", submission(coefficient=coefficient))
+            await asyncio.sleep(0.01)
+        d.submit("5.6.7.8", submission(coefficient=200))
+        await asyncio.sleep(0.15)
+        return ingest, d
+
+    ingest, d = asyncio.run(run())
+    assert sorted(s.coefficient for s in ingest.submitted) == [103, 200]
+    assert d.snapshot() == {"pending": 0, "received": 4, "collapsed": 2, "emitted": 2, "dropped": 0}
+
+
+def test_a_key_that_keeps_changing_is_emitted_after_max_hold():
+    async def run():
+        ingest = Collector()
+        d = debouncer(ingest, quiet=0.05, max_hold=0.12)
+        for coefficient in range(10):
+            d.submit("client", submission(coefficient=coefficient))
+            await asyncio.sleep(0.03)
+        return ingest
+
+    ingest = asyncio.run(run())
+    # Sin el tope nada saldría: el valor cambia cada 30 ms con una ventana de 50 ms
+    assert ingest.submitted
+    assert len(ingest.submitted) < 10
+
+
+def test_oldest_key_is_emitted_early_past_max_pending():
+    async def run():
+        ingest = Collector()
+        d = debouncer(ingest, quiet=10.0, max_pending=2)
+        for item_id in (1, 2, 3):
+            d.submit("client", submission(item_id=item_id))
+        emitted = [s.item_id for s in ingest.submitted]
+        d.flush()
+        return emitted, [s.item_id for s in ingest.submitted]
+
+    emitted_early, after_flush = asyncio.run(run())
+    assert emitted_early == [1]
+    assert after_flush == [1, 2, 3]
+
+
+def test_discard_drops_the_pending_value():
+    async def run():
+        ingest = Collector()
+        d = debouncer(ingest)
+        d.submit("client", submission(item_id=7))
+        d.discard("client", 7, "Dakal")
+        await asyncio.sleep(0.1)
+        return ingest
+
+    assert asyncio.run(run()).submitted == []
+
+
+def test_full_queue_counts_as_dropped():
+    async def run():
+        d = debouncer(Collector(full=True))
+        d.submit("client", submission())
+        d.flush()
+        return d
+
+    assert asyncio.run(run()).dropped == 1
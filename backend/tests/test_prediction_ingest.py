@@ -0,0 +1,84 @@
+import asyncio
+import pytest
+from src.services.prediction_ingest import PredictionIngest, QueueFull, Submission
+
+
+def submission(item_id):
+    return Submission(item_id=item_id, server="Dakal", lang="es", coefficient=100.0, craft_cost=1000,
+                      rune_value=1500, profit=500, saved=True)
+
+
+def ingest(monkeypatch, batch_size=10, batch_wait_ms=5000, max_queue=100, write=None):
+    queue = PredictionIngest(max_queue=max_queue, batch_size=batch_size, batch_wait_ms=batch_wait_ms,
+                             meta_cache_entries=10)
+    written = []
+
+    async def write_batch(batch):
+        if write is not None:
+            await write(batch)
+        written.append([s.item_id for s in batch])
+
+    monkeypatch.setattr(queue, "_write_batch", write_batch)
+    return queue, written
+
+
+def test_close_writes_the_batch_being_filled(monkeypatch):
+    async def run():
+        queue, written = ingest(monkeypatch)
+        queue.start()
+        for item_id in (1, 2, 3):
+            queue.submit(submission(item_id))
+        # El consumidor ya los sacó de la cola y espera a llenar el lote
+        while queue._queue.qsize():
+            await asyncio.sleep(0.01)
+        await queue.close()
+        return written
+
+    assert asyncio.run(run()) == [[1, 2, 3]]
+
+
+def test_close_writes_the_batch_being_written_and_the_queue(monkeypatch):
+    calls = []
+
+    async def slow(batch):
+        calls.append(batch)
+        if len(calls) == 1:
+            await asyncio.sleep(60)
+
+    async def run():
+        queue, written = ingest(monkeypatch, batch_size=2, write=slow)
+        queue.start()
+        for item_id in (1, 2, 3, 4, 5):
+            queue.submit(submission(item_id))
+        while queue._queue.qsize() > 3:
+            await asyncio.sleep(0.01)
+        await queue.close()
+        return written
+
+    # [1, 2] se cortó a mitad de escritura: va primero en el flush
+    assert asyncio.run(run()) == [[1, 2], [3, 4], [5]]
+
+
+def test_batches_leave_full_or_after_the_wait(monkeypatch):
+    async def run():
+        queue, written = ingest(monkeypatch, batch_size=2, batch_wait_ms=20)
+        queue.start()
+        for item_id in (1, 2, 3):
+            queue.submit(submission(item_id))
+        await asyncio.sleep(0.1)
+        await queue.close()
+        return written
+
+    assert asyncio.run(run()) == [[1, 2], [3]]
+
+
+def test_submit_rejects_when_the_queue_is_full(monkeypatch):
+    async def run():
+        queue, _ = ingest(monkeypatch, max_queue=1)
+        queue.submit(submission(1))
+        with pytest.raises(QueueFull):
+            queue.submit(submission(2))
+        return queue.snapshot()
+
+    snapshot = asyncio.run(run())
+    assert snapshot["accepted"] == 1 and snapshot["rejected"] == 1
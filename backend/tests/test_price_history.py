@@ -0,0 +1,71 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+import pytest
+from src.services import price_history as history_module
+from src.services.price_history import DAY, HOUR, RAW, PriceHistory, _merge
+from tests.conftest import FakeResult, FakeSession
+
+NOW = datetime(2026, 3, 15, 12, 34, 56, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def history():
+    return PriceHistory(raw_days=7, hourly_days=90, compact_minutes=60, max_points=500)
+
+
+def test_cutoffs_align_to_bucket_starts(history):
+    assert history.raw_cutoff(NOW) == datetime(2026, 3, 8, 12, tzinfo=timezone.utc)
+    assert history.hourly_cutoff(NOW) == datetime(2025, 12, 15, tzinfo=timezone.utc)
+
+
+def test_pick_resolution(history):
+    assert history.pick_resolution(NOW - timedelta(hours=6), NOW, NOW) == RAW
+    assert history.pick_resolution(NOW - timedelta(days=10), NOW, NOW) == HOUR
+    # Dentro del rango horario pero más de max_points horas
+    assert history.pick_resolution(NOW - timedelta(days=30), NOW, NOW) == DAY
+    assert history.pick_resolution(NOW - timedelta(days=200), NOW - timedelta(days=199), NOW) == DAY
+
+
+def test_merge_folds_coarse_then_fine_sources():
+    t = datetime(2026, 3, 1, tzinfo=timezone.utc)
+    buckets = {}
+    _merge(buckets, [(t, 100, 140, 90, 120, 5)])   # rollups guardados
+    _merge(buckets, [(t, 130, 160, 80, 110, 2)])   # puntos crudos del mismo bucket
+    assert buckets[t] == [100, 160, 80, 110, 7]
+
+
+def compaction_db(locked: bool) -> FakeSession:
+    def respond(statement, compiled):
+        if "pg_try_advisory_xact_lock" in str(compiled):
+            return FakeResult(scalar=locked)
+        return FakeResult(rowcount=3)
+    return FakeSession(respond)
+
+
+def test_compaction_is_skipped_without_the_lock(monkeypatch, history):
+    db = compaction_db(locked=False)
+    monkeypatch.setattr(history_module, "AsyncSessionLocal", lambda: db)
+
+    assert asyncio.run(history.compact()) == {"skipped": "another worker is compacting"}
+    assert not any(s.startswith(("INSERT", "DELETE")) for s in db.sql())
+    assert db.commits == 0
+
+
+def test_compaction_rolls_up_and_deletes_in_one_transaction(monkeypatch, history):
+    db = compaction_db(locked=True)
+    monkeypatch.setattr(history_module, "AsyncSessionLocal", lambda: db)
+
+    counts = asyncio.run(history.compact())
+
+    assert counts == {"rune_raw": 3, "ingredient_raw": 3, "hourly": 3}
+    sql = db.sql()
+    rollups = [s for s in sql if s.startswith("INSERT INTO price_rollups")]
+    assert len(rollups) == 3
+    assert all("greatest(price_rollups.high, excluded.high)" in s for s in rollups)
+    assert all("least(price_rollups.low, excluded.low)" in s for s in rollups)
+    deletes = [s for s in sql if s.startswith("DELETE")]
+    assert [d.split()[2] for d in deletes] == ["rune_price_history", "ingredient_price_history", "price_rollups"]
+    # Cada DELETE va después del INSERT que guardó sus datos
+    for table, delete in zip(["rune_price_history", "ingredient_price_history", "price_rollups"], deletes):
+        assert sql.index(delete) > next(i for i, s in enumerate(sql) if s.startswith("INSERT") and f"FROM {table}" in s)
+    assert db.commits == 1
@@ -0,0 +1,110 @@
+import asyncio
+from datetime import datetime, timezone
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from src.api import prices_routes
+from src.db.database import get_db
+from src.services import price_snapshot
+from src.services.price_snapshot import PriceSnapshot, PriceSnapshotCache
+from tests.conftest import FakeResult, FakeSession
+
+WRITTEN_AT = datetime(2026, 3, 1, 12, 0, tzinfo=timezone.utc)
+
+
+class DroppingConnection:
+    """LISTEN connection whose keepalive fails: the server went away."""
+
+    def __init__(self):
+        self.closed = False
+
+    async def add_listener(self, channel, callback):
+        pass
+
+    async def fetchval(self, query):
+        raise ConnectionResetError("connection lost")
+
+    def is_closed(self):
+        return self.closed
+
+    async def close(self):
+        self.closed = True
+
+
+def test_lost_listen_connection_invalidates_every_dependent_cache(monkeypatch):
+    connection = DroppingConnection()
+
+    async def connect(dsn):
+        return connection
+
+    monkeypatch.setattr(price_snapshot.asyncpg, "connect", connect)
+    cache = PriceSnapshotCache("postgresql://unused", reconnect_seconds=60, keepalive_seconds=0)
+    published = []
+    cache.on_change(lambda server, runes, ingredients: published.append((server, runes, ingredients)))
+
+    async def run():
+        task = asyncio.create_task(cache.listen())
+        while not connection.closed:
+            await asyncio.sleep(0.01)
+        cache_state = (cache.listening, dict(cache._snapshots))
+        task.cancel()
+        return cache_state
+
+    cache._snapshots["Dakal"] = PriceSnapshot("Dakal", 3, {}, {})
+    listening, snapshots = asyncio.run(run())
+
+    assert not listening and not snapshots
+    # Uno al conectar (lo construido sin escuchar) y otro al perder la conexión
+    assert published == [(None, None, None), (None, None, None)]
+
+
+def price_tables(statement, compiled):
+    sql = str(compiled)
+    if "price_set_versions" in sql:
+        return FakeResult(scalar=7)
+    if "ingredient_prices" in sql:
+        return FakeResult(rows=[(100, 1500, WRITTEN_AT), (101, 0, None)])
+    return FakeResult(rows=[("Runa Fo", 40)])
+
+
+def test_load_keeps_when_each_ingredient_was_written():
+    cache = PriceSnapshotCache("postgresql://unused")
+    snapshot = asyncio.run(cache._load(FakeSession(price_tables), "Dakal"))
+
+    assert snapshot.version == 7
+    assert dict(snapshot.ing_prices) == {100: 1500, 101: 0}
+    assert dict(snapshot.ing_updated) == {100: WRITTEN_AT, 101: None}
+    assert dict(snapshot.rune_prices) == {"Runa Fo": 40}
+
+
+def test_local_changes_stamp_only_the_changed_ingredients():
+    snapshot = PriceSnapshot("Dakal", 7, {}, {100: 1500, 101: 0}, {100: WRITTEN_AT, 101: None})
+    changed = snapshot.with_changes(8, {}, {101: 300})
+
+    assert changed.ing_updated[100] == WRITTEN_AT
+    assert changed.ing_updated[101] > WRITTEN_AT
+    assert changed.ing_prices[101] == 300
+
+
+def test_ingredient_prices_route_reads_the_snapshot(monkeypatch):
+    snapshot = PriceSnapshot("Dakal", 7, {}, {100: 1500, 101: 0}, {100: WRITTEN_AT})
+    servers = []
+
+    async def get(db, server):
+        servers.append(server)
+        return snapshot
+
+    async def no_db():
+        yield None
+
+    monkeypatch.setattr(prices_routes.price_snapshots, "get", get)
+    app = FastAPI()
+    app.include_router(prices_routes.router)
+    app.dependency_overrides[get_db] = no_db
+
+    response = TestClient(app).get("/prices/ingredients", params={"server": "Draconiros"})
+    assert response.status_code == 200
+    assert response.json() == {
+        "100": {"price": 1500, "updated_at": "2026-03-01T12:00:00Z"},
+        "101": {"price": 0, "updated_at": None},
+    }
+    assert servers == ["Draconiros"]
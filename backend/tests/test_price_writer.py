@@ -0,0 +1,82 @@
+import asyncio
+import pytest
+from src.services import price_writer
+from src.services.price_snapshot import price_snapshots
+from tests.conftest import FakeResult, FakeSession
+
+
+def rune_table(stored: dict, version: int = 7):
+    """Answers like Postgres would: the upsert returns only rows whose price changed."""
+    def respond(statement, compiled):
+        sql = str(compiled)
+        if sql.startswith("INSERT INTO rune_prices"):
+            params = compiled.params
+            rows = []
+            for i in range(len([k for k in params if k.startswith("rune_name_m")])):
+                name, price = params[f"rune_name_m{i}"], params[f"price_m{i}"]
+                if stored.get(name) != price:
+                    stored[name] = price
+                    rows.append({"rune_name": name, "price": price})
+            return FakeResult(rows)
+        if sql.startswith("INSERT INTO price_set_versions"):
+            return FakeResult(scalar=version + 1)
+        if "FROM price_set_versions" in sql:
+            return FakeResult(scalar=version)
+        return FakeResult()
+    return respond
+
+
+@pytest.fixture
+def applied(monkeypatch):
+    calls = []
+    monkeypatch.setattr(price_snapshots, "apply", lambda server, version, **changes: calls.append((server, version, changes)))
+    return calls
+
+
+def test_rune_upsert_batches_and_returns_only_changes(monkeypatch, applied):
+    monkeypatch.setattr(price_writer.env_settings, "price_upsert_batch_size", 2)
+    stored = {"Runa Fo": 40, "Runa Vi": 12}
+    db = FakeSession(rune_table(stored))
+    prices = {"Runa Fo": 40, "Runa Vi": 15, "Runa Ine": 300, "Runa Age": 90, "Runa Pa": 8000}
+
+    changed, version = asyncio.run(price_writer.upsert_rune_prices(db, "Dakal", prices))
+
+    assert changed == {"Runa Vi": 15, "Runa Ine": 300, "Runa Age": 90, "Runa Pa": 8000}
+    assert version == 8
+    sql = db.sql()
+    upserts = [s for s in sql if s.startswith("INSERT INTO rune_prices")]
+    assert len(upserts) == 3
+    assert all("ON CONFLICT (rune_name, server) DO UPDATE" in s and "IS DISTINCT FROM" in s for s in upserts)
+    assert sum(s.startswith("INSERT INTO rune_price_history") for s in sql) == 1
+    assert any("pg_notify" in s for s in sql)
+    assert db.commits == 1
+    assert applied == [("Dakal", 8, {"runes": changed})]
+
+
+def test_unchanged_prices_do_not_bump_the_version(applied):
+    db = FakeSession(rune_table({"Runa Fo": 40}))
+
+    changed, version = asyncio.run(price_writer.upsert_rune_prices(db, "Dakal", {"Runa Fo": 40}))
+
+    assert changed == {}
+    assert version == 7
+    sql = db.sql()
+    assert not any(s.startswith("INSERT INTO rune_price_history") for s in sql)
+    assert not any(s.startswith("INSERT INTO price_set_versions") or "pg_notify" in s for s in sql)
+    assert applied == [("Dakal", 7, {"runes": {}})]
+
+
+def test_ingredient_upsert_keeps_stored_name(applied):
+    def respond(statement, compiled):
+        if str(compiled).startswith("INSERT INTO ingredient_prices"):
+            return FakeResult([{"item_id": 100, "price": 1500}])
+        return FakeResult(scalar=3)
+
+    db = FakeSession(respond)
+    changed, version = asyncio.run(price_writer.upsert_ingredient_prices(db, "Dakal", {100: (1500, None)}))
+
+    upsert = db.sql()[0]
+    assert "ON CONFLICT (item_id, server) DO UPDATE" in upsert
+    assert "coalesce(excluded.name, ingredient_prices.name)" in upsert
+    assert changed == {100: 1500}
+    assert applied == [("Dakal", 3, {"ingredients": {100: 1500}})]
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+from src.services.profit import decode_cursor, encode_cursor, select_page, select_page_arrays
+
+
+def candidates(values, item_ids, mask):
+    return [(float(values[i]), int(item_ids[i]), i) for i in np.flatnonzero(mask)]
+
+
+@pytest.fixture
+def arrays():
+    rng = np.random.default_rng(7)
+    n = 500
+    # Pocos valores distintos: muchos empates, también en el borde de cada página
+    values = rng.integers(-5, 6, n).astype(np.float64) * 1000
+    item_ids = rng.permutation(np.arange(10_000, 10_000 + n))
+    mask = rng.random(n) < 0.8
+    return values, item_ids, mask
+
+
+@pytest.mark.parametrize("sort_order", ["asc", "desc"])
+@pytest.mark.parametrize("page,limit", [(1, 1), (1, 20), (3, 20), (7, 50), (40, 20)])
+def test_arrays_match_heap_pages(arrays, sort_order, page, limit):
+    values, item_ids, mask = arrays
+    expected, expected_total, expected_cursor = select_page(
+        candidates(values, item_ids, mask), "profit", sort_order, page, limit
+    )
+    selected, total, next_cursor = select_page_arrays(values, item_ids, mask, "profit", sort_order, page, limit)
+
+    assert list(selected) == expected
+    assert total == expected_total
+    assert next_cursor == expected_cursor
+
+
+@pytest.mark.parametrize("sort_order", ["asc", "desc"])
+def test_cursor_walk_matches_heap(arrays, sort_order):
+    values, item_ids, mask = arrays
+    seen, cursor, cursor_heap = [], None, None
+    while True:
+        selected, _, cursor = select_page_arrays(values, item_ids, mask, "risk", sort_order, 1, 37, cursor)
+        expected, _, cursor_heap = select_page(candidates(values, item_ids, mask), "risk", sort_order, 1, 37, cursor_heap)
+        assert list(selected) == expected
+        assert cursor == cursor_heap
+        seen.extend(selected)
+        if cursor is None:
+            break
+
+    # Cada fila aparece una sola vez y el recorrido es el orden completo
+    rows = np.flatnonzero(mask)
+    rank = -values[rows] if sort_order == "desc" else values[rows]
+    assert seen == list(rows[np.lexsort((item_ids[rows], rank))])
+
+
+def test_cursor_round_trip_and_mismatch():
+    cursor = encode_cursor(12.5, 42, "profit", "desc")
+    assert decode_cursor(cursor, "profit", "desc") == (12.5, 42)
+    with pytest.raises(ValueError):
+        decode_cursor(cursor, "risk", "desc")
+    with pytest.raises(ValueError):
+        decode_cursor("not-a-cursor", "profit", "desc")
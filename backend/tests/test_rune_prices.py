@@ -0,0 +1,67 @@
+import asyncio
+import pytest
+from src.services.price_snapshot import price_snapshots
+from src.services.rune_prices import RunePriceSnapshot, RunePriceSnapshots
+
+
+@pytest.fixture(autouse=True)
+def listening(monkeypatch):
+    monkeypatch.setattr(price_snapshots, "listening", True)
+
+
+def loader(snapshots, during_load=None):
+    loads = []
+
+    async def load(db, server):
+        loads.append(server)
+        if during_load is not None and len(loads) == 1:
+            during_load()
+        return RunePriceSnapshot(server, {"Runa Fo": (len(loads), None, None)})
+
+    snapshots._seeded.add("Dakal")
+    snapshots._load = load
+    return loads
+
+
+def test_snapshot_is_kept_until_invalidated():
+    snapshots = RunePriceSnapshots()
+    loads = loader(snapshots)
+
+    first = asyncio.run(snapshots.get(None, "Dakal"))
+    assert asyncio.run(snapshots.get(None, "Dakal")) is first
+
+    snapshots.invalidate("Dakal")
+    second = asyncio.run(snapshots.get(None, "Dakal"))
+    assert second.rows["Runa Fo"][0] == 2
+    assert second.etag != first.etag
+    assert loads == ["Dakal", "Dakal"]
+
+
+def test_invalidation_during_a_load_is_not_lost():
+    snapshots = RunePriceSnapshots()
+    loads = loader(snapshots, during_load=lambda: snapshots.invalidate("Dakal"))
+
+    # La carga que se cruzó con la escritura se sirve, pero no queda guardada
+    assert asyncio.run(snapshots.get(None, "Dakal")).rows["Runa Fo"][0] == 1
+    assert asyncio.run(snapshots.get(None, "Dakal")).rows["Runa Fo"][0] == 2
+    assert asyncio.run(snapshots.get(None, "Dakal")).rows["Runa Fo"][0] == 2
+    assert len(loads) == 2
+
+
+def test_global_invalidation_during_a_load_is_not_lost():
+    snapshots = RunePriceSnapshots()
+    loads = loader(snapshots, during_load=snapshots.invalidate)
+
+    asyncio.run(snapshots.get(None, "Dakal"))
+    asyncio.run(snapshots.get(None, "Dakal"))
+    assert len(loads) == 2
+
+
+def test_nothing_is_kept_while_not_listening(monkeypatch):
+    monkeypatch.setattr(price_snapshots, "listening", False)
+    snapshots = RunePriceSnapshots()
+    loads = loader(snapshots)
+
+    asyncio.run(snapshots.get(None, "Dakal"))
+    asyncio.run(snapshots.get(None, "Dakal"))
+    assert len(loads) == 2
@@ -0,0 +1,65 @@
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+import pytest
+from src.services.upstream import AdaptiveLimiter, UpstreamClient, parse_retry_after
+from src.settings.config import env_settings
+
+
+def test_parse_retry_after_seconds_and_date():
+    assert parse_retry_after("12") == 12.0
+    assert parse_retry_after("-3") == 0.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("soon") is None
+    in_two_minutes = format_datetime(datetime.now(timezone.utc) + timedelta(minutes=2), usegmt=True)
+    assert parse_retry_after(in_two_minutes) == pytest.approx(120, abs=2)
+
+
+@pytest.mark.parametrize("retry_after", ["86400", "Fri, 31 Dec 2100 23:59:59 GMT"])
+def test_pause_is_clamped(retry_after):
+    client = UpstreamClient()
+    applied = client._pause(parse_retry_after(retry_after))
+
+    limit = env_settings.upstream_max_retry_after_seconds
+    assert applied == limit
+    assert client._paused_until - time.monotonic() <= limit
+
+
+def test_short_pause_is_kept():
+    client = UpstreamClient()
+    assert client._pause(2.5) == 2.5
+
+
+def test_limiter_halves_on_throttle_and_grows_back():
+    limiter = AdaptiveLimiter(initial=8, minimum=1, maximum=16)
+    limiter.on_throttle()
+    assert limiter.limit == 4
+    # Un segundo 429 en la misma ráfaga no vuelve a reducir
+    limiter.on_throttle()
+    assert limiter.limit == 4
+    for _ in range(4):
+        limiter.on_success()
+    assert limiter.limit > 4.9
+
+
+def test_limiter_serves_interactive_lane_first():
+    async def run():
+        limiter = AdaptiveLimiter(initial=1, minimum=1, maximum=1)
+        await limiter.acquire("bulk")
+        order = []
+
+        async def take(lane):
+            await limiter.acquire(lane)
+            order.append(lane)
+            limiter.release()
+
+        bulk = asyncio.create_task(take("bulk"))
+        await asyncio.sleep(0)
+        interactive = asyncio.create_task(take("interactive"))
+        await asyncio.sleep(0)
+        limiter.release()
+        await asyncio.gather(bulk, interactive)
+        return order
+
+    assert asyncio.run(run()) == ["interactive", "bulk"]
@@ -104,6 +104,7 @@ export interface PaginatedProfitResponse {
   page: number;
   size: number;
   total_pages: number;
+  next_cursor?: string | null;
 }
 
 export const getBestProfitItems = async (types: string[], minLevel: number, maxLevel: number, minProfit: number = 0, minCraftCost: number = 0, page: number = 1, limit: number = 10, sortBy: string = 'profit', sortOrder: string = 'desc', lang: string = "es", server: string = "Dakal") => {